@@ -1,19 +1,81 @@
 from __future__ import annotations
 
+import json
 import sqlite3
+import threading
+import time
+import weakref
+from contextlib import contextmanager
 from pathlib import Path
-from typing import Any
+from typing import Any, Iterator
 
-from .config import CACHE_DB
+from .config import (
+    CACHE_DB,
+    CACHE_DB_CACHE_SIZE_KB,
+    CACHE_DB_CACHED_STATEMENTS,
+    CACHE_DB_MMAP_SIZE,
+)
 
 
-def _connect() -> sqlite3.Connection:
+class _Connection(sqlite3.Connection):
+    # Subclassed only to make connections weak-referenceable.
+    pass
+
+
+_local = threading.local()
+_connections_lock = threading.Lock()
+# Weak so that connections of threadpool workers that exit are released with them.
+_connections: weakref.WeakSet[_Connection] = weakref.WeakSet()
+_generation = 0
+_fts_enabled = False
+
+# The trigram tokenizer cannot match fewer than three characters.
+FTS_MIN_QUERY_LENGTH = 3
+
+
+def _open_connection() -> sqlite3.Connection:
     CACHE_DB.parent.mkdir(parents=True, exist_ok=True)
-    conn = sqlite3.connect(CACHE_DB)
+    # check_same_thread is off only so close_connections() can close every
+    # connection at shutdown; each thread still uses its own connection.
+    conn = sqlite3.connect(
+        CACHE_DB,
+        check_same_thread=False,
+        cached_statements=CACHE_DB_CACHED_STATEMENTS,
+        factory=_Connection,
+    )
     conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute(f"PRAGMA mmap_size={int(CACHE_DB_MMAP_SIZE)}")
+    conn.execute(f"PRAGMA cache_size=-{int(CACHE_DB_CACHE_SIZE_KB)}")
+    return conn
+
+
+def _connect() -> sqlite3.Connection:
+    conn = getattr(_local, "conn", None)
+    if conn is not None and getattr(_local, "generation", None) == _generation:
+        return conn
+    conn = _open_connection()
+    with _connections_lock:
+        _connections.add(conn)
+        _local.conn = conn
+        _local.generation = _generation
     return conn
 
 
+def close_connections() -> None:
+    global _generation
+    with _connections_lock:
+        _generation += 1
+        connections = list(_connections)
+        _connections.clear()
+    for conn in connections:
+        try:
+            conn.close()
+        except sqlite3.Error:
+            pass
+
+
 def init_db() -> None:
     conn = _connect()
     with conn:
@@ -37,45 +99,257 @@ def init_db() -> None:
             )
             """
         )
-    conn.close()
-
-
-def upsert_targets(endpoint_name: str, items: list[dict[str, Any]]) -> int:
-    conn = _connect()
-    with conn:
-        conn.executemany(
+        meta_columns = {row["name"] for row in conn.execute("PRAGMA table_info(meta)")}
+        for column in ("target_count", "inserted", "updated", "removed", "version"):
+            if column not in meta_columns:
+                conn.execute(f"ALTER TABLE meta ADD COLUMN {column} INTEGER")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_targets_endpoint_name ON targets(endpoint_name, name)")
+        conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS target_properties (
+                endpoint_name TEXT NOT NULL,
+                target_id TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                fetched_at REAL NOT NULL,
+                PRIMARY KEY (endpoint_name, target_id)
+            )
             """
-            INSERT INTO targets (endpoint_name, target_id, name, type, display_name)
-            VALUES (?, ?, ?, ?, ?)
-            ON CONFLICT(endpoint_name, target_id) DO UPDATE SET
-                name=excluded.name,
-                type=excluded.type,
-                display_name=excluded.display_name
-            """,
-            [
-                (
-                    endpoint_name,
-                    item.get("id"),
-                    item.get("name"),
-                    item.get("typeName"),
-                    item.get("displayName"),
-                )
-                for item in items
-            ],
         )
         conn.execute(
-            "INSERT OR REPLACE INTO meta(endpoint_name, last_refresh) VALUES (?, datetime('now'))",
-            (endpoint_name,),
+            """
+            CREATE TABLE IF NOT EXISTS metric_catalogs (
+                endpoint_name TEXT NOT NULL,
+                target_type TEXT NOT NULL,
+                target_id TEXT NOT NULL DEFAULT '',
+                payload TEXT NOT NULL,
+                fetched_at REAL NOT NULL,
+                PRIMARY KEY (endpoint_name, target_type, target_id)
+            )
+            """
+        )
+        conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS refresh_jobs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                endpoint_name TEXT NOT NULL,
+                status TEXT NOT NULL,
+                pages INTEGER NOT NULL DEFAULT 0,
+                rows INTEGER NOT NULL DEFAULT 0,
+                target_count INTEGER,
+                inserted INTEGER,
+                updated INTEGER,
+                removed INTEGER,
+                error TEXT,
+                started_at TEXT NOT NULL,
+                updated_at TEXT NOT NULL,
+                finished_at TEXT
+            )
+            """
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_refresh_jobs_endpoint ON refresh_jobs(endpoint_name, id)")
+        conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS rate_buckets (
+                bucket_key TEXT PRIMARY KEY,
+                tokens REAL NOT NULL,
+                updated_at REAL NOT NULL
+            )
+            """
+        )
+        bucket_columns = {row["name"] for row in conn.execute("PRAGMA table_info(rate_buckets)")}
+        for column in ("allowed", "denied"):
+            if column not in bucket_columns:
+                conn.execute(f"ALTER TABLE rate_buckets ADD COLUMN {column} INTEGER NOT NULL DEFAULT 0")
+        conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS shared_responses (
+                response_key TEXT PRIMARY KEY,
+                payload TEXT NOT NULL,
+                stored_at REAL NOT NULL
+            )
+            """
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_shared_responses_stored_at ON shared_responses(stored_at)")
+        conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS leases (
+                name TEXT PRIMARY KEY,
+                owner TEXT NOT NULL,
+                expires_at REAL NOT NULL
+            )
+            """
+        )
+        conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS config_revisions (
+                endpoint_name TEXT PRIMARY KEY,
+                revision INTEGER NOT NULL
+            )
+            """
         )
-    conn.close()
-    return len(items)
+    _init_fts(conn)
 
 
-def clear_targets(endpoint_name: str) -> None:
-    conn = _connect()
-    with conn:
-        conn.execute("DELETE FROM targets WHERE endpoint_name = ?", (endpoint_name,))
-    conn.close()
+def _init_fts(conn: sqlite3.Connection) -> None:
+    global _fts_enabled
+    exists = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'targets_fts'"
+    ).fetchone()
+    try:
+        with conn:
+            conn.execute(
+                """
+                CREATE VIRTUAL TABLE IF NOT EXISTS targets_fts USING fts5(
+                    name, display_name,
+                    content='targets', content_rowid='rowid',
+                    tokenize='trigram'
+                )
+                """
+            )
+            conn.execute(
+                """
+                CREATE TRIGGER IF NOT EXISTS targets_fts_ai AFTER INSERT ON targets BEGIN
+                    INSERT INTO targets_fts(rowid, name, display_name)
+                    VALUES (new.rowid, new.name, new.display_name);
+                END
+                """
+            )
+            conn.execute(
+                """
+                CREATE TRIGGER IF NOT EXISTS targets_fts_ad AFTER DELETE ON targets BEGIN
+                    INSERT INTO targets_fts(targets_fts, rowid, name, display_name)
+                    VALUES ('delete', old.rowid, old.name, old.display_name);
+                END
+                """
+            )
+            conn.execute(
+                """
+                CREATE TRIGGER IF NOT EXISTS targets_fts_au AFTER UPDATE OF name, display_name ON targets BEGIN
+                    INSERT INTO targets_fts(targets_fts, rowid, name, display_name)
+                    VALUES ('delete', old.rowid, old.name, old.display_name);
+                    INSERT INTO targets_fts(rowid, name, display_name)
+                    VALUES (new.rowid, new.name, new.display_name);
+                END
+                """
+            )
+            if not exists:
+                conn.execute("INSERT INTO targets_fts(targets_fts) VALUES ('rebuild')")
+    except sqlite3.OperationalError:
+        # SQLite built without FTS5 or the trigram tokenizer (< 3.34): keep LIKE search.
+        _fts_enabled = False
+        return
+    _fts_enabled = True
+
+
+class TargetStaging:
+    def __init__(self, endpoint_name: str) -> None:
+        self.endpoint_name = endpoint_name
+        # Dedicated connection: TEMP tables are private to it, and pages may be
+        # written from different threadpool workers (always one at a time).
+        self._conn = _open_connection()
+        self._conn.execute(
+            """
+            CREATE TEMP TABLE IF NOT EXISTS targets_staging (
+                target_id TEXT PRIMARY KEY,
+                name TEXT NOT NULL,
+                type TEXT NOT NULL,
+                display_name TEXT
+            )
+            """
+        )
+        with self._conn:
+            self._conn.execute("DELETE FROM temp.targets_staging")
+
+    def add(self, items: list[dict[str, Any]]) -> int:
+        with self._conn:
+            self._conn.executemany(
+                """
+                INSERT OR REPLACE INTO temp.targets_staging (target_id, name, type, display_name)
+                VALUES (?, ?, ?, ?)
+                """,
+                [
+                    (
+                        item.get("id"),
+                        item.get("name"),
+                        item.get("typeName"),
+                        item.get("displayName"),
+                    )
+                    for item in items
+                ],
+            )
+        return len(items)
+
+    def apply(self) -> dict[str, int]:
+        conn = self._conn
+        params = (self.endpoint_name,)
+        with conn:
+            removed = conn.execute(
+                """
+                DELETE FROM main.targets
+                WHERE endpoint_name = ?
+                  AND target_id NOT IN (SELECT target_id FROM temp.targets_staging)
+                """,
+                params,
+            ).rowcount
+            updated = conn.execute(
+                """
+                UPDATE main.targets
+                SET (name, type, display_name) = (
+                    SELECT s.name, s.type, s.display_name
+                    FROM temp.targets_staging s
+                    WHERE s.target_id = targets.target_id
+                )
+                WHERE endpoint_name = ?
+                  AND EXISTS (
+                    SELECT 1 FROM temp.targets_staging s
+                    WHERE s.target_id = targets.target_id
+                      AND (s.name IS NOT targets.name
+                           OR s.type IS NOT targets.type
+                           OR s.display_name IS NOT targets.display_name)
+                  )
+                """,
+                params,
+            ).rowcount
+            inserted = conn.execute(
+                """
+                INSERT INTO main.targets (endpoint_name, target_id, name, type, display_name)
+                SELECT ?, s.target_id, s.name, s.type, s.display_name
+                FROM temp.targets_staging s
+                WHERE NOT EXISTS (
+                    SELECT 1 FROM main.targets t
+                    WHERE t.endpoint_name = ? AND t.target_id = s.target_id
+                )
+                """,
+                (self.endpoint_name, self.endpoint_name),
+            ).rowcount
+            conn.execute(
+                """
+                DELETE FROM main.target_properties
+                WHERE endpoint_name = ?
+                  AND target_id NOT IN (SELECT target_id FROM temp.targets_staging)
+                """,
+                params,
+            )
+            total = conn.execute("SELECT COUNT(*) FROM temp.targets_staging").fetchone()[0]
+            conn.execute(
+                """
+                INSERT INTO meta(endpoint_name, last_refresh, target_count, inserted, updated, removed, version)
+                VALUES (?, datetime('now'), ?, ?, ?, ?, 1)
+                ON CONFLICT(endpoint_name) DO UPDATE SET
+                    last_refresh=excluded.last_refresh,
+                    target_count=excluded.target_count,
+                    inserted=excluded.inserted,
+                    updated=excluded.updated,
+                    removed=excluded.removed,
+                    version=COALESCE(meta.version, 0) + ?
+                """,
+                (self.endpoint_name, total, inserted, updated, removed, 1 if inserted or updated or removed else 0),
+            )
+            conn.execute("DELETE FROM temp.targets_staging")
+        return {"count": total, "inserted": inserted, "updated": updated, "removed": removed}
+
+    def close(self) -> None:
+        self._conn.close()
 
 
 def get_target_by_id(endpoint_name: str, target_id: str) -> dict[str, Any] | None:
@@ -84,7 +358,6 @@ def get_target_by_id(endpoint_name: str, target_id: str) -> dict[str, Any] | Non
         "SELECT target_id, name, type, display_name FROM targets WHERE endpoint_name = ? AND target_id = ?",
         (endpoint_name, target_id),
     ).fetchone()
-    conn.close()
     if not row:
         return None
     return {
@@ -95,13 +368,33 @@ def get_target_by_id(endpoint_name: str, target_id: str) -> dict[str, Any] | Non
     }
 
 
+def get_targets_version(endpoint_name: str) -> int:
+    conn = _connect()
+    row = conn.execute(
+        "SELECT version FROM meta WHERE endpoint_name = ?",
+        (endpoint_name,),
+    ).fetchone()
+    return int(row["version"] or 0) if row else 0
+
+
+def get_targets_snapshot(endpoint_name: str) -> tuple[int, list[dict[str, Any]]]:
+    conn = _connect()
+    # One read transaction so the version matches the rows returned.
+    conn.execute("BEGIN")
+    try:
+        version = get_targets_version(endpoint_name)
+        targets = get_all_targets(endpoint_name)
+    finally:
+        conn.commit()
+    return version, targets
+
+
 def get_all_targets(endpoint_name: str) -> list[dict[str, Any]]:
     conn = _connect()
     rows = conn.execute(
         "SELECT target_id, name, type, display_name FROM targets WHERE endpoint_name = ?",
         (endpoint_name,),
     ).fetchall()
-    conn.close()
     return [
         {
             "id": row["target_id"],
@@ -119,20 +412,44 @@ def count_targets(endpoint_name: str) -> int:
         "SELECT COUNT(*) as total FROM targets WHERE endpoint_name = ?",
         (endpoint_name,),
     ).fetchone()
-    conn.close()
     return int(row["total"]) if row else 0
 
 
+def get_refresh_stats(endpoint_name: str) -> dict[str, Any] | None:
+    conn = _connect()
+    row = conn.execute(
+        """
+        SELECT last_refresh, target_count, inserted, updated, removed,
+               (julianday('now') - julianday(last_refresh)) * 86400.0 AS age_seconds
+        FROM meta WHERE endpoint_name = ?
+        """,
+        (endpoint_name,),
+    ).fetchone()
+    if not row:
+        return None
+    return {
+        "lastRefresh": row["last_refresh"],
+        "ageSeconds": row["age_seconds"],
+        "count": row["target_count"],
+        "inserted": row["inserted"],
+        "updated": row["updated"],
+        "removed": row["removed"],
+    }
+
+
 def get_last_refresh(endpoint_name: str) -> str | None:
     conn = _connect()
     row = conn.execute(
         "SELECT last_refresh FROM meta WHERE endpoint_name = ?",
         (endpoint_name,),
     ).fetchone()
-    conn.close()
     return row["last_refresh"] if row else None
 
 
+def _fts_phrase(query: str) -> str:
+    return '"' + query.replace('"', '""') + '"'
+
+
 def search_targets(
     endpoint_name: str,
     query: str | None,
@@ -140,26 +457,44 @@ def search_targets(
     limit: int = 50,
 ) -> list[dict[str, Any]]:
     conn = _connect()
-    params: list[Any] = [endpoint_name]
-    where = ["endpoint_name = ?"]
+    query = (query or "").strip()
+    use_fts = _fts_enabled and len(query) >= FTS_MIN_QUERY_LENGTH
 
-    if query:
-        where.append("LOWER(name) LIKE ?")
-        params.append(f"%{query.lower()}%")
+    if use_fts:
+        params: list[Any] = [_fts_phrase(query), endpoint_name]
+        where = ["targets_fts MATCH ?", "t.endpoint_name = ?"]
+    else:
+        params = [endpoint_name]
+        where = ["t.endpoint_name = ?"]
+        if query:
+            # Same columns as the FTS index, so a longer query never finds fewer targets.
+            where.append("(t.name LIKE ? OR t.display_name LIKE ?)")
+            params.extend([f"%{query}%", f"%{query}%"])
     if type_filters:
         placeholders = ",".join("?" for _ in type_filters)
-        where.append(f"type IN ({placeholders})")
+        where.append(f"t.type IN ({placeholders})")
         params.extend(type_filters)
 
-    sql = (
-        "SELECT target_id, name, type, display_name FROM targets"
-        f" WHERE {' AND '.join(where)}"
-        " ORDER BY name ASC"
-        " LIMIT ?"
-    )
+    if use_fts:
+        # Prefix matches on the name first, then the tightest match (shortest name).
+        # Cheaper than bm25, which adds little for short trigram-indexed names.
+        sql = (
+            "SELECT t.target_id, t.name, t.type, t.display_name"
+            " FROM targets_fts f JOIN targets t ON t.rowid = f.rowid"
+            f" WHERE {' AND '.join(where)}"
+            " ORDER BY CASE WHEN t.name LIKE ? THEN 0 ELSE 1 END, length(t.name), t.name"
+            " LIMIT ?"
+        )
+        params.append(f"{query}%")
+    else:
+        sql = (
+            "SELECT t.target_id, t.name, t.type, t.display_name FROM targets t"
+            f" WHERE {' AND '.join(where)}"
+            " ORDER BY t.name ASC"
+            " LIMIT ?"
+        )
     params.append(limit)
     rows = conn.execute(sql, params).fetchall()
-    conn.close()
 
     return [
         {
@@ -172,11 +507,463 @@ def search_targets(
     ]
 
 
+def get_target_properties(endpoint_name: str, target_id: str, max_age: float) -> dict[str, Any] | None:
+    conn = _connect()
+    row = conn.execute(
+        "SELECT payload FROM target_properties WHERE endpoint_name = ? AND target_id = ? AND fetched_at >= ?",
+        (endpoint_name, target_id, time.time() - max_age),
+    ).fetchone()
+    return json.loads(row["payload"]) if row else None
+
+
+def put_target_properties(endpoint_name: str, target_id: str, payload: dict[str, Any]) -> None:
+    conn = _connect()
+    with conn:
+        conn.execute(
+            """
+            INSERT OR REPLACE INTO target_properties (endpoint_name, target_id, payload, fetched_at)
+            VALUES (?, ?, ?, ?)
+            """,
+            (endpoint_name, target_id, json.dumps(payload), time.time()),
+        )
+
+
+def delete_target_properties(endpoint_name: str, target_id: str | None = None) -> int:
+    conn = _connect()
+    with conn:
+        if target_id:
+            cursor = conn.execute(
+                "DELETE FROM target_properties WHERE endpoint_name = ? AND target_id = ?",
+                (endpoint_name, target_id),
+            )
+        else:
+            cursor = conn.execute("DELETE FROM target_properties WHERE endpoint_name = ?", (endpoint_name,))
+    return cursor.rowcount
+
+
+def get_metric_catalog(
+    endpoint_name: str,
+    target_type: str,
+    target_id: str | None,
+    max_age: float,
+    per_target: bool = False,
+) -> dict[str, Any] | None:
+    # Rows with an empty target_id hold the catalog shared by the type; a row for
+    # the target itself overrides it. per_target ignores the type row.
+    ids = [target_id or ""] if per_target else [target_id or "", ""]
+    conn = _connect()
+    row = conn.execute(
+        f"""
+        SELECT target_id, payload FROM metric_catalogs
+        WHERE endpoint_name = ? AND target_type = ? AND target_id IN ({", ".join("?" for _ in ids)})
+          AND fetched_at >= ?
+        ORDER BY target_id DESC
+        LIMIT 1
+        """,
+        (endpoint_name, target_type, *ids, time.time() - max_age),
+    ).fetchone()
+    if not row:
+        return None
+    payload = json.loads(row["payload"])
+    return payload if row["target_id"] else _without_links(payload)
+
+
+def _without_links(value: Any) -> Any:
+    # links.self.href carries the targetId the catalog was fetched for, which is
+    # wrong for every other target sharing the type catalog.
+    if isinstance(value, dict):
+        return {key: _without_links(item) for key, item in value.items() if key != "links"}
+    if isinstance(value, list):
+        return [_without_links(item) for item in value]
+    return value
+
+
+def _catalog_signature(payload: Any) -> list[Any]:
+    # What makes two catalogs equal: the group names and their metrics' names and
+    # dataTypes. Hrefs, counts and ordering differ between targets of the same type.
+    groups = payload.get("items") if isinstance(payload, dict) else None
+    signature = []
+    for group in groups or []:
+        if not isinstance(group, dict):
+            continue
+        metrics = sorted(
+            (str(metric.get("name")), str(metric.get("dataType")))
+            for metric in group.get("metrics") or []
+            if isinstance(metric, dict)
+        )
+        signature.append((str(group.get("name")), metrics))
+    return sorted(signature)
+
+
+def store_metric_catalog(
+    endpoint_name: str,
+    target_type: str,
+    target_id: str | None,
+    payload: dict[str, Any],
+    max_age: float,
+    per_target: bool = False,
+) -> str:
+    # A target whose groups or metrics differ from a fresh type catalog gets an
+    # override row; otherwise the fetch, minus its links, becomes the type catalog.
+    # Returns which one.
+    # per_target always writes the target's own row.
+    encoded = json.dumps(payload, sort_keys=True)
+    type_encoded = json.dumps(_without_links(payload), sort_keys=True)
+    now = time.time()
+    conn = _connect()
+    with conn:
+        if target_id and per_target:
+            conn.execute(
+                """
+                INSERT OR REPLACE INTO metric_catalogs (endpoint_name, target_type, target_id, payload, fetched_at)
+                VALUES (?, ?, ?, ?, ?)
+                """,
+                (endpoint_name, target_type, target_id, encoded, now),
+            )
+            return "target"
+        row = conn.execute(
+            """
+            SELECT payload, fetched_at FROM metric_catalogs
+            WHERE endpoint_name = ? AND target_type = ? AND target_id = ''
+            """,
+            (endpoint_name, target_type),
+        ).fetchone()
+        type_is_fresh = row is not None and row["fetched_at"] >= now - max_age
+        differs = type_is_fresh and _catalog_signature(json.loads(row["payload"])) != _catalog_signature(payload)
+        if target_id and differs:
+            conn.execute(
+                """
+                INSERT OR REPLACE INTO metric_catalogs (endpoint_name, target_type, target_id, payload, fetched_at)
+                VALUES (?, ?, ?, ?, ?)
+                """,
+                (endpoint_name, target_type, target_id, encoded, now),
+            )
+            return "override"
+        conn.execute(
+            """
+            INSERT OR REPLACE INTO metric_catalogs (endpoint_name, target_type, target_id, payload, fetched_at)
+            VALUES (?, ?, '', ?, ?)
+            """,
+            (endpoint_name, target_type, type_encoded, now),
+        )
+        if target_id:
+            conn.execute(
+                "DELETE FROM metric_catalogs WHERE endpoint_name = ? AND target_type = ? AND target_id = ?",
+                (endpoint_name, target_type, target_id),
+            )
+    return "type"
+
+
+def delete_metric_catalogs(endpoint_name: str, target_type: str | None = None) -> int:
+    conn = _connect()
+    with conn:
+        if target_type:
+            cursor = conn.execute(
+                "DELETE FROM metric_catalogs WHERE endpoint_name = ? AND target_type = ?",
+                (endpoint_name, target_type),
+            )
+        else:
+            cursor = conn.execute("DELETE FROM metric_catalogs WHERE endpoint_name = ?", (endpoint_name,))
+    return cursor.rowcount
+
+
 def list_target_types(endpoint_name: str) -> list[str]:
     conn = _connect()
     rows = conn.execute(
         "SELECT DISTINCT type FROM targets WHERE endpoint_name = ? ORDER BY type ASC",
         (endpoint_name,),
     ).fetchall()
-    conn.close()
     return [row["type"] for row in rows if row["type"]]
+
+
+def _refresh_job_row(row: sqlite3.Row) -> dict[str, Any]:
+    return {
+        "id": row["id"],
+        "endpointName": row["endpoint_name"],
+        "status": row["status"],
+        "pages": row["pages"],
+        "rows": row["rows"],
+        "count": row["target_count"],
+        "inserted": row["inserted"],
+        "updated": row["updated"],
+        "removed": row["removed"],
+        "error": row["error"],
+        "startedAt": row["started_at"],
+        "updatedAt": row["updated_at"],
+        "finishedAt": row["finished_at"],
+    }
+
+
+def create_refresh_job(endpoint_name: str, keep: int) -> int:
+    conn = _connect()
+    with conn:
+        job_id = conn.execute(
+            """
+            INSERT INTO refresh_jobs (endpoint_name, status, started_at, updated_at)
+            VALUES (?, 'running', datetime('now'), datetime('now'))
+            """,
+            (endpoint_name,),
+        ).lastrowid
+        # Only the most recent jobs per endpoint are kept as history.
+        conn.execute(
+            """
+            DELETE FROM refresh_jobs
+            WHERE endpoint_name = ? AND id NOT IN (
+                SELECT id FROM refresh_jobs WHERE endpoint_name = ? ORDER BY id DESC LIMIT ?
+            )
+            """,
+            (endpoint_name, endpoint_name, max(1, keep)),
+        )
+    return int(job_id)
+
+
+def update_refresh_job_progress(job_id: int, pages: int, rows: int) -> None:
+    conn = _connect()
+    with conn:
+        conn.execute(
+            "UPDATE refresh_jobs SET pages = ?, rows = ?, updated_at = datetime('now') WHERE id = ?",
+            (pages, rows, job_id),
+        )
+
+
+def finish_refresh_job(job_id: int, changes: dict[str, int] | None = None, error: str | None = None) -> None:
+    changes = changes or {}
+    conn = _connect()
+    with conn:
+        conn.execute(
+            """
+            UPDATE refresh_jobs
+            SET status = ?, target_count = ?, inserted = ?, updated = ?, removed = ?, error = ?,
+                updated_at = datetime('now'), finished_at = datetime('now')
+            WHERE id = ?
+            """,
+            (
+                "error" if error else "done",
+                changes.get("count"),
+                changes.get("inserted"),
+                changes.get("updated"),
+                changes.get("removed"),
+                error,
+                job_id,
+            ),
+        )
+
+
+def get_refresh_job(job_id: int) -> dict[str, Any] | None:
+    conn = _connect()
+    row = conn.execute("SELECT * FROM refresh_jobs WHERE id = ?", (job_id,)).fetchone()
+    return _refresh_job_row(row) if row else None
+
+
+def get_latest_refresh_job(endpoint_name: str) -> dict[str, Any] | None:
+    conn = _connect()
+    row = conn.execute(
+        "SELECT * FROM refresh_jobs WHERE endpoint_name = ? ORDER BY id DESC LIMIT 1",
+        (endpoint_name,),
+    ).fetchone()
+    return _refresh_job_row(row) if row else None
+
+
+def get_refresh_failures(endpoint_name: str) -> tuple[int, float | None]:
+    # Consecutive failed jobs since the last success, and seconds since the latest one ended.
+    conn = _connect()
+    rows = conn.execute(
+        """
+        SELECT status, (julianday('now') - julianday(finished_at)) * 86400.0 AS age_seconds
+        FROM refresh_jobs
+        WHERE endpoint_name = ? AND status != 'running'
+        ORDER BY id DESC
+        """,
+        (endpoint_name,),
+    ).fetchall()
+    failures = 0
+    for row in rows:
+        if row["status"] != "error":
+            break
+        failures += 1
+    return failures, rows[0]["age_seconds"] if failures else None
+
+
+def get_running_refresh_job(endpoint_name: str) -> dict[str, Any] | None:
+    conn = _connect()
+    row = conn.execute(
+        "SELECT * FROM refresh_jobs WHERE endpoint_name = ? AND status = 'running' ORDER BY id DESC LIMIT 1",
+        (endpoint_name,),
+    ).fetchone()
+    return _refresh_job_row(row) if row else None
+
+
+def fail_stale_refresh_jobs(max_idle_seconds: float) -> int:
+    # A job whose progress stopped long ago belongs to a worker that died mid-refresh.
+    conn = _connect()
+    with conn:
+        cursor = conn.execute(
+            """
+            UPDATE refresh_jobs
+            SET status = 'error', error = 'Refresh interrompido', finished_at = datetime('now')
+            WHERE status = 'running'
+              AND (julianday('now') - julianday(updated_at)) * 86400.0 > ?
+            """,
+            (max_idle_seconds,),
+        )
+    return cursor.rowcount
+
+
+def get_config_revision(endpoint_name: str) -> int:
+    conn = _connect()
+    row = conn.execute(
+        "SELECT revision FROM config_revisions WHERE endpoint_name = ?",
+        (endpoint_name,),
+    ).fetchone()
+    return row["revision"] if row else 0
+
+
+def get_config_revisions() -> dict[str, int]:
+    conn = _connect()
+    return {row["endpoint_name"]: row["revision"] for row in conn.execute("SELECT * FROM config_revisions")}
+
+
+@contextmanager
+def config_revision_transaction(endpoint_names: list[str]) -> Iterator[dict[str, int]]:
+    # Holds the database write lock while the caller rewrites the config, so saves
+    # from any worker are serialized; each listed site's revision is bumped on success.
+    conn = _connect()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        revisions = {name: get_config_revision(name) for name in endpoint_names}
+        yield revisions
+        conn.executemany(
+            """
+            INSERT INTO config_revisions (endpoint_name, revision) VALUES (?, ?)
+            ON CONFLICT(endpoint_name) DO UPDATE SET revision = excluded.revision
+            """,
+            [(name, revision + 1) for name, revision in revisions.items()],
+        )
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+
+
+def consume_shared_tokens(bucket_key: str, tokens: float, capacity: float, refill_rate: float) -> tuple[bool, float]:
+    # Token bucket kept in the database so every worker on the host draws from it.
+    conn = _connect()
+    now = time.time()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        row = conn.execute(
+            "SELECT tokens, updated_at FROM rate_buckets WHERE bucket_key = ?",
+            (bucket_key,),
+        ).fetchone()
+        available = float(capacity)
+        if row:
+            available = min(available, row["tokens"] + max(0.0, now - row["updated_at"]) * refill_rate)
+        allowed = available >= tokens
+        if allowed:
+            available -= tokens
+        conn.execute(
+            """
+            INSERT INTO rate_buckets (bucket_key, tokens, updated_at, allowed, denied) VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT(bucket_key) DO UPDATE SET
+                tokens = excluded.tokens,
+                updated_at = excluded.updated_at,
+                allowed = rate_buckets.allowed + excluded.allowed,
+                denied = rate_buckets.denied + excluded.denied
+            """,
+            (bucket_key, available, now, int(allowed), int(not allowed)),
+        )
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    if allowed:
+        return True, 0.0
+    return False, (tokens - available) / refill_rate
+
+
+def adjust_shared_tokens(bucket_key: str, tokens: float, capacity: float) -> None:
+    conn = _connect()
+    with conn:
+        conn.execute(
+            "UPDATE rate_buckets SET tokens = MAX(?, MIN(?, tokens + ?)) WHERE bucket_key = ?",
+            (-capacity, capacity, tokens, bucket_key),
+        )
+
+
+def prune_shared_tokens(idle_seconds: float) -> int:
+    conn = _connect()
+    with conn:
+        cursor = conn.execute("DELETE FROM rate_buckets WHERE updated_at < ?", (time.time() - idle_seconds,))
+    return cursor.rowcount
+
+
+def count_shared_tokens() -> int:
+    conn = _connect()
+    return conn.execute("SELECT COUNT(*) FROM rate_buckets").fetchone()[0]
+
+
+def top_shared_tokens(limit: int) -> list[dict[str, Any]]:
+    conn = _connect()
+    rows = conn.execute(
+        "SELECT bucket_key, allowed, denied FROM rate_buckets ORDER BY denied DESC, allowed DESC LIMIT ?",
+        (limit,),
+    ).fetchall()
+    return [{"key": row["bucket_key"], "allowed": row["allowed"], "denied": row["denied"]} for row in rows]
+
+
+def get_shared_response(response_key: str, max_age: float) -> tuple[Any, float, int] | None:
+    # Returns (value, age, encoded size in bytes).
+    conn = _connect()
+    row = conn.execute(
+        "SELECT payload, stored_at FROM shared_responses WHERE response_key = ? AND stored_at >= ?",
+        (response_key, time.time() - max_age),
+    ).fetchone()
+    if not row:
+        return None
+    return json.loads(row["payload"]), time.time() - row["stored_at"], len(row["payload"])
+
+
+def put_shared_response(response_key: str, payload: str, max_age: float) -> None:
+    # payload is already JSON-encoded by the caller.
+    conn = _connect()
+    now = time.time()
+    with conn:
+        conn.execute(
+            "INSERT OR REPLACE INTO shared_responses (response_key, payload, stored_at) VALUES (?, ?, ?)",
+            (response_key, payload, now),
+        )
+        conn.execute("DELETE FROM shared_responses WHERE stored_at < ?", (now - max_age,))
+
+
+def acquire_lease(name: str, owner: str, ttl_seconds: float) -> bool:
+    # Taken when free or expired, renewed when already ours.
+    conn = _connect()
+    now = time.time()
+    with conn:
+        conn.execute(
+            """
+            INSERT INTO leases (name, owner, expires_at) VALUES (?, ?, ?)
+            ON CONFLICT(name) DO UPDATE SET owner = excluded.owner, expires_at = excluded.expires_at
+            WHERE leases.owner = excluded.owner OR leases.expires_at < ?
+            """,
+            (name, owner, now + ttl_seconds, now),
+        )
+        row = conn.execute("SELECT owner FROM leases WHERE name = ?", (name,)).fetchone()
+    return bool(row) and row["owner"] == owner
+
+
+def renew_lease(name: str, owner: str, ttl_seconds: float) -> bool:
+    # Only extends a lease we already hold; never takes a free one.
+    conn = _connect()
+    with conn:
+        cursor = conn.execute(
+            "UPDATE leases SET expires_at = ? WHERE name = ? AND owner = ?",
+            (time.time() + ttl_seconds, name, owner),
+        )
+    return cursor.rowcount > 0
+
+
+def release_lease(name: str, owner: str) -> None:
+    conn = _connect()
+    with conn:
+        conn.execute("DELETE FROM leases WHERE name = ? AND owner = ?", (name, owner))
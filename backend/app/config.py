@@ -7,9 +7,59 @@ APP_DIR = Path(__file__).resolve().parent
 BACKEND_DIR = APP_DIR.parent
 CACHE_ROOT = BACKEND_DIR / "conf"
 TARGETS_YAML = CACHE_ROOT / "targets.yaml"
+TARGETS_SITES_DIR = Path(os.getenv("TARGETS_SITES_DIR", str(CACHE_ROOT / "targets.d")))
+# "single" keeps every site in targets.yaml; "sharded" keeps one file per site in TARGETS_SITES_DIR.
+TARGETS_STORAGE_MODE = os.getenv("TARGETS_STORAGE_MODE", "single").strip().lower()
 ENTERPRISE_MANAGERS_FILE = CACHE_ROOT / "enterprise_manager_urls"
 METRICS_YAML = CACHE_ROOT / "metrics.yaml"
 CACHE_DB = BACKEND_DIR / "data" / "oem_cache.db"
+CACHE_DB_MMAP_SIZE = int(os.getenv("CACHE_DB_MMAP_SIZE", str(256 * 1024 * 1024)))
+CACHE_DB_CACHE_SIZE_KB = int(os.getenv("CACHE_DB_CACHE_SIZE_KB", str(64 * 1024)))
+CACHE_DB_CACHED_STATEMENTS = int(os.getenv("CACHE_DB_CACHED_STATEMENTS", "256"))
 OEM_CLIENT_TTL_SECONDS = 300
+OEM_POOL_MAX_CLIENTS = int(os.getenv("OEM_POOL_MAX_CLIENTS", "32"))
+OEM_POOL_MAINTENANCE_SECONDS = float(os.getenv("OEM_POOL_MAINTENANCE_SECONDS", "30"))
+OEM_MAX_PARALLEL_PER_MANAGER = int(os.getenv("OEM_MAX_PARALLEL_PER_MANAGER", "8"))
+OEM_POOL_SIZE = int(os.getenv("OEM_POOL_SIZE", "10"))
+OEM_CONNECT_TIMEOUT_SECONDS = float(os.getenv("OEM_CONNECT_TIMEOUT_SECONDS", "10"))
+OEM_READ_TIMEOUT_SECONDS = float(os.getenv("OEM_READ_TIMEOUT_SECONDS", "60"))
+OEM_KEEPALIVE_SECONDS = float(os.getenv("OEM_KEEPALIVE_SECONDS", "30"))
+OEM_RETRIES = int(os.getenv("OEM_RETRIES", "2"))
+OEM_RETRY_BACKOFF_SECONDS = float(os.getenv("OEM_RETRY_BACKOFF_SECONDS", "0.5"))
+OEM_RETRY_BACKOFF_MAX_SECONDS = float(os.getenv("OEM_RETRY_BACKOFF_MAX_SECONDS", "10"))
+OEM_COMPRESSION = os.getenv("OEM_COMPRESSION", "true").strip().lower() not in {"0", "false", "no", "off"}
+OEM_OUTBOUND_INITIAL_CONCURRENCY = int(os.getenv("OEM_OUTBOUND_INITIAL_CONCURRENCY", "4"))
+OEM_OUTBOUND_MIN_CONCURRENCY = int(os.getenv("OEM_OUTBOUND_MIN_CONCURRENCY", "1"))
+OEM_OUTBOUND_MAX_CONCURRENCY = int(os.getenv("OEM_OUTBOUND_MAX_CONCURRENCY", "32"))
+OEM_OUTBOUND_LATENCY_SPIKE_FACTOR = float(os.getenv("OEM_OUTBOUND_LATENCY_SPIKE_FACTOR", "3"))
+OEM_OUTBOUND_MAX_RETRY_AFTER_SECONDS = float(os.getenv("OEM_OUTBOUND_MAX_RETRY_AFTER_SECONDS", "60"))
 BACKEND_RATE_LIMIT_MAX = int(os.getenv("BACKEND_RATE_LIMIT_MAX", "60"))
 BACKEND_RATE_LIMIT_WINDOW_SECONDS = int(os.getenv("BACKEND_RATE_LIMIT_WINDOW_SECONDS", "60"))
+RATE_LIMIT_MAX_BUCKETS = int(os.getenv("RATE_LIMIT_MAX_BUCKETS", "4096"))
+# Tokens per OEM call on top of the route base weight; a request never costs more than the bucket.
+RATE_LIMIT_OEM_CALL_COST = float(os.getenv("RATE_LIMIT_OEM_CALL_COST", "0.5"))
+RATE_LIMIT_SHARDS = int(os.getenv("RATE_LIMIT_SHARDS", "16"))
+# "memory" keeps rate-limit buckets and response caches per process; "sqlite" shares
+# them through the cache DB between all workers on the host.
+SHARED_STATE_BACKEND = os.getenv("SHARED_STATE_BACKEND", "memory").strip().lower()
+TARGET_REFRESH_MAX_AGE_SECONDS = int(os.getenv("TARGET_REFRESH_MAX_AGE_SECONDS", "3600"))
+TARGET_REFRESH_CHECK_SECONDS = int(os.getenv("TARGET_REFRESH_CHECK_SECONDS", "60"))
+TARGET_REFRESH_FAILURE_BACKOFF_SECONDS = int(os.getenv("TARGET_REFRESH_FAILURE_BACKOFF_SECONDS", "300"))
+TARGET_REFRESH_FAILURE_BACKOFF_MAX_SECONDS = int(os.getenv("TARGET_REFRESH_FAILURE_BACKOFF_MAX_SECONDS", "3600"))
+REFRESH_JOB_WAIT_SECONDS = float(os.getenv("REFRESH_JOB_WAIT_SECONDS", "10"))
+REFRESH_JOB_STALE_SECONDS = int(os.getenv("REFRESH_JOB_STALE_SECONDS", "600"))
+REFRESH_JOB_HISTORY = int(os.getenv("REFRESH_JOB_HISTORY", "20"))
+TARGET_PROPERTIES_TTL_SECONDS = int(os.getenv("TARGET_PROPERTIES_TTL_SECONDS", "86400"))
+METRIC_CATALOG_TTL_SECONDS = int(os.getenv("METRIC_CATALOG_TTL_SECONDS", "86400"))
+# Types whose targets differ too much to share one catalog (comma-separated typeNames):
+# each target of these types is cached on its own.
+METRIC_CATALOG_PER_TARGET_TYPES = frozenset(
+    item.strip() for item in os.getenv("METRIC_CATALOG_PER_TARGET_TYPES", "").split(",") if item.strip()
+)
+RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "512"))
+# Latest-data payloads are fully paginated and can be megabytes each: bound the total
+# size too, and never cache a single response above RESPONSE_CACHE_MAX_ENTRY_BYTES.
+RESPONSE_CACHE_MAX_BYTES = int(os.getenv("RESPONSE_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+RESPONSE_CACHE_MAX_ENTRY_BYTES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRY_BYTES", str(4 * 1024 * 1024)))
+RESPONSE_CACHE_TTL_SECONDS = float(os.getenv("RESPONSE_CACHE_TTL_SECONDS", "15"))
+RESPONSE_CACHE_STALE_SECONDS = float(os.getenv("RESPONSE_CACHE_STALE_SECONDS", "60"))
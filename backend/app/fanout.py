@@ -0,0 +1,26 @@
+from __future__ import annotations
+
+import asyncio
+from typing import Any, Awaitable, Callable, Iterable, TypeVar
+
+from .config import OEM_MAX_PARALLEL_PER_MANAGER
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+
+def max_parallel(manager: dict[str, Any]) -> int:
+    try:
+        value = int(manager.get("max_parallel") or OEM_MAX_PARALLEL_PER_MANAGER)
+    except (TypeError, ValueError):
+        value = OEM_MAX_PARALLEL_PER_MANAGER
+    return max(1, value)
+
+
+async def fan_out(
+    func: Callable[[T], Awaitable[R]],
+    items: Iterable[T],
+) -> list[R]:
+    # No cap of its own: every OEM call goes through its manager's adaptive limiter
+    # (AsyncOEMClient._attempt), which sets how many run at once.
+    return list(await asyncio.gather(*(func(item) for item in items)))
@@ -1,31 +1,49 @@
 from __future__ import annotations
 
-from typing import Any
+from typing import Any, Literal
 
 from pathlib import Path
 
-import requests
-
+import asyncio
 import json
 import math
 
-from fastapi import FastAPI, HTTPException, Request
+from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, StreamingResponse
+from starlette.concurrency import run_in_threadpool
 from pydantic import BaseModel, Field
 
 from . import cache
-from .mapping import auto_map_system, prepare_targets
-from .oem_pool import close_all_clients, get_client
-from .rate_limit import route_rate_limiter
+from .config import REFRESH_JOB_STALE_SECONDS, REFRESH_JOB_WAIT_SECONDS, TARGET_REFRESH_MAX_AGE_SECONDS
+from .fanout import fan_out
+from .mapping import auto_map_batch, auto_map_system, prepare_targets, rac_system_roots
+from .metric_catalog import get_metric_catalog, prewarm_metric_catalogs
+from .oem_pool import (
+    aclose_all_clients,
+    client_health,
+    run_pool_maintenance,
+    use_async_client,
+)
+from .outbound import reset_outbound_limiters
+from .properties import get_target_properties as fetch_target_properties
+from .rate_limit import RequestCost, RequestCostMiddleware, current_request_cost, route_rate_limiter
+from .refresh import cancel_refresh_jobs, run_refresh_scheduler, start_refresh_job
+from .response_cache import oem_response_cache
 from .static import SPAStaticFiles
+from .target_index import get_target_index
+from .oem_client import AsyncOEMClient
 from .oem_client import gethash #REMOVER DEPOIS DE USUARIO DE SERVICO  
 from .storage import (
+    ConfigConflictError,
+    SiteFileConflictError,
+    export_targets_yaml,
     get_enterprise_manager,
     get_site_config,
     load_enterprise_managers,
     load_targets_config,
     load_metrics_config,
+    patch_site_config,
     save_sites_config,
     save_metrics_config,
     upsert_site_config,
@@ -54,11 +72,36 @@ class AutoMapRequest(BaseModel):
     rootType: str
 
 
+class AutoMapRoot(BaseModel):
+    rootName: str
+    rootType: str
+
+
+class AutoMapBatchRequest(BaseModel):
+    endpointName: str
+    roots: list[AutoMapRoot] = Field(default_factory=list)
+    allRacDatabases: bool = False
+
+
 class SaveConfigRequest(BaseModel):
     endpointName: str
     targets: list[TargetItem] = Field(default_factory=list)
 
 
+class TargetPatchOperation(BaseModel):
+    op: Literal["add_target", "remove_target", "update_target", "set_tag", "remove_tag"]
+    targetId: str | None = None
+    target: TargetItem | None = None
+    key: str | None = None
+    value: str | None = None
+
+
+class PatchConfigRequest(BaseModel):
+    endpointName: str
+    revision: int | None = None
+    operations: list[TargetPatchOperation] = Field(default_factory=list)
+
+
 class SiteConfig(BaseModel):
     site: str | None = None
     endpoint: str | None = None
@@ -93,52 +136,42 @@ class MetricGroupsAvailabilityRequest(BaseModel):
 
 app = FastAPI(title="OEM Ingest Config Builder")
 
+# Base tokens per request; every OEM call the request makes adds RATE_LIMIT_OEM_CALL_COST.
 ROUTE_WEIGHTS = {
-    "/api/targets/refresh": 10,
-    "/api/targets/auto-map": 8,
-    "/api/targets/prepare": 6,
-    "/api/targets/properties": 3,
-    "/api/metrics/metric-groups": 4,
-    "/api/metrics/latest-data": 6,
-    "/api/metrics/metric-group": 4,
-    "/api/metrics/availability": 10,
-    "/api/metrics/availability/target": 8,
+    "/api/targets/refresh": 2,
+    "/api/targets/auto-map": 2,
+    "/api/targets/auto-map/batch": 2,
+    "/api/targets/prepare": 2,
+    "/api/targets/properties": 1,
+    "/api/metrics/metric-groups": 1,
+    "/api/metrics/catalog/prewarm": 2,
+    "/api/metrics/latest-data": 1,
+    "/api/metrics/metric-group": 1,
+    "/api/metrics/availability": 1,
+    "/api/metrics/availability/target": 1,
 }
 
 
-@app.middleware("http")
-async def rate_limit_middleware(request: Request, call_next):
-    if request.method == "OPTIONS":
-        return await call_next(request)
-    weight = ROUTE_WEIGHTS.get(request.url.path)
-    if not weight:
-        return await call_next(request)
-
-    endpoint_name = request.query_params.get("endpointName")
-    if not endpoint_name and request.method in {"POST", "PUT", "PATCH"}:
-        body = await request.body()
-        if body:
-            try:
-                payload = json.loads(body.decode("utf-8"))
-                if isinstance(payload, dict):
-                    endpoint_name = payload.get("endpointName") or payload.get("endpoint_name")
-            except json.JSONDecodeError:
-                endpoint_name = None
-        request._body = body  # type: ignore[attr-defined]
-
-    key = f"{endpoint_name or 'global'}:{request.url.path}"
-    allowed, retry_after = route_rate_limiter.allow(key, tokens=weight)
+async def _check_rate_limit(route: str, endpoint_name: str, estimated_calls: int = 1) -> None:
+    # Called from the handlers once endpointName has been parsed by FastAPI and matched
+    # to a configured manager, so bucket keys are bounded by managers x routes.
+    # The estimate is debited up front; RequestCostMiddleware refunds or charges the
+    # difference to the OEM calls actually made once the response is done.
+    key = f"{endpoint_name}:{route}"
+    cost = current_request_cost()
+    if cost is None:
+        cost = RequestCost()
+    allowed, retry_after = await cost.charge(key, ROUTE_WEIGHTS[route], estimated_calls)
     if not allowed:
         retry_seconds = max(1, int(math.ceil(retry_after)))
-        return JSONResponse(
+        raise HTTPException(
             status_code=429,
-            content={"detail": f"Rate limit atingido. Tente novamente em {retry_seconds}s."},
+            detail=f"Rate limit atingido. Tente novamente em {retry_seconds}s.",
             headers={"Retry-After": str(retry_seconds)},
         )
 
-    return await call_next(request)
-
 
+app.add_middleware(RequestCostMiddleware)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
@@ -148,15 +181,30 @@ app.add_middleware(
 )
 
 
+_background_tasks: list[asyncio.Task] = []
+
+
 @app.on_event("startup")
-def _startup() -> None:
+async def _startup() -> None:
     print(gethash())#REMOVER DEPOIS DE USUARIO DE SERVICO  
     cache.init_db()
+    cache.fail_stale_refresh_jobs(REFRESH_JOB_STALE_SECONDS)
+    _background_tasks.append(asyncio.create_task(run_pool_maintenance()))
+    if TARGET_REFRESH_MAX_AGE_SECONDS > 0:
+        _background_tasks.append(asyncio.create_task(run_refresh_scheduler()))
 
 
 @app.on_event("shutdown")
-def _shutdown() -> None:
-    close_all_clients()
+async def _shutdown() -> None:
+    for task in _background_tasks:
+        task.cancel()
+    await asyncio.gather(*_background_tasks, return_exceptions=True)
+    _background_tasks.clear()
+    await cancel_refresh_jobs()
+    reset_outbound_limiters()
+    oem_response_cache.clear()
+    await aclose_all_clients()
+    cache.close_connections()
 
 
 @app.get("/api/enterprise-managers")
@@ -174,42 +222,90 @@ def list_enterprise_managers() -> list[dict[str, Any]]:
     return sanitized
 
 
+@app.get("/api/enterprise-managers/health")
+def enterprise_managers_health() -> list[dict[str, Any]]:
+    return [
+        {"name": item.get("name"), "endpoint": item.get("endpoint"), **client_health(item)}
+        for item in load_enterprise_managers()
+    ]
+
+
+@app.get("/api/rate-limit/stats")
+def rate_limit_stats() -> dict[str, Any]:
+    return route_rate_limiter.snapshot()
+
+
 @app.get("/api/targets/cache-info")
 def cache_info(endpointName: str) -> dict[str, Any]:
     return {
         "count": cache.count_targets(endpointName),
         "lastRefresh": cache.get_last_refresh(endpointName),
+        "lastChanges": cache.get_refresh_stats(endpointName),
     }
 
 
 @app.post("/api/targets/refresh")
-def refresh_targets(endpointName: str) -> dict[str, Any]:
-    manager = get_enterprise_manager(endpointName)
+async def refresh_targets(endpointName: str) -> Any:
+    manager = await run_in_threadpool(get_enterprise_manager, endpointName)
     if not manager:
         raise HTTPException(status_code=404, detail="Endpoint nao encontrado")
-
-    client = get_client(manager)
-
-    try:
-        raw_items = client.get_all_targets()
-    except Exception as exc:
-        raise HTTPException(status_code=502, detail=f"Erro ao consultar OEM: {exc}")
-
-    normalized: list[dict[str, Any]] = []
-    for item in raw_items:
-        normalized.append(
-            {
-                "id": item.get("targetId") or item.get("id"),
-                "name": item.get("name"),
-                "typeName": item.get("type") or item.get("typeName"),
-                "displayName": item.get("displayName") or item.get("name"),
-            }
-        )
-
-    cache.clear_targets(endpointName)
-    cache.upsert_targets(endpointName, normalized)
-
-    return {"count": len(normalized)}
+    # One OEM call per page; the previous refresh of the endpoint is the estimate.
+    last_job = await run_in_threadpool(cache.get_latest_refresh_job, endpointName)
+    await _check_rate_limit("/api/targets/refresh", endpointName, (last_job or {}).get("pages") or 1)
+
+    # Joining a running job puts no extra load on the OEM; its pages are refunded.
+    job_id, task, started = await start_refresh_job(endpointName, manager)
+    # Small refreshes still answer inline; long ones return the job to be polled.
+    await asyncio.wait({task}, timeout=REFRESH_JOB_WAIT_SECONDS)
+    job = await run_in_threadpool(cache.get_refresh_job, job_id)
+    if not task.done():
+        cost = current_request_cost()
+        if cost is not None and started:
+            cost.continue_in_background()
+        return JSONResponse(status_code=202, content=job)
+    if not task.cancelled() and task.exception() is not None:
+        raise HTTPException(status_code=502, detail=f"Erro ao consultar OEM: {task.exception()}")
+    return job
+
+
+@app.get("/api/targets/refresh/status")
+def refresh_status(endpointName: str) -> dict[str, Any] | None:
+    return cache.get_latest_refresh_job(endpointName)
+
+
+@app.get("/api/targets/refresh/jobs/{jobId}")
+def refresh_job(jobId: int) -> dict[str, Any]:
+    job = cache.get_refresh_job(jobId)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job nao encontrado")
+    return job
+
+
+@app.get("/api/targets/refresh/jobs/{jobId}/events")
+async def refresh_job_events(jobId: int) -> StreamingResponse:
+    job = await run_in_threadpool(cache.get_refresh_job, jobId)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job nao encontrado")
+
+    async def stream():
+        # Job state lives in SQLite, so any worker can report a job started by another.
+        last = None
+        while True:
+            current = await run_in_threadpool(cache.get_refresh_job, jobId)
+            if current is None:
+                return
+            if current != last:
+                yield f"data: {json.dumps(current)}\n\n"
+                last = current
+            if current["status"] != "running":
+                return
+            await asyncio.sleep(1)
+
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
 
 @app.get("/api/targets/search")
@@ -230,53 +326,81 @@ def list_target_types(endpointName: str) -> list[str]:
 
 
 @app.get("/api/targets/properties")
-def get_target_properties(endpointName: str, targetId: str) -> dict[str, Any]:
-    manager = get_enterprise_manager(endpointName)
+async def get_target_properties(endpointName: str, targetId: str, refresh: bool = False) -> dict[str, Any]:
+    manager = await run_in_threadpool(get_enterprise_manager, endpointName)
     if not manager:
         raise HTTPException(status_code=404, detail="Endpoint nao encontrado")
-
-    client = get_client(manager)
+    await _check_rate_limit("/api/targets/properties", endpointName)
 
     try:
-        data = client.get_target_properties(targetId)
+        async with use_async_client(manager) as client:
+            data = await fetch_target_properties(endpointName, client, targetId, refresh=refresh)
     except Exception as exc:
         raise HTTPException(status_code=502, detail=f"Erro ao consultar propriedades: {exc}")
 
     return data
 
 
+@app.delete("/api/targets/properties")
+def invalidate_target_properties(endpointName: str, targetId: str | None = None) -> dict[str, Any]:
+    if not get_enterprise_manager(endpointName):
+        raise HTTPException(status_code=404, detail="Endpoint nao encontrado")
+    return {"removed": cache.delete_target_properties(endpointName, targetId)}
+
+
 @app.post("/api/targets/prepare")
-def prepare_targets_endpoint(payload: PrepareTargetsRequest) -> dict[str, Any]:
-    manager = get_enterprise_manager(payload.endpointName)
+async def prepare_targets_endpoint(payload: PrepareTargetsRequest) -> dict[str, Any]:
+    manager = await run_in_threadpool(get_enterprise_manager, payload.endpointName)
     if not manager:
         raise HTTPException(status_code=404, detail="Endpoint nao encontrado")
+    await _check_rate_limit("/api/targets/prepare", payload.endpointName, len(payload.targets))
 
-    cached_targets = cache.get_all_targets(payload.endpointName)
-    client = get_client(manager)
-
-    prepared = prepare_targets(cached_targets, [t.model_dump() for t in payload.targets], client)
+    index = await run_in_threadpool(get_target_index, payload.endpointName)
+    async with use_async_client(manager) as client:
+        prepared = await prepare_targets(index, [t.model_dump() for t in payload.targets], client)
     return {"targets": prepared}
 
 
 @app.post("/api/targets/auto-map")
-def auto_map(payload: AutoMapRequest) -> dict[str, Any]:
-    manager = get_enterprise_manager(payload.endpointName)
+async def auto_map(payload: AutoMapRequest) -> dict[str, Any]:
+    manager = await run_in_threadpool(get_enterprise_manager, payload.endpointName)
     if not manager:
         raise HTTPException(status_code=404, detail="Endpoint nao encontrado")
+    await _check_rate_limit("/api/targets/auto-map", payload.endpointName)
 
-    cached_targets = cache.get_all_targets(payload.endpointName)
-    root_exists = any(
-        t for t in cached_targets if t.get("name") == payload.rootName and t.get("typeName") == payload.rootType
-    )
-    if not root_exists:
+    index = await run_in_threadpool(get_target_index, payload.endpointName)
+    if not index.contains(payload.rootName, payload.rootType):
         raise HTTPException(status_code=404, detail="Target raiz nao encontrado no cache")
 
-    client = get_client(manager)
-
-    mapped = auto_map_system(cached_targets, payload.rootName, payload.rootType, client)
+    async with use_async_client(manager) as client:
+        mapped = await auto_map_system(index, payload.rootName, payload.rootType, client)
     return {"targets": mapped}
 
 
+@app.post("/api/targets/auto-map/batch")
+async def auto_map_batch_endpoint(payload: AutoMapBatchRequest) -> StreamingResponse:
+    manager = await run_in_threadpool(get_enterprise_manager, payload.endpointName)
+    if not manager:
+        raise HTTPException(status_code=404, detail="Endpoint nao encontrado")
+
+    index = await run_in_threadpool(get_target_index, payload.endpointName)
+    roots = [(root.rootName, root.rootType) for root in payload.roots]
+    if payload.allRacDatabases:
+        requested = set(roots)
+        roots.extend(root for root in rac_system_roots(index) if root not in requested)
+
+    await _check_rate_limit("/api/targets/auto-map/batch", payload.endpointName, len(roots))
+
+    async def stream():
+        # NDJSON: one line per root as soon as its system is mapped, then a summary line.
+        async with use_async_client(manager) as client:
+            async for result in auto_map_batch(index, roots, manager, client):
+                yield json.dumps(result) + "\n"
+        yield json.dumps({"done": True, "count": len(roots)}) + "\n"
+
+    return StreamingResponse(stream(), media_type="application/x-ndjson")
+
+
 @app.get("/api/config/targets")
 def load_config(endpointName: str) -> dict[str, Any]:
     site = get_site_config(endpointName)
@@ -288,12 +412,19 @@ def load_config(endpointName: str) -> dict[str, Any]:
             "name": endpointName,
             "targets": [],
         }
-    return site
+    return {**site, "revision": cache.get_config_revision(endpointName)}
 
 
 @app.get("/api/config/targets/all")
 def load_all_configs() -> list[dict[str, Any]]:
-    return load_targets_config()
+    revisions = cache.get_config_revisions()
+    return [{**site, "revision": revisions.get(site.get("name"), 0)} for site in load_targets_config()]
+
+
+@app.post("/api/config/targets/export")
+def export_all_configs() -> dict[str, Any]:
+    path = export_targets_yaml()
+    return {"path": str(path), "sites": len(load_targets_config())}
 
 
 @app.get("/api/config/metrics")
@@ -318,10 +449,27 @@ def save_config(payload: SaveConfigRequest) -> dict[str, Any]:
     targets = [t.model_dump() for t in payload.targets]
     for target in targets:
         ensure_required_tags(target)
-    site = upsert_site_config(payload.endpointName, targets)
+    try:
+        site = upsert_site_config(payload.endpointName, targets)
+    except SiteFileConflictError as exc:
+        raise HTTPException(status_code=409, detail=str(exc))
     return site
 
 
+@app.patch("/api/config/targets")
+def patch_config(payload: PatchConfigRequest) -> dict[str, Any]:
+    if not get_enterprise_manager(payload.endpointName):
+        raise HTTPException(status_code=404, detail="Endpoint nao encontrado")
+
+    operations = [operation.model_dump(exclude_none=True) for operation in payload.operations]
+    try:
+        return patch_site_config(payload.endpointName, operations, payload.revision)
+    except (ConfigConflictError, SiteFileConflictError) as exc:
+        raise HTTPException(status_code=409, detail=str(exc))
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+
+
 @app.post("/api/config/targets/all")
 def save_all_config(payload: SaveAllConfigRequest) -> list[dict[str, Any]]:
     sites = []
@@ -334,95 +482,105 @@ def save_all_config(payload: SaveAllConfigRequest) -> list[dict[str, Any]]:
                 "targets": [t.model_dump() for t in site.targets],
             }
         )
-    return save_sites_config(sites)
+    try:
+        return save_sites_config(sites)
+    except SiteFileConflictError as exc:
+        raise HTTPException(status_code=409, detail=str(exc))
 
 
 @app.get("/api/metrics/metric-groups")
-def metric_groups(endpointName: str, targetId: str) -> dict[str, Any]:
-    manager = get_enterprise_manager(endpointName)
+async def metric_groups(endpointName: str, targetId: str, refresh: bool = False) -> dict[str, Any]:
+    manager = await run_in_threadpool(get_enterprise_manager, endpointName)
     if not manager:
         raise HTTPException(status_code=404, detail="Endpoint nao encontrado")
-    client = get_client(manager)
+    await _check_rate_limit("/api/metrics/metric-groups", endpointName)
     try:
-        return client.get_metric_groups(targetId, include_metrics=True)
+        async with use_async_client(manager) as client:
+            return await get_metric_catalog(endpointName, client, targetId, refresh=refresh)
     except Exception as exc:
         raise HTTPException(status_code=502, detail=f"Erro ao consultar metricas: {exc}")
 
 
+@app.post("/api/metrics/catalog/prewarm")
+async def prewarm_metric_catalog(endpointName: str) -> dict[str, Any]:
+    manager = await run_in_threadpool(get_enterprise_manager, endpointName)
+    if not manager:
+        raise HTTPException(status_code=404, detail="Endpoint nao encontrado")
+    await _check_rate_limit("/api/metrics/catalog/prewarm", endpointName)
+    async with use_async_client(manager) as client:
+        return {"types": await prewarm_metric_catalogs(endpointName, manager, client)}
+
+
+@app.delete("/api/metrics/catalog")
+def invalidate_metric_catalog(endpointName: str, targetType: str | None = None) -> dict[str, Any]:
+    if not get_enterprise_manager(endpointName):
+        raise HTTPException(status_code=404, detail="Endpoint nao encontrado")
+    return {"removed": cache.delete_metric_catalogs(endpointName, targetType)}
+
+
 @app.get("/api/metrics/latest-data")
-def latest_metric_data(endpointName: str, targetId: str, metricGroupName: str) -> dict[str, Any]:
-    manager = get_enterprise_manager(endpointName)
+async def latest_metric_data(endpointName: str, targetId: str, metricGroupName: str) -> dict[str, Any]:
+    manager = await run_in_threadpool(get_enterprise_manager, endpointName)
     if not manager:
         raise HTTPException(status_code=404, detail="Endpoint nao encontrado")
-    client = get_client(manager)
+    await _check_rate_limit("/api/metrics/latest-data", endpointName)
     try:
-        return client.get_latest_metric_data(targetId, metricGroupName)
+        async with use_async_client(manager) as client:
+            return await oem_response_cache.get_or_fetch(
+                (endpointName, "latestData", targetId, metricGroupName),
+                lambda: client.get_latest_metric_data(targetId, metricGroupName),
+            )
     except Exception as exc:
         raise HTTPException(status_code=502, detail=f"Erro ao consultar metricas: {exc}")
 
 
 @app.get("/api/metrics/metric-group")
-def metric_group_details(endpointName: str, targetId: str, metricGroupName: str) -> dict[str, Any]:
-    manager = get_enterprise_manager(endpointName)
+async def metric_group_details(endpointName: str, targetId: str, metricGroupName: str) -> dict[str, Any]:
+    manager = await run_in_threadpool(get_enterprise_manager, endpointName)
     if not manager:
         raise HTTPException(status_code=404, detail="Endpoint nao encontrado")
-    client = get_client(manager)
+    await _check_rate_limit("/api/metrics/metric-group", endpointName)
     try:
-        return client.get_metric_group_details(targetId, metricGroupName)
+        async with use_async_client(manager) as client:
+            return await oem_response_cache.get_or_fetch(
+                (endpointName, "metricGroup", targetId, metricGroupName),
+                lambda: client.get_metric_group_details(targetId, metricGroupName),
+            )
     except Exception as exc:
         raise HTTPException(status_code=502, detail=f"Erro ao consultar grupo de metricas: {exc}")
 
 
-def _classify_latest_data(data: dict[str, Any]) -> str:
-    count = data.get("count")
-    if isinstance(count, int) and count > 0:
-        return "disponivel"
-    items = data.get("items") or []
-    if not items:
-        return "sem_dados"
-    for item in items:
-        metrics = item.get("metrics") or item.get("metricValues") or []
-        if metrics:
-            for metric in metrics:
-                if metric.get("value") is not None:
-                    return "disponivel"
-        datapoints = item.get("datapoints")
-        if datapoints:
-            return "disponivel"
-    return "sem_dados"
+async def _latest_data_status(client: AsyncOEMClient, target_id: str, metric_group_name: str) -> str:
+    try:
+        return await client.probe_latest_metric_data(target_id, metric_group_name)
+    except Exception:
+        return "indisponivel"
 
 
 @app.post("/api/metrics/availability")
-def metric_availability(payload: AvailabilityRequest) -> dict[str, Any]:
-    manager = get_enterprise_manager(payload.endpointName)
+async def metric_availability(payload: AvailabilityRequest) -> dict[str, Any]:
+    manager = await run_in_threadpool(get_enterprise_manager, payload.endpointName)
     if not manager:
         raise HTTPException(status_code=404, detail="Endpoint nao encontrado")
-    site = get_site_config(payload.endpointName)
+    site = await run_in_threadpool(get_site_config, payload.endpointName)
     targets = (site or {}).get("targets") or []
     filtered_targets = [t for t in targets if t.get("typeName") == payload.targetType]
+    await _check_rate_limit("/api/metrics/availability", payload.endpointName, len(filtered_targets))
 
-    client = get_client(manager)
-    results = []
-    for target in filtered_targets:
-        status = "indisponivel"
-        try:
-            data = client.get_latest_metric_data(target.get("id"), payload.metricGroupName)
-            status = _classify_latest_data(data)
-        except requests.HTTPError as exc:
-            if exc.response is not None and exc.response.status_code == 404:
-                status = "indisponivel"
-            else:
-                status = "indisponivel"
-        except Exception:
-            status = "indisponivel"
-        results.append(
-            {
-                "id": target.get("id"),
-                "name": target.get("name"),
-                "typeName": target.get("typeName"),
-                "status": status,
-            }
+    async with use_async_client(manager) as client:
+        statuses = await fan_out(
+            lambda target: _latest_data_status(client, target.get("id"), payload.metricGroupName),
+            filtered_targets,
         )
+    results = [
+        {
+            "id": target.get("id"),
+            "name": target.get("name"),
+            "typeName": target.get("typeName"),
+            "status": status,
+        }
+        for target, status in zip(filtered_targets, statuses)
+    ]
 
     return {
         "metricGroupName": payload.metricGroupName,
@@ -432,26 +590,21 @@ def metric_availability(payload: AvailabilityRequest) -> dict[str, Any]:
 
 
 @app.post("/api/metrics/availability/target")
-def metric_availability_for_target(payload: MetricGroupsAvailabilityRequest) -> dict[str, Any]:
-    manager = get_enterprise_manager(payload.endpointName)
+async def metric_availability_for_target(payload: MetricGroupsAvailabilityRequest) -> dict[str, Any]:
+    manager = await run_in_threadpool(get_enterprise_manager, payload.endpointName)
     if not manager:
         raise HTTPException(status_code=404, detail="Endpoint nao encontrado")
+    await _check_rate_limit("/api/metrics/availability/target", payload.endpointName, len(payload.metricGroupNames))
 
-    client = get_client(manager)
-    results = []
-    for group_name in payload.metricGroupNames:
-        status = "indisponivel"
-        try:
-            data = client.get_latest_metric_data(payload.targetId, group_name)
-            status = _classify_latest_data(data)
-        except requests.HTTPError as exc:
-            if exc.response is not None and exc.response.status_code == 404:
-                status = "indisponivel"
-            else:
-                status = "indisponivel"
-        except Exception:
-            status = "indisponivel"
-        results.append({"metricGroupName": group_name, "status": status})
+    async with use_async_client(manager) as client:
+        statuses = await fan_out(
+            lambda group_name: _latest_data_status(client, payload.targetId, group_name),
+            payload.metricGroupNames,
+        )
+    results = [
+        {"metricGroupName": group_name, "status": status}
+        for group_name, status in zip(payload.metricGroupNames, statuses)
+    ]
 
     return {"items": results}
 
@@ -1,9 +1,14 @@
 from __future__ import annotations
 
+import asyncio
 import re
-from typing import Any
+from functools import lru_cache
+from typing import Any, AsyncIterator
 
-from .oem_client import OEMClient
+from .fanout import fan_out, max_parallel
+from .oem_client import AsyncOEMClient
+from .properties import get_target_properties
+from .target_index import TargetIndex
 from .utils import (
     ensure_required_tags,
     find_property_value,
@@ -33,19 +38,24 @@ def _guess_primary_and_standby(prefix: str) -> tuple[str, str]:
     return prefix, _swap_p_s(prefix)
 
 
+@lru_cache(maxsize=4096)
 def _regex_full(pattern: str) -> re.Pattern:
     return re.compile(pattern, re.IGNORECASE)
 
 
 def _find_targets(
-    targets: list[dict[str, Any]],
+    index: TargetIndex,
     regex_list: list[re.Pattern],
     type_name: str,
     unique: bool,
+    prefix: str,
 ) -> list[dict[str, Any]]:
+    # Every system pattern starts with the rac name, so only targets sharing its
+    # first "_" segment can match.
     results: list[dict[str, Any]] = []
+    candidates = index.with_prefix(type_name, prefix)
     for rgx in regex_list:
-        matches = [t for t in targets if t.get("typeName") == type_name and rgx.fullmatch(t.get("name", ""))]
+        matches = [t for t in candidates if rgx.fullmatch(t.get("name", ""))]
         if matches:
             results.extend(matches)
             if unique:
@@ -53,24 +63,19 @@ def _find_targets(
     return results
 
 
-def _find_target_by_name_type(
-    targets: list[dict[str, Any]], name: str, type_name: str
-) -> dict[str, Any] | None:
-    for t in targets:
-        if t.get("typeName") == type_name and t.get("name", "").lower() == name.lower():
-            return t
-    return None
+def _find_target_by_name_type(index: TargetIndex, name: str, type_name: str) -> dict[str, Any] | None:
+    return index.find(name, type_name)
 
 
-def _enrich_oracle_database(
+async def _enrich_oracle_database(
     target: dict[str, Any],
-    client: OEMClient,
-    targets: list[dict[str, Any]],
+    client: AsyncOEMClient,
+    index: TargetIndex,
 ) -> tuple[dict[str, Any], list[dict[str, Any]]]:
     extra_targets: list[dict[str, Any]] = []
     properties: dict[str, Any] | None = None
     try:
-        properties = client.get_target_properties(target["id"])
+        properties = await get_target_properties(index.endpoint_name, client, target["id"])
     except Exception:
         properties = None
 
@@ -89,16 +94,16 @@ def _enrich_oracle_database(
         listener_name = f"LISTENER_{machine_name}"
         target["listener_name"] = listener_name
 
-        host_target = _find_target_by_name_type(targets, machine_name, "host")
+        host_target = _find_target_by_name_type(index, machine_name, "host")
         if host_target:
             extra_targets.append(host_target)
 
-        listener_target = _find_target_by_name_type(targets, listener_name, "oracle_listener")
+        listener_target = _find_target_by_name_type(index, listener_name, "oracle_listener")
         if not listener_target:
             short = short_hostname(machine_name)
             if short:
                 listener_target = _find_target_by_name_type(
-                    targets, f"LISTENER_{short}", "oracle_listener"
+                    index, f"LISTENER_{short}", "oracle_listener"
                 )
         if listener_target:
             extra_targets.append(listener_target)
@@ -146,11 +151,11 @@ def _apply_tags(
     return target
 
 
-def auto_map_system(
-    targets: list[dict[str, Any]],
+async def auto_map_system(
+    index: TargetIndex,
     root_name: str,
     root_type: str,
-    client: OEMClient,
+    client: AsyncOEMClient,
 ) -> list[dict[str, Any]]:
     prefix = root_name.split("_")[0] if root_type in PDB_TYPES else root_name
     primary_rac, standby_rac = _guess_primary_and_standby(prefix)
@@ -175,48 +180,54 @@ def auto_map_system(
     
     # oracle_dbsys
     oracle_dbsys_primary = _find_targets(
-        targets,
+        index,
         [_regex_full(rf"{re.escape(primary_rac)}_sys"),_regex_full(rf"{re.escape(primary_rac)}_1_sys")],
         "oracle_dbsys",
         unique=True,
+        prefix=primary_rac,
     )
     oracle_dbsys_stby = _find_targets(
-        targets,
+        index,
         [_regex_full(rf"{re.escape(standby_rac)}_sys"),_regex_full(rf"{re.escape(standby_rac)}_1_sys")],
         "oracle_dbsys",
         unique=True,
+        prefix=standby_rac,
     )
     add_many(oracle_dbsys_primary)
     add_many(oracle_dbsys_stby)
 
     # rac_database
     rac_primary = _find_targets(
-        targets,
+        index,
         [_regex_full(rf"{re.escape(primary_rac)}"), _regex_full(rf"{re.escape(primary_rac)}_1")],
         "rac_database",
         unique=True,
+        prefix=primary_rac,
     )
     rac_stby = _find_targets(
-        targets,
+        index,
         [_regex_full(rf"{re.escape(standby_rac)}"), _regex_full(rf"{re.escape(standby_rac)}_1")],
         "rac_database",
         unique=True,
+        prefix=standby_rac,
     )
     add_many(rac_primary)
     add_many(rac_stby)
 
     # oracle_pdb (optional)
     pdb_primary = _find_targets(
-        targets,
+        index,
         [_regex_full(rf"{re.escape(primary_rac)}_{re.escape(primary_upper)}.*")],
         "oracle_pdb",
         unique=False,
+        prefix=primary_rac,
     )
     pdb_stby = _find_targets(
-        targets,
+        index,
         [_regex_full(rf"{re.escape(standby_rac)}_{re.escape(primary_upper)}.*")],
         "oracle_pdb",
         unique=False,
+        prefix=standby_rac,
     )
     add_many(pdb_primary)
     add_many(pdb_stby)
@@ -224,19 +235,27 @@ def auto_map_system(
     # oracle_database
 
     oracle_db_primary = _find_targets(
-        targets,
+        index,
         [_regex_full(rf"^{re.escape(primary_rac)}(?:_\d+)?_{re.escape(primary_rac)}\d*$")],
         "oracle_database",
         unique=False,
+        prefix=primary_rac,
     )
     oracle_db_stby = _find_targets(
-        targets,
+        index,
         [_regex_full(rf"^{re.escape(standby_rac)}(?:_\d+)?_{re.escape(standby_rac)}\d*$")],
         "oracle_database",
         unique=False,
+        prefix=standby_rac,
     )
-    for item in oracle_db_primary + oracle_db_stby:
-        enriched, extra = _enrich_oracle_database({"id": item["id"], "name": item["name"], "typeName": item["typeName"]}, client, targets)
+    # Properties are fetched concurrently; gather keeps input order, so `found` is unchanged.
+    enrichments = await fan_out(
+        lambda item: _enrich_oracle_database(
+            {"id": item["id"], "name": item["name"], "typeName": item["typeName"]}, client, index
+        ),
+        oracle_db_primary + oracle_db_stby,
+    )
+    for enriched, extra in enrichments:
         add_target(enriched)
         add_many(extra)
 
@@ -263,23 +282,72 @@ def auto_map_system(
     return found
 
 
-def prepare_targets(
-    cached_targets: list[dict[str, Any]],
+async def prepare_targets(
+    index: TargetIndex,
     selected: list[dict[str, Any]],
-    client: OEMClient,
+    client: AsyncOEMClient,
 ) -> list[dict[str, Any]]:
     prepared: list[dict[str, Any]] = []
     for item in selected:
-        base = {
-            "id": item.get("id"),
-            "name": item.get("name"),
-            "typeName": item.get("typeName"),
-            "tags": dict(item.get("tags") or {}),
-        }
-        if base["typeName"] == "oracle_database":
-            enriched, _ = _enrich_oracle_database(base, client, cached_targets)
-            base = enriched
+        prepared.append(
+            {
+                "id": item.get("id"),
+                "name": item.get("name"),
+                "typeName": item.get("typeName"),
+                "tags": dict(item.get("tags") or {}),
+            }
+        )
+    # Enrichment updates each dict in place, so the result order follows `selected`.
+    await fan_out(
+        lambda base: _enrich_oracle_database(base, client, index),
+        [base for base in prepared if base["typeName"] == "oracle_database"],
+    )
+    for base in prepared:
         _apply_tags(base, None, None)
         ensure_required_tags(base)
-        prepared.append(base)
     return prepared
+
+
+def rac_system_roots(index: TargetIndex) -> list[tuple[str, str]]:
+    # One root per primary/standby pair: mapping either side returns the whole system.
+    roots: list[tuple[str, str]] = []
+    seen: set[tuple[str, str]] = set()
+    for target in index.of_type("rac_database"):
+        name = target.get("name") or ""
+        pair = tuple(part.lower() for part in _guess_primary_and_standby(name))
+        if not name or pair in seen:
+            continue
+        seen.add(pair)
+        roots.append((name, "rac_database"))
+    return roots
+
+
+async def auto_map_batch(
+    index: TargetIndex,
+    roots: list[tuple[str, str]],
+    manager: dict[str, Any],
+    client: AsyncOEMClient,
+) -> AsyncIterator[dict[str, Any]]:
+    # Bounds how many roots are mapped at once; the OEM calls inside each root are
+    # paced by the manager's adaptive limiter.
+    semaphore = asyncio.Semaphore(max_parallel(manager))
+
+    async def run(root_name: str, root_type: str) -> dict[str, Any]:
+        result: dict[str, Any] = {"rootName": root_name, "rootType": root_type}
+        if not index.contains(root_name, root_type):
+            result["error"] = "Target raiz nao encontrado no cache"
+            return result
+        async with semaphore:
+            try:
+                result["targets"] = await auto_map_system(index, root_name, root_type, client)
+            except Exception as exc:
+                result["error"] = str(exc)
+        return result
+
+    tasks = [asyncio.create_task(run(root_name, root_type)) for root_name, root_type in roots]
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            yield await next_done
+    finally:
+        for task in tasks:
+            task.cancel()
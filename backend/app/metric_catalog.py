@@ -0,0 +1,90 @@
+from __future__ import annotations
+
+from typing import Any
+
+from starlette.concurrency import run_in_threadpool
+
+from . import cache
+from .config import METRIC_CATALOG_PER_TARGET_TYPES, METRIC_CATALOG_TTL_SECONDS
+from .fanout import fan_out
+from .oem_client import AsyncOEMClient
+from .storage import get_site_config, load_metrics_config
+from .target_index import get_target_index
+
+
+async def get_metric_catalog(
+    endpoint_name: str,
+    client: AsyncOEMClient,
+    target_id: str,
+    refresh: bool = False,
+) -> dict[str, Any]:
+    target = await run_in_threadpool(cache.get_target_by_id, endpoint_name, target_id)
+    target_type = (target or {}).get("typeName")
+    if not target_type or METRIC_CATALOG_TTL_SECONDS <= 0:
+        return await client.get_metric_groups(target_id, include_metrics=True)
+
+    # The type catalog is served to every target of the type without asking the OEM,
+    # so a target whose groups differ is only noticed when it is fetched itself
+    # (refresh=true or an expired entry), and if the first target fetched is such an
+    # outlier its catalog becomes the type's. Types listed in
+    # METRIC_CATALOG_PER_TARGET_TYPES skip the type catalog altogether.
+    per_target = target_type in METRIC_CATALOG_PER_TARGET_TYPES
+    if not refresh:
+        cached = await run_in_threadpool(
+            cache.get_metric_catalog, endpoint_name, target_type, target_id, METRIC_CATALOG_TTL_SECONDS, per_target
+        )
+        if cached is not None:
+            return cached
+
+    data = await client.get_metric_groups(target_id, include_metrics=True)
+    await run_in_threadpool(
+        cache.store_metric_catalog,
+        endpoint_name,
+        target_type,
+        target_id,
+        data,
+        METRIC_CATALOG_TTL_SECONDS,
+        per_target,
+    )
+    return data
+
+
+def _representative_targets(endpoint_name: str, target_types: list[str]) -> dict[str, str | None]:
+    # Prefer a target already in the site configuration, then any cached target of the type.
+    configured = (get_site_config(endpoint_name) or {}).get("targets") or []
+    index = get_target_index(endpoint_name)
+    representatives: dict[str, str | None] = {}
+    for target_type in target_types:
+        target_id = next((t.get("id") for t in configured if t.get("typeName") == target_type), None)
+        if not target_id:
+            cached = index.of_type(target_type)
+            target_id = cached[0].get("id") if cached else None
+        representatives[target_type] = target_id
+    return representatives
+
+
+async def prewarm_metric_catalogs(
+    endpoint_name: str,
+    manager: dict[str, Any],
+    client: AsyncOEMClient,
+) -> dict[str, str]:
+    target_types = list((await run_in_threadpool(load_metrics_config)).keys())
+    representatives = await run_in_threadpool(_representative_targets, endpoint_name, target_types)
+
+    async def warm(target_type: str) -> str:
+        if target_type in METRIC_CATALOG_PER_TARGET_TYPES:
+            return "por_target"
+        target_id = representatives.get(target_type)
+        if not target_id:
+            return "sem_target"
+        try:
+            data = await client.get_metric_groups(target_id, include_metrics=True)
+        except Exception as exc:
+            return f"erro: {exc}"
+        await run_in_threadpool(
+            cache.store_metric_catalog, endpoint_name, target_type, None, data, METRIC_CATALOG_TTL_SECONDS
+        )
+        return "ok"
+
+    results = await fan_out(warm, target_types)
+    return dict(zip(target_types, results))
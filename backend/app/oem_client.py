@@ -1,9 +1,15 @@
 from __future__ import annotations
 
+import asyncio
+import time
 import urllib.parse
-from typing import Any
+from typing import Any, AsyncIterator
 
-import requests
+import httpx
+from .outbound import AdaptiveLimiter
+from .rate_limit import record_oem_call
+from .transport import RETRY_STATUSES, ClientHealth, TransportSettings
+from .utils import classify_latest_data
 import os  #REMOVER DEPOIS DE USUARIO DE SERVICO
 from . import xisou #REMOVER DEPOIS DE USUARIO DE SERVICO
 
@@ -13,9 +19,25 @@ def gethash():#REMOVER DEPOIS DE USUARIO DE SERVICO
     return h 
 
 
-class OEMClient:
-    def __init__(self, endpoint: str, user: str, password: str, verify_ssl: bool = False):
+def _next_href(data: Any) -> str | None:
+    if not isinstance(data, dict):
+        return None
+    return ((data.get("links") or {}).get("next") or {}).get("href")
+
+
+class AsyncOEMClient:
+    def __init__(
+        self,
+        endpoint: str,
+        user: str,
+        password: str,
+        verify_ssl: bool = False,
+        transport: TransportSettings | None = None,
+        limiter: AdaptiveLimiter | None = None,
+    ):
         self.endpoint = endpoint
+        self.transport = transport or TransportSettings()
+        self.health = ClientHealth()
         self.user = user
         t = password #REMOVER DEPOIS DE USUARIO DE SERVICO
         file_path = os.path.abspath(__file__)#REMOVER DEPOIS DE USUARIO DE SERVICO
@@ -24,12 +46,14 @@ class OEMClient:
         self.password = aut2
         # self.password = password   #RETORNAR   DEPOIS DE USUARIO DE SERVICO
         self.verify_ssl = verify_ssl
-        if not verify_ssl:
-            requests.packages.urllib3.disable_warnings()  # type: ignore[attr-defined]
-        self._session = requests.Session()
-        self._session.auth = (self.user, self.password)
-        self._session.verify = self.verify_ssl
-        self._session.headers.update({"Accept": "application/json"})
+        self.limiter = limiter
+        self._client = httpx.AsyncClient(
+            auth=(self.user, self.password),
+            verify=self.verify_ssl,
+            headers=self.transport.headers(),
+            timeout=self.transport.httpx_timeout(),
+            limits=self.transport.httpx_limits(),
+        )
 
     def _normalize_base(self) -> str:
         base = self.endpoint.rstrip("/")
@@ -39,87 +63,154 @@ class OEMClient:
             return f"{base}/api"
         return f"{base}/em/api"
 
-    def _get(self, path: str, params: dict[str, Any] | None = None) -> requests.Response:
+    def _url(self, path: str) -> str:
+        return f"{self._normalize_base()}/{path.lstrip('/')}"
+
+    def _href_url(self, href: str) -> str:
+        if href.startswith("http://") or href.startswith("https://"):
+            return href
         base = self._normalize_base()
-        url = f"{base}/{path.lstrip('/')}"
-        return self._session.get(
-            url,
-            params=params,
-            timeout=60,
-        )
+        parsed_base = urllib.parse.urlparse(base)
+        base_root = f"{parsed_base.scheme}://{parsed_base.netloc}"
+        if href.startswith("/em/api/"):
+            return f"{base_root}{href}"
+        return f"{base}/{href.lstrip('/')}"
+
+    async def _send(
+        self, url: str, params: dict[str, Any] | None = None, kind: str = "detail"
+    ) -> httpx.Response:
+        # httpx has no retry policy for responses, so GET retries are done here:
+        # transport errors and RETRY_STATUSES, honoring Retry-After.
+        attempt = 0
+        while True:
+            try:
+                response = await self._attempt(url, params, kind)
+            except httpx.TransportError:
+                if attempt >= self.transport.retries:
+                    raise
+                delay = self.transport.backoff_delay(attempt)
+            else:
+                if response.status_code not in RETRY_STATUSES or attempt >= self.transport.retries:
+                    return response
+                await response.aclose()
+                delay = self.transport.backoff_delay(attempt, response.headers.get("Retry-After"))
+            attempt += 1
+            await asyncio.sleep(delay)
+
+    async def _attempt(
+        self, url: str, params: dict[str, Any] | None = None, kind: str = "detail"
+    ) -> httpx.Response:
+        # kind ("page", "probe", "detail") picks the latency baseline the limiter compares against.
+        if self.limiter is not None:
+            await self.limiter.acquire()
+        record_oem_call()
+        started = time.monotonic()
+        try:
+            response = await self._client.get(url, params=params)
+        except httpx.HTTPError as exc:
+            self.health.record(started, error=exc)
+            if self.limiter is not None:
+                self.limiter.record(time.monotonic() - started, error=exc, kind=kind)
+            raise
+        finally:
+            if self.limiter is not None:
+                self.limiter.release()
+        self.health.record(started, status=response.status_code)
+        if self.limiter is not None:
+            self.limiter.record(
+                time.monotonic() - started,
+                status=response.status_code,
+                retry_after=response.headers.get("Retry-After"),
+                kind=kind,
+            )
+        return response
+
+    async def _get(
+        self, path: str, params: dict[str, Any] | None = None, kind: str = "detail"
+    ) -> httpx.Response:
+        return await self._send(self._url(path), params=params, kind=kind)
+
+    async def ping(self) -> None:
+        # Single cheap request, no retries: keeps the connection warm and feeds health.
+        await self._attempt(self._url("targets"), params={"limit": 1}, kind="probe")
+
+    async def _get_by_href(self, href: str, kind: str = "page") -> httpx.Response:
+        return await self._send(self._href_url(href), kind=kind)
 
-    def close(self) -> None:
-        self._session.close()
+    async def aclose(self) -> None:
+        await self._client.aclose()
 
-    def get_targets_page(self, page_token: str | None = None, limit: int = 2000) -> dict[str, Any]:
+    async def get_targets_page(self, page_token: str | None = None, limit: int = 2000) -> dict[str, Any]:
         params: dict[str, Any] = {"limit": limit}
         if page_token:
             params["page"] = page_token
-        response = self._get("targets", params=params)
+        response = await self._get("targets", params=params, kind="page")
         response.raise_for_status()
         return response.json()
 
-    def _get_by_href(self, href: str) -> requests.Response:
-        if href.startswith("http://") or href.startswith("https://"):
-            url = href
-        else:
-            base = self._normalize_base()
-            parsed_base = urllib.parse.urlparse(base)
-            base_root = f"{parsed_base.scheme}://{parsed_base.netloc}"
-            if href.startswith("/em/api/"):
-                url = f"{base_root}{href}"
-            else:
-                url = f"{base}/{href.lstrip('/')}"
-        return self._session.get(url, timeout=60)
-
-    def get_all_targets(self) -> list[dict[str, Any]]:
-        items: list[dict[str, Any]] = []
-        data = self.get_targets_page()
-        items.extend(data.get("items") or [])
-        next_href = ((data.get("links") or {}).get("next") or {}).get("href")
+    async def iter_target_pages(self) -> AsyncIterator[list[dict[str, Any]]]:
+        data = await self.get_targets_page()
+        yield data.get("items") or []
+        next_href = _next_href(data)
         while next_href:
-            response = self._get_by_href(next_href)
+            response = await self._get_by_href(next_href)
             response.raise_for_status()
             data = response.json()
-            items.extend(data.get("items") or [])
-            next_href = ((data.get("links") or {}).get("next") or {}).get("href")
+            yield data.get("items") or []
+            next_href = _next_href(data)
+
+    async def get_all_targets(self) -> list[dict[str, Any]]:
+        items: list[dict[str, Any]] = []
+        async for page in self.iter_target_pages():
+            items.extend(page)
         return items
 
-    def get_target_properties(self, target_id: str) -> dict[str, Any]:
-        response = self._get(f"targets/{target_id}/properties")
+    async def get_target_properties(self, target_id: str) -> dict[str, Any]:
+        response = await self._get(f"targets/{target_id}/properties")
         response.raise_for_status()
         return response.json()
 
-    def get_metric_groups(self, target_id: str, include_metrics: bool = True) -> dict[str, Any]:
+    async def get_metric_groups(self, target_id: str, include_metrics: bool = True) -> dict[str, Any]:
         params = {"include": "metrics"} if include_metrics else None
-        response = self._get(f"targets/{target_id}/metricGroups", params=params)
+        response = await self._get(f"targets/{target_id}/metricGroups", params=params)
         response.raise_for_status()
         return response.json()
 
-    def get_latest_metric_data(self, target_id: str, metric_group_name: str) -> dict[str, Any]:
+    async def get_latest_metric_data(self, target_id: str, metric_group_name: str) -> dict[str, Any]:
         safe_group = urllib.parse.quote(metric_group_name, safe="")
-        response = self._get(f"targets/{target_id}/metricGroups/{safe_group}/latestData")
+        response = await self._get(f"targets/{target_id}/metricGroups/{safe_group}/latestData", kind="page")
         response.raise_for_status()
         data = response.json()
         items: list[dict[str, Any]] = []
         if isinstance(data, dict):
             items.extend(data.get("items") or [])
-            next_href = ((data.get("links") or {}).get("next") or {}).get("href")
+            next_href = _next_href(data)
             while next_href:
-                page_response = self._get_by_href(next_href)
+                page_response = await self._get_by_href(next_href)
                 page_response.raise_for_status()
                 page_data = page_response.json()
                 if isinstance(page_data, dict):
                     items.extend(page_data.get("items") or [])
-                    next_href = ((page_data.get("links") or {}).get("next") or {}).get("href")
-                else:
-                    next_href = None
+                next_href = _next_href(page_data)
             data["items"] = items
             data["count"] = len(items)
         return data
 
-    def get_metric_group_details(self, target_id: str, metric_group_name: str) -> dict[str, Any]:
+    async def probe_latest_metric_data(self, target_id: str, metric_group_name: str) -> str:
+        safe_group = urllib.parse.quote(metric_group_name, safe="")
+        response = await self._get(
+            f"targets/{target_id}/metricGroups/{safe_group}/latestData",
+            params={"limit": 1},
+            kind="probe",
+        )
+        response.raise_for_status()
+        data = response.json()
+        if not isinstance(data, dict):
+            return "sem_dados"
+        return classify_latest_data(data)
+
+    async def get_metric_group_details(self, target_id: str, metric_group_name: str) -> dict[str, Any]:
         safe_group = urllib.parse.quote(metric_group_name, safe="")
-        response = self._get(f"targets/{target_id}/metricGroups/{safe_group}")
+        response = await self._get(f"targets/{target_id}/metricGroups/{safe_group}")
         response.raise_for_status()
         return response.json()
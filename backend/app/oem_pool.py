@@ -1,63 +1,183 @@
 from __future__ import annotations
 
+import asyncio
+import logging
 import threading
 import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager
 from dataclasses import dataclass
-from typing import Any
+from typing import Any, AsyncIterator
 
-from .config import OEM_CLIENT_TTL_SECONDS
-from .oem_client import OEMClient
+from starlette.concurrency import run_in_threadpool
+
+from .config import OEM_CLIENT_TTL_SECONDS, OEM_POOL_MAINTENANCE_SECONDS, OEM_POOL_MAX_CLIENTS
+from .oem_client import AsyncOEMClient
+from .outbound import get_outbound_limiter
+from .storage import load_enterprise_managers
+from .transport import TransportSettings
+
+logger = logging.getLogger(__name__)
 
 
 @dataclass
-class _ClientEntry:
-    client: OEMClient
+class _AsyncClientEntry:
+    client: AsyncOEMClient
     last_used: float
+    # Requests currently holding the client through use_async_client.
+    in_use: int = 0
 
 
+_ClientKey = tuple[str, str, str, bool, TransportSettings]
 _lock = threading.Lock()
-_clients: dict[tuple[str, str, str, bool], _ClientEntry] = {}
+# The pool is LRU-ordered and bounded by OEM_POOL_MAX_CLIENTS. Evicted or expired
+# clients are parked in the retired list and closed by the maintenance task once no
+# request holds them, never on the request path.
+_async_clients: OrderedDict[_ClientKey, _AsyncClientEntry] = OrderedDict()
+_retired_async_clients: list[_AsyncClientEntry] = []
 
 
-def _client_key(manager: dict[str, Any]) -> tuple[str, str, str, bool]:
+def _client_key(manager: dict[str, Any]) -> _ClientKey:
+    # Transport settings are part of the key, so editing them yields a new client.
     return (
         manager.get("endpoint"),
         manager.get("user"),
         manager.get("password"),
         bool(manager.get("verify_ssl", False)),
+        TransportSettings.from_manager(manager),
     )
 
 
-def _cleanup_locked(now: float) -> None:
-    expired_keys = [key for key, entry in _clients.items() if now - entry.last_used > OEM_CLIENT_TTL_SECONDS]
-    for key in expired_keys:
-        entry = _clients.pop(key, None)
-        if entry:
-            entry.client.close()
+def _evict_locked() -> None:
+    while len(_async_clients) > OEM_POOL_MAX_CLIENTS:
+        _, entry = _async_clients.popitem(last=False)
+        _retired_async_clients.append(entry)
 
 
-def get_client(manager: dict[str, Any]) -> OEMClient:
+def _checkout(manager: dict[str, Any]) -> _AsyncClientEntry:
     now = time.monotonic()
     key = _client_key(manager)
     with _lock:
-        _cleanup_locked(now)
-        entry = _clients.get(key)
+        entry = _async_clients.get(key)
         if entry:
             entry.last_used = now
-            return entry.client
+            entry.in_use += 1
+            _async_clients.move_to_end(key)
+            return entry
 
-        client = OEMClient(
+        client = AsyncOEMClient(
             endpoint=manager.get("endpoint"),
             user=manager.get("user"),
             password=manager.get("password"),
             verify_ssl=bool(manager.get("verify_ssl", False)),
+            transport=key[4],
+            limiter=get_outbound_limiter(manager),
         )
-        _clients[key] = _ClientEntry(client=client, last_used=now)
-        return client
+        entry = _AsyncClientEntry(client=client, last_used=now, in_use=1)
+        _async_clients[key] = entry
+        _evict_locked()
+        return entry
+
+
+@asynccontextmanager
+async def use_async_client(manager: dict[str, Any]) -> AsyncIterator[AsyncOEMClient]:
+    # Hold the client for the whole use (every page of a refresh, a whole NDJSON
+    # stream), so eviction in the meantime cannot close it under the request.
+    entry = _checkout(manager)
+    try:
+        yield entry.client
+    finally:
+        with _lock:
+            entry.in_use -= 1
+            entry.last_used = time.monotonic()
+
+
+def client_health(manager: dict[str, Any]) -> dict[str, Any]:
+    with _lock:
+        entry = _async_clients.get(_client_key(manager))
+    if entry is None:
+        return {"active": False}
+    return {
+        "active": True,
+        "idleSeconds": round(time.monotonic() - entry.last_used, 1),
+        "inUse": entry.in_use,
+        **entry.client.health.snapshot(),
+        "concurrency": entry.client.limiter.snapshot() if entry.client.limiter else None,
+    }
+
+
+async def _ping(manager: dict[str, Any]) -> None:
+    try:
+        async with use_async_client(manager) as client:
+            await client.ping()
+    except Exception as exc:
+        # Already recorded in client.health; the next real request will retry anyway.
+        logger.debug("Ping ao OEM %s falhou: %s", manager.get("name") or "", exc)
+
+
+async def prewarm_clients() -> None:
+    # Build a client per configured manager and open its connection up front, so the
+    # first request does not pay for client setup and the TLS handshake.
+    managers = await run_in_threadpool(load_enterprise_managers)
+    await asyncio.gather(*(_ping(manager) for manager in managers))
+
+
+def _expired_keys(pool: OrderedDict, configured: dict[_ClientKey, Any], now: float) -> list[_ClientKey]:
+    return [
+        key
+        for key, entry in pool.items()
+        if key not in configured and not entry.in_use and now - entry.last_used > OEM_CLIENT_TTL_SECONDS
+    ]
+
+
+async def maintain_clients() -> None:
+    now = time.monotonic()
+    managers = await run_in_threadpool(load_enterprise_managers)
+    configured = {_client_key(manager): manager for manager in managers}
+    with _lock:
+        # Clients of configured managers stay pinned; anything else expires when idle.
+        for key in _expired_keys(_async_clients, configured, now):
+            _retired_async_clients.append(_async_clients.pop(key))
+        # Retired clients still held by a request are closed on a later run.
+        retired_async = [entry.client for entry in _retired_async_clients if not entry.in_use]
+        _retired_async_clients[:] = [entry for entry in _retired_async_clients if entry.in_use]
+        idle = [
+            key
+            for key, entry in _async_clients.items()
+            if key in configured and key[4].keepalive and now - entry.last_used > key[4].keepalive / 2
+        ]
+        missing = [manager for key, manager in configured.items() if key not in _async_clients]
+
+    for client in retired_async:
+        await client.aclose()
+    # Ping idle pinned clients before the server drops their keep-alive connection,
+    # and warm up managers added to the config (or evicted) since the last run.
+    await asyncio.gather(
+        *(_ping(configured[key]) for key in idle),
+        *(_ping(manager) for manager in missing),
+    )
+
+
+async def run_pool_maintenance() -> None:
+    try:
+        await prewarm_clients()
+    except Exception as exc:
+        logger.warning("Falha ao preparar clientes OEM: %s", exc)
+    while True:
+        await asyncio.sleep(OEM_POOL_MAINTENANCE_SECONDS)
+        try:
+            await maintain_clients()
+        except asyncio.CancelledError:
+            raise
+        except Exception as exc:
+            logger.warning("Falha na manutencao do pool OEM: %s", exc)
 
 
-def close_all_clients() -> None:
+async def aclose_all_clients() -> None:
     with _lock:
-        for entry in _clients.values():
-            entry.client.close()
-        _clients.clear()
+        # Shutdown: requests still holding a client are being cancelled anyway.
+        clients = [entry.client for entry in [*_async_clients.values(), *_retired_async_clients]]
+        _async_clients.clear()
+        _retired_async_clients.clear()
+    for client in clients:
+        await client.aclose()
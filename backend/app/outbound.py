@@ -0,0 +1,151 @@
+from __future__ import annotations
+
+import asyncio
+import threading
+import time
+from collections import deque
+from typing import Any
+
+from .config import (
+    OEM_OUTBOUND_INITIAL_CONCURRENCY,
+    OEM_OUTBOUND_LATENCY_SPIKE_FACTOR,
+    OEM_OUTBOUND_MAX_CONCURRENCY,
+    OEM_OUTBOUND_MAX_RETRY_AFTER_SECONDS,
+    OEM_OUTBOUND_MIN_CONCURRENCY,
+)
+from .transport import TransportSettings
+
+OVERLOAD_STATUSES = frozenset({429, 500, 502, 503, 504})
+
+
+class AdaptiveLimiter:
+    # AIMD concurrency window: +1 per window of successes, halved on 429/5xx or
+    # transport errors, cut by a third on latency spikes. A Retry-After pauses new
+    # requests until it elapses. Latency baselines are kept per request kind, since a
+    # 2000-item page and a limit=1 probe take very different times.
+    def __init__(self, initial: int, minimum: int, maximum: int, latency_spike_factor: float) -> None:
+        self.minimum = max(1, minimum)
+        self.maximum = max(self.minimum, maximum)
+        self.limit = float(min(self.maximum, max(self.minimum, initial)))
+        self.latency_spike_factor = latency_spike_factor
+        self.in_flight = 0
+        self.baseline_latency: dict[str, float] = {}
+        self.blocked_until = 0.0
+        self.decreases = 0
+        self._last_decrease = 0.0
+        self._waiters: deque[asyncio.Future] = deque()
+
+    async def acquire(self) -> None:
+        while True:
+            pause = self.blocked_until - time.monotonic()
+            if pause > 0:
+                await asyncio.sleep(pause)
+                continue
+            if self.in_flight < int(self.limit):
+                self.in_flight += 1
+                return
+            waiter = asyncio.get_running_loop().create_future()
+            self._waiters.append(waiter)
+            try:
+                await waiter
+            except asyncio.CancelledError:
+                if waiter in self._waiters:
+                    self._waiters.remove(waiter)
+                elif waiter.done() and not waiter.cancelled():
+                    # Woken and cancelled before running: pass the wakeup on.
+                    self._wake()
+                raise
+
+    def release(self) -> None:
+        self.in_flight -= 1
+        self._wake()
+
+    def _wake(self) -> None:
+        free = int(self.limit) - self.in_flight
+        while free > 0 and self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                free -= 1
+
+    def _decrease(self, factor: float, baseline: float | None) -> None:
+        # One cut per baseline round trip: a burst of failures from requests already
+        # in flight must not collapse the window to the minimum.
+        now = time.monotonic()
+        if now - self._last_decrease < (baseline or 0.1):
+            return
+        self._last_decrease = now
+        self.decreases += 1
+        self.limit = max(float(self.minimum), self.limit * factor)
+
+    def record(
+        self,
+        latency: float,
+        status: int | None = None,
+        error: BaseException | None = None,
+        retry_after: str | None = None,
+        kind: str = "default",
+    ) -> None:
+        if retry_after:
+            try:
+                pause = min(OEM_OUTBOUND_MAX_RETRY_AFTER_SECONDS, max(0.0, float(retry_after)))
+            except ValueError:
+                pause = 0.0
+            self.blocked_until = max(self.blocked_until, time.monotonic() + pause)
+        baseline = self.baseline_latency.get(kind)
+        if error is not None or status in OVERLOAD_STATUSES:
+            self._decrease(0.5, baseline)
+            return
+        if baseline is not None and latency > baseline * self.latency_spike_factor:
+            self._decrease(0.67, baseline)
+        else:
+            self.limit = min(float(self.maximum), self.limit + 1.0 / self.limit)
+            self._wake()
+        self.baseline_latency[kind] = latency if baseline is None else baseline * 0.9 + latency * 0.1
+
+    def snapshot(self) -> dict[str, Any]:
+        return {
+            "limit": int(self.limit),
+            "inFlight": self.in_flight,
+            "waiting": len(self._waiters),
+            "baselineLatencyMs": {
+                kind: round(latency * 1000, 1) for kind, latency in sorted(self.baseline_latency.items())
+            },
+            "pausedSeconds": round(max(0.0, self.blocked_until - time.monotonic()), 1),
+            "decreases": self.decreases,
+        }
+
+
+_lock = threading.Lock()
+_limiters: dict[str, AdaptiveLimiter] = {}
+
+
+def _setting(manager: dict[str, Any], key: str, default: int) -> int:
+    try:
+        return int(manager.get(key) or default)
+    except (TypeError, ValueError):
+        return default
+
+
+def get_outbound_limiter(manager: dict[str, Any]) -> AdaptiveLimiter:
+    # Keyed by endpoint: every client talking to the same OEM shares one window.
+    key = str(manager.get("endpoint") or manager.get("name") or "")
+    with _lock:
+        limiter = _limiters.get(key)
+        if limiter is None:
+            # Above the connection pool size the extra requests would only queue inside
+            # httpx, and that wait would be measured as OEM latency.
+            pool_size = TransportSettings.from_manager(manager).pool_size
+            limiter = AdaptiveLimiter(
+                _setting(manager, "initial_concurrency", OEM_OUTBOUND_INITIAL_CONCURRENCY),
+                _setting(manager, "min_concurrency", OEM_OUTBOUND_MIN_CONCURRENCY),
+                min(pool_size, _setting(manager, "max_concurrency", OEM_OUTBOUND_MAX_CONCURRENCY)),
+                OEM_OUTBOUND_LATENCY_SPIKE_FACTOR,
+            )
+            _limiters[key] = limiter
+        return limiter
+
+
+def reset_outbound_limiters() -> None:
+    with _lock:
+        _limiters.clear()
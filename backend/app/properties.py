@@ -0,0 +1,27 @@
+from __future__ import annotations
+
+from typing import Any
+
+from starlette.concurrency import run_in_threadpool
+
+from . import cache
+from .config import TARGET_PROPERTIES_TTL_SECONDS
+from .oem_client import AsyncOEMClient
+
+
+async def get_target_properties(
+    endpoint_name: str,
+    client: AsyncOEMClient,
+    target_id: str,
+    refresh: bool = False,
+) -> dict[str, Any]:
+    if not refresh and TARGET_PROPERTIES_TTL_SECONDS > 0:
+        cached = await run_in_threadpool(
+            cache.get_target_properties, endpoint_name, target_id, TARGET_PROPERTIES_TTL_SECONDS
+        )
+        if cached is not None:
+            return cached
+    data = await client.get_target_properties(target_id)
+    if TARGET_PROPERTIES_TTL_SECONDS > 0:
+        await run_in_threadpool(cache.put_target_properties, endpoint_name, target_id, data)
+    return data
@@ -1,9 +1,26 @@
 from __future__ import annotations
 
+import math
 import time
+import zlib
+from collections import OrderedDict
+from contextvars import ContextVar
 from threading import Lock
+from typing import Any
 
-from .config import BACKEND_RATE_LIMIT_MAX, BACKEND_RATE_LIMIT_WINDOW_SECONDS
+from starlette.concurrency import run_in_threadpool
+
+from . import cache
+from .config import (
+    BACKEND_RATE_LIMIT_MAX,
+    BACKEND_RATE_LIMIT_WINDOW_SECONDS,
+    RATE_LIMIT_OEM_CALL_COST,
+    RATE_LIMIT_MAX_BUCKETS,
+    RATE_LIMIT_SHARDS,
+    SHARED_STATE_BACKEND,
+)
+
+_SWEEP_EVERY = 256
 
 
 class _TokenBucket:
@@ -12,6 +29,8 @@ class _TokenBucket:
         self.refill_rate = max(0.001, refill_rate)
         self.tokens = float(self.capacity)
         self.updated_at = time.monotonic()
+        self.allowed = 0
+        self.denied = 0
 
     def consume(self, tokens: float = 1.0) -> tuple[bool, float]:
         now = time.monotonic()
@@ -21,27 +40,228 @@ class _TokenBucket:
             self.updated_at = now
         if self.tokens >= tokens:
             self.tokens -= tokens
+            self.allowed += 1
             return True, 0.0
+        self.denied += 1
         needed = tokens - self.tokens
         retry_after = needed / self.refill_rate if self.refill_rate > 0 else 0.0
         return False, retry_after
 
+    def is_full(self, now: float) -> bool:
+        # A bucket that has refilled completely behaves like a new one and can be dropped.
+        return self.tokens + (now - self.updated_at) * self.refill_rate >= self.capacity
+
+    def full_at(self) -> float:
+        return self.updated_at + max(0.0, self.capacity - self.tokens) / self.refill_rate
+
+
+class _Shard:
+    def __init__(self, capacity: int, refill_rate: float) -> None:
+        self.lock = Lock()
+        self.buckets: OrderedDict[str, _TokenBucket] = OrderedDict()
+        # Shared by new keys while the shard is full of buckets that still owe tokens.
+        self.overflow = _TokenBucket(capacity, refill_rate)
+        self.operations = 0
+        self.evicted = 0
+        # No bucket can be full before this time, so a full-shard scan is pointless.
+        self.next_full_at = 0.0
+
 
 class RateLimiter:
-    def __init__(self, max_requests: int, window_seconds: int) -> None:
+    # Buckets are spread over lock-striped shards, each capped at its share of
+    # max_buckets, so unbounded client-supplied keys cannot grow memory or serialize
+    # every request on one lock. Only full buckets are ever evicted: dropping one that
+    # still owes tokens would hand its key a fresh budget.
+    blocking = False
+    def __init__(
+        self,
+        max_requests: int,
+        window_seconds: int,
+        max_buckets: int = RATE_LIMIT_MAX_BUCKETS,
+        shards: int = RATE_LIMIT_SHARDS,
+    ) -> None:
         self.capacity = max(1, max_requests)
         self.window_seconds = max(1, window_seconds)
         self.refill_rate = self.capacity / self.window_seconds
-        self._lock = Lock()
-        self._buckets: dict[str, _TokenBucket] = {}
+        self._shards = [_Shard(self.capacity, self.refill_rate) for _ in range(max(1, shards))]
+        self._shard_cap = max(1, math.ceil(max(1, max_buckets) / len(self._shards)))
+
+    def _shard(self, key: str) -> _Shard:
+        return self._shards[zlib.crc32(key.encode("utf-8")) % len(self._shards)]
 
     def allow(self, key: str, tokens: float = 1.0) -> tuple[bool, float]:
-        with self._lock:
-            bucket = self._buckets.get(key)
+        shard = self._shard(key)
+        with shard.lock:
+            shard.operations += 1
+            if shard.operations % _SWEEP_EVERY == 0:
+                self._sweep_locked(shard, time.monotonic())
+            bucket = shard.buckets.get(key)
             if bucket is None:
+                if len(shard.buckets) >= self._shard_cap:
+                    self._evict_full_locked(shard, time.monotonic())
+                if len(shard.buckets) >= self._shard_cap:
+                    return shard.overflow.consume(tokens)
                 bucket = _TokenBucket(self.capacity, self.refill_rate)
-                self._buckets[key] = bucket
-            return bucket.consume(tokens)
+                shard.buckets[key] = bucket
+            else:
+                shard.buckets.move_to_end(key)
+            result = bucket.consume(tokens)
+            shard.next_full_at = min(shard.next_full_at, bucket.full_at())
+            return result
+
+    def adjust(self, key: str, tokens: float) -> None:
+        # Positive refunds, negative charges extra; the balance may go into debt down
+        # to -capacity so an underestimated request slows down the next ones.
+        shard = self._shard(key)
+        with shard.lock:
+            bucket = shard.buckets.get(key, shard.overflow)
+            bucket.tokens = max(-bucket.capacity, min(bucket.capacity, bucket.tokens + tokens))
+            shard.next_full_at = min(shard.next_full_at, bucket.full_at())
+
+    def _evict_full_locked(self, shard: _Shard, now: float) -> None:
+        # At the cap the whole shard is scanned, not just its LRU end.
+        if now < shard.next_full_at:
+            return
+        for key in [key for key, bucket in shard.buckets.items() if bucket.is_full(now)]:
+            del shard.buckets[key]
+            shard.evicted += 1
+        shard.next_full_at = min((bucket.full_at() for bucket in shard.buckets.values()), default=now)
+
+    def _sweep_locked(self, shard: _Shard, now: float) -> None:
+        # Oldest first; stop at the first bucket that still carries a debt.
+        while shard.buckets:
+            key, bucket = next(iter(shard.buckets.items()))
+            if not bucket.is_full(now):
+                break
+            del shard.buckets[key]
+            shard.evicted += 1
+
+    def snapshot(self, top: int = 20) -> dict[str, Any]:
+        buckets: list[tuple[str, _TokenBucket]] = []
+        evicted = overflow_allowed = overflow_denied = 0
+        for shard in self._shards:
+            with shard.lock:
+                buckets.extend(shard.buckets.items())
+                evicted += shard.evicted
+                overflow_allowed += shard.overflow.allowed
+                overflow_denied += shard.overflow.denied
+        buckets.sort(key=lambda item: (item[1].denied, item[1].allowed), reverse=True)
+        return {
+            "backend": "memory",
+            "buckets": len(buckets),
+            "maxBuckets": self._shard_cap * len(self._shards),
+            "evicted": evicted,
+            "overflow": {"allowed": overflow_allowed, "denied": overflow_denied},
+            "keys": [
+                {"key": key, "allowed": bucket.allowed, "denied": bucket.denied}
+                for key, bucket in buckets[:top]
+            ],
+        }
+
+
+class SharedRateLimiter(RateLimiter):
+    # Every call is a SQLite write that may wait on another worker's lock.
+    blocking = True
+
+    def __init__(self, max_requests: int, window_seconds: int) -> None:
+        super().__init__(max_requests, window_seconds)
+        self._operations = 0
+
+    def allow(self, key: str, tokens: float = 1.0) -> tuple[bool, float]:
+        self._operations += 1
+        if self._operations % _SWEEP_EVERY == 0:
+            # Two idle windows refill even a bucket at its maximum debt, so it is disposable.
+            cache.prune_shared_tokens(2 * self.window_seconds)
+        return cache.consume_shared_tokens(key, tokens, self.capacity, self.refill_rate)
+
+    def adjust(self, key: str, tokens: float) -> None:
+        cache.adjust_shared_tokens(key, tokens, self.capacity)
+
+    def snapshot(self, top: int = 20) -> dict[str, Any]:
+        return {
+            "backend": "sqlite",
+            "buckets": cache.count_shared_tokens(),
+            "keys": cache.top_shared_tokens(top),
+        }
+
+
+def _build_rate_limiter() -> RateLimiter:
+    if SHARED_STATE_BACKEND == "sqlite":
+        return SharedRateLimiter(BACKEND_RATE_LIMIT_MAX, BACKEND_RATE_LIMIT_WINDOW_SECONDS)
+    return RateLimiter(BACKEND_RATE_LIMIT_MAX, BACKEND_RATE_LIMIT_WINDOW_SECONDS)
+
+
+route_rate_limiter = _build_rate_limiter()
+
+
+async def _call_limiter(method: Any, *args: Any) -> Any:
+    # Keeps the event loop free while a shared limiter waits for the database.
+    if route_rate_limiter.blocking:
+        return await run_in_threadpool(method, *args)
+    return method(*args)
+
+
+class RequestCost:
+    # What a request was charged up front and how many OEM calls it actually made.
+    def __init__(self) -> None:
+        self.oem_calls = 0
+        self.key: str | None = None
+        self.base = 0.0
+        self.charged = 0.0
+        self.estimated_calls = 0
+        self.continues = False
+
+    async def charge(self, key: str, base: float, estimated_calls: int) -> tuple[bool, float]:
+        tokens = min(route_rate_limiter.capacity, base + max(0, estimated_calls) * RATE_LIMIT_OEM_CALL_COST)
+        allowed, retry_after = await _call_limiter(route_rate_limiter.allow, key, tokens)
+        if allowed:
+            self.key, self.base, self.charged = key, base, tokens
+            self.estimated_calls = max(0, estimated_calls)
+        return allowed, retry_after
+
+    def continue_in_background(self) -> None:
+        # The work outlives the response, so calls made later cannot be counted: keep
+        # at least the estimate.
+        self.continues = True
+
+    async def settle(self) -> None:
+        if self.key is None:
+            return
+        calls = max(self.oem_calls, self.estimated_calls) if self.continues else self.oem_calls
+        actual = min(route_rate_limiter.capacity, self.base + calls * RATE_LIMIT_OEM_CALL_COST)
+        if actual != self.charged:
+            await _call_limiter(route_rate_limiter.adjust, self.key, self.charged - actual)
+        self.key = None
+
+
+_request_cost: ContextVar[RequestCost | None] = ContextVar("request_cost", default=None)
+
+
+def current_request_cost() -> RequestCost | None:
+    return _request_cost.get()
+
+
+def record_oem_call() -> None:
+    # Tasks and threadpool calls copy the context, so fan-out calls land on the
+    # request that scheduled them.
+    cost = _request_cost.get()
+    if cost is not None:
+        cost.oem_calls += 1
+
 
+class RequestCostMiddleware:
+    # Pure ASGI: settles the charge after the response, streaming bodies included.
+    def __init__(self, app: Any) -> None:
+        self.app = app
 
-route_rate_limiter = RateLimiter(BACKEND_RATE_LIMIT_MAX, BACKEND_RATE_LIMIT_WINDOW_SECONDS)
+    async def __call__(self, scope: dict[str, Any], receive: Any, send: Any) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        cost = RequestCost()
+        token = _request_cost.set(cost)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            _request_cost.reset(token)
+            await cost.settle()
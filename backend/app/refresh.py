@@ -0,0 +1,221 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import socket
+from typing import Any, Callable
+
+from starlette.concurrency import run_in_threadpool
+
+from . import cache
+from .config import (
+    REFRESH_JOB_HISTORY,
+    REFRESH_JOB_STALE_SECONDS,
+    TARGET_REFRESH_CHECK_SECONDS,
+    TARGET_REFRESH_FAILURE_BACKOFF_MAX_SECONDS,
+    TARGET_REFRESH_FAILURE_BACKOFF_SECONDS,
+    TARGET_REFRESH_MAX_AGE_SECONDS,
+)
+from .oem_pool import use_async_client
+from .storage import load_enterprise_managers
+
+logger = logging.getLogger(__name__)
+
+# Running refresh per endpoint in this process: (job id, task).
+_jobs: dict[str, tuple[int, asyncio.Task]] = {}
+_start_lock: asyncio.Lock | None = None
+# Identifies this worker when several processes share the cache DB.
+_LEASE_OWNER = f"{socket.gethostname()}:{os.getpid()}"
+_LEASE_ATTEMPTS = 8
+_FOLLOW_INTERVAL_SECONDS = 1.0
+
+
+def _lease_name(endpoint_name: str) -> str:
+    return f"refresh:{endpoint_name}"
+
+
+def _normalize_target(item: dict[str, Any]) -> dict[str, Any]:
+    return {
+        "id": item.get("targetId") or item.get("id"),
+        "name": item.get("name"),
+        "typeName": item.get("type") or item.get("typeName"),
+        "displayName": item.get("displayName") or item.get("name"),
+    }
+
+
+async def refresh_endpoint(
+    endpoint_name: str,
+    manager: dict[str, Any],
+    on_page: Callable[[int, int], None] | None = None,
+) -> dict[str, int]:
+    staging = await run_in_threadpool(cache.TargetStaging, endpoint_name)
+    pages = 0
+    rows = 0
+    try:
+        async with use_async_client(manager) as client:
+            async for page in client.iter_target_pages():
+                normalized = [_normalize_target(item) for item in page]
+                rows += await run_in_threadpool(staging.add, normalized)
+                pages += 1
+                if on_page:
+                    await run_in_threadpool(on_page, pages, rows)
+        return await run_in_threadpool(staging.apply)
+    finally:
+        await run_in_threadpool(staging.close)
+
+
+async def _run_refresh_job(job_id: int, endpoint_name: str, manager: dict[str, Any]) -> dict[str, int]:
+    def on_page(pages: int, rows: int) -> None:
+        cache.update_refresh_job_progress(job_id, pages, rows)
+        # A long refresh must not outlive its scheduler lease, or another worker would
+        # start a duplicate download and fail this job as stale.
+        cache.renew_lease(_lease_name(endpoint_name), _LEASE_OWNER, REFRESH_JOB_STALE_SECONDS)
+
+    try:
+        try:
+            changes = await refresh_endpoint(endpoint_name, manager, on_page)
+        except asyncio.CancelledError:
+            await run_in_threadpool(cache.finish_refresh_job, job_id, None, "Refresh cancelado")
+            raise
+        except Exception as exc:
+            await run_in_threadpool(cache.finish_refresh_job, job_id, None, str(exc) or type(exc).__name__)
+            raise
+        await run_in_threadpool(cache.finish_refresh_job, job_id, changes)
+        return changes
+    finally:
+        # Released only once the job row is final, so other workers never see neither.
+        await run_in_threadpool(cache.release_lease, _lease_name(endpoint_name), _LEASE_OWNER)
+
+
+async def _follow_refresh_job(job_id: int) -> dict[str, Any]:
+    # Stands in for a job running on another worker, so callers here can wait on it.
+    polls = 0
+    while True:
+        job = await run_in_threadpool(cache.get_refresh_job, job_id)
+        if job is None or job["status"] != "running":
+            break
+        polls += 1
+        if polls % 30 == 0:
+            # Notices a job whose worker died, so the wait cannot last forever.
+            await run_in_threadpool(cache.fail_stale_refresh_jobs, REFRESH_JOB_STALE_SECONDS)
+        await asyncio.sleep(_FOLLOW_INTERVAL_SECONDS)
+    if job is None or job["status"] == "error":
+        raise RuntimeError((job or {}).get("error") or "Refresh interrompido")
+    return job
+
+
+async def _acquire_refresh_lease(endpoint_name: str) -> tuple[bool, dict[str, Any] | None]:
+    # The scheduler holds the lease for a moment before it creates its job row, so a
+    # held lease without a running row is retried briefly before giving up on it.
+    for attempt in range(_LEASE_ATTEMPTS):
+        if await run_in_threadpool(cache.acquire_lease, _lease_name(endpoint_name), _LEASE_OWNER, REFRESH_JOB_STALE_SECONDS):
+            return True, None
+        running = await run_in_threadpool(cache.get_running_refresh_job, endpoint_name)
+        if running:
+            return False, running
+        await asyncio.sleep(_FOLLOW_INTERVAL_SECONDS / 4)
+    return False, None
+
+
+def _forget_job(endpoint_name: str, task: asyncio.Task) -> None:
+    current = _jobs.get(endpoint_name)
+    if current and current[1] is task:
+        del _jobs[endpoint_name]
+    if not task.cancelled():
+        task.exception()
+
+
+async def start_refresh_job(endpoint_name: str, manager: dict[str, Any]) -> tuple[int, asyncio.Task, bool]:
+    # A refresh already running for the endpoint, here or on another worker sharing the
+    # cache DB, is joined instead of duplicated. The flag tells whether this call
+    # started the download.
+    global _start_lock
+    if _start_lock is None:
+        _start_lock = asyncio.Lock()
+    async with _start_lock:
+        running = _jobs.get(endpoint_name)
+        if running:
+            return (*running, False)
+        await run_in_threadpool(cache.fail_stale_refresh_jobs, REFRESH_JOB_STALE_SECONDS)
+        leased, remote = await _acquire_refresh_lease(endpoint_name)
+        if remote:
+            job_id = remote["id"]
+            task = asyncio.create_task(_follow_refresh_job(job_id))
+            started = False
+        else:
+            if not leased:
+                logger.warning("Lease de refresh de %s ocupado sem job ativo; iniciando mesmo assim", endpoint_name)
+            job_id = await run_in_threadpool(cache.create_refresh_job, endpoint_name, REFRESH_JOB_HISTORY)
+            task = asyncio.create_task(_run_refresh_job(job_id, endpoint_name, manager))
+            started = True
+        task.add_done_callback(lambda done: _forget_job(endpoint_name, done))
+        _jobs[endpoint_name] = (job_id, task)
+        return job_id, task, started
+
+
+async def cancel_refresh_jobs() -> None:
+    global _start_lock
+    tasks = [task for _, task in _jobs.values()]
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    _jobs.clear()
+    _start_lock = None
+
+
+def _max_age_seconds(manager: dict[str, Any]) -> int:
+    try:
+        return int(manager.get("refresh_max_age") or TARGET_REFRESH_MAX_AGE_SECONDS)
+    except (TypeError, ValueError):
+        return TARGET_REFRESH_MAX_AGE_SECONDS
+
+
+def _failure_backoff_seconds(failures: int) -> float:
+    # Doubles with each consecutive failure so an unreachable OEM is not hammered.
+    if failures <= 0 or TARGET_REFRESH_FAILURE_BACKOFF_SECONDS <= 0:
+        return 0.0
+    return min(
+        float(TARGET_REFRESH_FAILURE_BACKOFF_MAX_SECONDS),
+        TARGET_REFRESH_FAILURE_BACKOFF_SECONDS * 2.0 ** min(failures - 1, 30),
+    )
+
+
+async def refresh_stale_endpoints() -> None:
+    managers = await run_in_threadpool(load_enterprise_managers)
+    for manager in managers:
+        name = manager.get("name")
+        if not name:
+            continue
+        # Every worker runs this scheduler; the lease lets only one of them check and
+        # refresh an endpoint at a time.
+        lease = _lease_name(name)
+        if not await run_in_threadpool(cache.acquire_lease, lease, _LEASE_OWNER, REFRESH_JOB_STALE_SECONDS):
+            continue
+        try:
+            stats = await run_in_threadpool(cache.get_refresh_stats, name)
+            age = (stats or {}).get("ageSeconds")
+            if age is not None and age < _max_age_seconds(manager):
+                continue
+            failures, failed_ago = await run_in_threadpool(cache.get_refresh_failures, name)
+            if failed_ago is not None and failed_ago < _failure_backoff_seconds(failures):
+                continue
+            _, task, _ = await start_refresh_job(name, manager)
+            changes = await asyncio.shield(task)
+        except Exception as exc:
+            logger.warning("Falha ao atualizar cache de targets de %s: %s", name, exc)
+            continue
+        finally:
+            await run_in_threadpool(cache.release_lease, lease, _LEASE_OWNER)
+        logger.info("Cache de targets de %s atualizado: %s", name, changes)
+
+
+async def run_refresh_scheduler() -> None:
+    while True:
+        try:
+            await refresh_stale_endpoints()
+        except asyncio.CancelledError:
+            raise
+        except Exception as exc:
+            logger.warning("Falha no agendador de refresh: %s", exc)
+        await asyncio.sleep(TARGET_REFRESH_CHECK_SECONDS)
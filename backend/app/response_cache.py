@@ -0,0 +1,144 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Hashable
+
+from starlette.concurrency import run_in_threadpool
+
+from . import cache
+from .config import (
+    RESPONSE_CACHE_MAX_BYTES,
+    RESPONSE_CACHE_MAX_ENTRIES,
+    RESPONSE_CACHE_MAX_ENTRY_BYTES,
+    RESPONSE_CACHE_STALE_SECONDS,
+    RESPONSE_CACHE_TTL_SECONDS,
+    SHARED_STATE_BACKEND,
+)
+
+
+@dataclass
+class _Entry:
+    value: Any
+    stored_at: float
+    size: int
+
+
+class ResponseCache:
+    # Bounded by entry count and by total JSON-encoded size; responses larger than
+    # max_entry_bytes are returned but never cached.
+    def __init__(
+        self,
+        max_entries: int,
+        ttl_seconds: float,
+        stale_seconds: float,
+        shared: bool = False,
+        max_bytes: int = RESPONSE_CACHE_MAX_BYTES,
+        max_entry_bytes: int = RESPONSE_CACHE_MAX_ENTRY_BYTES,
+    ) -> None:
+        self.max_entries = max(1, max_entries)
+        self.max_bytes = max(1, max_bytes)
+        self.max_entry_bytes = max(0, min(self.max_bytes, max_entry_bytes))
+        self.ttl_seconds = max(0.0, ttl_seconds)
+        self.stale_seconds = max(0.0, stale_seconds)
+        # shared: results are also written to the cache DB so other workers reuse them.
+        self.shared = shared
+        self._entries: OrderedDict[Hashable, _Entry] = OrderedDict()
+        self._bytes = 0
+        self._inflight: dict[Hashable, asyncio.Task] = {}
+
+    async def get_or_fetch(self, key: Hashable, fetch: Callable[[], Awaitable[Any]]) -> Any:
+        entry = self._entries.get(key)
+        if entry is None and self.shared:
+            entry = await self._load_shared(key, self.ttl_seconds + self.stale_seconds)
+        if entry is not None:
+            age = time.monotonic() - entry.stored_at
+            if age < self.ttl_seconds:
+                self._entries.move_to_end(key)
+                return entry.value
+            if age < self.ttl_seconds + self.stale_seconds:
+                # Stale-while-revalidate: answer now, refresh once in the background.
+                self._entries.move_to_end(key)
+                self._start_fetch(key, fetch)
+                return entry.value
+        # shield: a cancelled caller must not cancel the fetch other callers share.
+        return await asyncio.shield(self._start_fetch(key, fetch))
+
+    def _start_fetch(self, key: Hashable, fetch: Callable[[], Awaitable[Any]]) -> asyncio.Task:
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self._fetch_and_store(key, fetch))
+            self._inflight[key] = task
+            task.add_done_callback(lambda done: self._finish(key, done))
+        return task
+
+    async def _fetch_and_store(self, key: Hashable, fetch: Callable[[], Awaitable[Any]]) -> Any:
+        if self.shared:
+            # Another worker may have refreshed it already.
+            entry = await self._load_shared(key, self.ttl_seconds)
+            if entry is not None:
+                return entry.value
+        value = await fetch()
+        if self.ttl_seconds > 0 or self.stale_seconds > 0:
+            payload = await run_in_threadpool(json.dumps, value)
+            if len(payload) > self.max_entry_bytes:
+                return value
+            self._store(key, _Entry(value=value, stored_at=time.monotonic(), size=len(payload)))
+            if self.shared:
+                await run_in_threadpool(
+                    cache.put_shared_response,
+                    self._shared_key(key),
+                    payload,
+                    self.ttl_seconds + self.stale_seconds,
+                )
+        return value
+
+    def _store(self, key: Hashable, entry: _Entry) -> None:
+        previous = self._entries.pop(key, None)
+        if previous is not None:
+            self._bytes -= previous.size
+        self._entries[key] = entry
+        self._bytes += entry.size
+        while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self._bytes -= evicted.size
+
+    @staticmethod
+    def _shared_key(key: Hashable) -> str:
+        return json.dumps(key, default=str)
+
+    async def _load_shared(self, key: Hashable, max_age: float) -> _Entry | None:
+        if max_age <= 0:
+            return None
+        found = await run_in_threadpool(cache.get_shared_response, self._shared_key(key), max_age)
+        if found is None:
+            return None
+        value, age, size = found
+        entry = _Entry(value=value, stored_at=time.monotonic() - age, size=size)
+        self._store(key, entry)
+        return entry
+
+    def _finish(self, key: Hashable, task: asyncio.Task) -> None:
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        if not task.cancelled():
+            # Retrieve the exception so background revalidations never log it as unhandled.
+            task.exception()
+
+    def clear(self) -> None:
+        for task in self._inflight.values():
+            task.cancel()
+        self._inflight.clear()
+        self._entries.clear()
+        self._bytes = 0
+
+
+oem_response_cache = ResponseCache(
+    RESPONSE_CACHE_MAX_ENTRIES,
+    RESPONSE_CACHE_TTL_SECONDS,
+    RESPONSE_CACHE_STALE_SECONDS,
+    shared=SHARED_STATE_BACKEND == "sqlite",
+)
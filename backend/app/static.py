@@ -1,19 +1,142 @@
 from __future__ import annotations
 
+import gzip
+import hashlib
+import mimetypes
+import re
+from dataclasses import dataclass
 from pathlib import Path
 
 from fastapi.responses import FileResponse, Response
 from fastapi.staticfiles import StaticFiles
+from starlette.exceptions import HTTPException
+
+# Vite emits content-hashed names (index-C8iKm3hD.js): a new build gets new URLs.
+_HASHED_ASSET = re.compile(r"(^|/)assets/.+-[A-Za-z0-9_-]{8,}\.[A-Za-z0-9]+$")
+_COMPRESSIBLE = {".js", ".mjs", ".css", ".html", ".svg", ".json", ".map", ".txt", ".xml"}
+_MIN_GZIP_BYTES = 1024
+_MAX_CACHED_BYTES = 8 * 1024 * 1024
+
+
+@dataclass(frozen=True)
+class _Asset:
+    body: bytes
+    gzip_body: bytes | None
+    etag: str
+    media_type: str
+    cache_control: str
+
+
+def _load_asset(path: Path, relative: str) -> _Asset:
+    body = path.read_bytes()
+    gzip_body = None
+    if path.suffix.lower() in _COMPRESSIBLE and len(body) >= _MIN_GZIP_BYTES:
+        # mtime=0 keeps the gzip bytes (and so the ETag) identical across restarts.
+        compressed = gzip.compress(body, compresslevel=9, mtime=0)
+        if len(compressed) < len(body):
+            gzip_body = compressed
+    if _HASHED_ASSET.search(relative):
+        cache_control = "public, max-age=31536000, immutable"
+    else:
+        # index.html and friends keep their URL across builds: always revalidate.
+        cache_control = "no-cache"
+    return _Asset(
+        body=body,
+        gzip_body=gzip_body,
+        etag=hashlib.sha256(body).hexdigest()[:32],
+        media_type=mimetypes.guess_type(path.name)[0] or "application/octet-stream",
+        cache_control=cache_control,
+    )
+
+
+def _accepts_gzip(accept_encoding: str) -> bool:
+    for part in accept_encoding.split(","):
+        coding, _, params = part.strip().partition(";")
+        if coding.strip().lower() not in {"gzip", "*"}:
+            continue
+        quality = params.strip()
+        if quality.startswith("q="):
+            try:
+                return float(quality[2:]) > 0
+            except ValueError:
+                return False
+        return True
+    return False
+
+
+def _etag_matches(if_none_match: str, etag: str) -> bool:
+    # If-None-Match uses the weak comparison, so W/ prefixes are ignored.
+    candidates = {value.strip().removeprefix("W/") for value in if_none_match.split(",")}
+    return "*" in candidates or etag in candidates
+
+
+def _is_client_route(relative: str) -> bool:
+    # Routes of the SPA have no file extension and never live under /api.
+    return relative != "api" and not relative.startswith("api/") and "." not in relative.rsplit("/", 1)[-1]
 
 
 class SPAStaticFiles(StaticFiles):
+    # The built bundle is read once at startup: every file is served from memory with
+    # a strong ETag, and text assets also get a precompressed gzip variant. Files that
+    # appear after startup still go through StaticFiles.
     def __init__(self, directory: str | Path, **kwargs):
         super().__init__(directory=directory, **kwargs)
-        self._index = Path(directory) / "index.html"
+        root = Path(directory)
+        self._assets: dict[str, _Asset] = {}
+        for path in root.rglob("*"):
+            if path.is_file() and path.stat().st_size <= _MAX_CACHED_BYTES:
+                relative = path.relative_to(root).as_posix()
+                self._assets[relative] = _load_asset(path, relative)
+        self._index = root / "index.html"
+        self._index_asset = self._assets.get("index.html")
 
     async def get_response(self, path: str, scope) -> Response:
-        response = await super().get_response(path, scope)
-        if response.status_code == 404:
-            if self._index.exists():
-                return FileResponse(self._index)
+        if scope["method"] not in ("GET", "HEAD"):
+            raise HTTPException(status_code=405)
+        # StaticFiles hands over a normalized OS path, "." for the root.
+        relative = "index.html" if path in ("", ".") else Path(path).as_posix()
+        asset = self._assets.get(relative)
+        client_route = _is_client_route(relative)
+        if asset is None and client_route and self._index_asset is not None:
+            # Client-side route: answer with the SPA shell without touching the disk.
+            asset = self._index_asset
+        if asset is not None:
+            return self._asset_response(asset, scope)
+
+        try:
+            response = await super().get_response(path, scope)
+        except HTTPException as exc:
+            # Recent Starlette raises the 404 instead of returning it.
+            if exc.status_code != 404:
+                raise
+            response = Response(status_code=404)
+        if response.status_code == 404 and client_route and self._index.exists():
+            # Missing files and unknown API paths stay 404 instead of getting the shell.
+            return FileResponse(self._index)
         return response
+
+    def _asset_response(self, asset: _Asset, scope) -> Response:
+        headers = {
+            name.decode("latin-1").lower(): value.decode("latin-1")
+            for name, value in scope.get("headers", [])
+            if name.lower() in (b"accept-encoding", b"if-none-match")
+        }
+        body = asset.body
+        etag = f'"{asset.etag}"'
+        response_headers = {"Cache-Control": asset.cache_control}
+        if asset.gzip_body is not None:
+            response_headers["Vary"] = "Accept-Encoding"
+            if _accepts_gzip(headers.get("accept-encoding", "")):
+                body = asset.gzip_body
+                # Each representation needs its own strong ETag.
+                etag = f'"{asset.etag}-gzip"'
+                response_headers["Content-Encoding"] = "gzip"
+        response_headers["ETag"] = etag
+
+        if _etag_matches(headers.get("if-none-match", ""), etag):
+            response_headers.pop("Content-Encoding", None)
+            return Response(status_code=304, headers=response_headers)
+        if scope["method"] == "HEAD":
+            response_headers["Content-Length"] = str(len(body))
+            return Response(headers=response_headers, media_type=asset.media_type)
+        return Response(content=body, headers=response_headers, media_type=asset.media_type)
@@ -1,13 +1,45 @@
 from __future__ import annotations
 
+import hashlib
+import os
+import re
+import shutil
+import tempfile
+import threading
+from dataclasses import dataclass, field
 from pathlib import Path
-from typing import Any
+from typing import Any, Callable
 
 import yaml
 
-from .config import ENTERPRISE_MANAGERS_FILE, METRICS_YAML, TARGETS_YAML
+from . import cache
+from .config import (
+    ENTERPRISE_MANAGERS_FILE,
+    METRICS_YAML,
+    TARGETS_SITES_DIR,
+    TARGETS_STORAGE_MODE,
+    TARGETS_YAML,
+)
 from .utils import ensure_required_tags
 
+# libyaml bindings parse several times faster when PyYAML was built with them.
+_YamlLoader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+_YamlDumper = getattr(yaml, "CSafeDumper", yaml.SafeDumper)
+
+_SITE_FILE_RE = re.compile(r"[^A-Za-z0-9_.-]")
+
+
+@dataclass
+class _CachedDocument:
+    signature: tuple[int, int] | None
+    data: Any
+    by_name: dict[str, dict[str, Any]] = field(default_factory=dict)
+
+
+_documents_lock = threading.Lock()
+_documents: dict[Path, _CachedDocument] = {}
+_shards_lock = threading.Lock()
+
 
 def _read_yaml(path: Path) -> Any:
     if not path.exists():
@@ -15,19 +47,66 @@ def _read_yaml(path: Path) -> Any:
     content = path.read_text(encoding="utf-8").strip()
     if not content:
         return []
-    data = yaml.safe_load(content)
+    data = yaml.load(content, Loader=_YamlLoader)
     return data if data is not None else []
 
 
 def _write_yaml(path: Path, data: Any) -> None:
-    path.write_text(
-        yaml.safe_dump(data, sort_keys=False, allow_unicode=False),
-        encoding="utf-8",
-    )
+    content = yaml.dump(data, Dumper=_YamlDumper, sort_keys=False, allow_unicode=False)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    # Write to a temp file in the same directory and rename over the target, so a
+    # crash mid-write never leaves a truncated config behind.
+    fd, tmp_name = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as handle:
+            handle.write(content)
+            handle.flush()
+            os.fsync(handle.fileno())
+        os.chmod(tmp_name, path.stat().st_mode & 0o777 if path.exists() else 0o644)
+        os.replace(tmp_name, path)
+    except BaseException:
+        if os.path.exists(tmp_name):
+            os.unlink(tmp_name)
+        raise
+    invalidate_config_cache(path)
 
 
-def load_enterprise_managers() -> list[dict[str, Any]]:
-    data = _read_yaml(ENTERPRISE_MANAGERS_FILE)
+def _file_signature(path: Path) -> tuple[int, int] | None:
+    try:
+        stat = path.stat()
+    except FileNotFoundError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
+def _load_cached(path: Path, normalize: Callable[[Any], Any]) -> _CachedDocument:
+    # Parsed documents are shared between requests and must be treated as read-only;
+    # they are re-parsed only when the file's mtime or size changes.
+    signature = _file_signature(path)
+    cached = _documents.get(path)
+    if cached is not None and cached.signature == signature:
+        return cached
+    data = normalize(_read_yaml(path))
+    by_name: dict[str, dict[str, Any]] = {}
+    if isinstance(data, list):
+        for item in data:
+            if isinstance(item, dict) and item.get("name") is not None:
+                by_name.setdefault(item["name"], item)
+    document = _CachedDocument(signature, data, by_name)
+    with _documents_lock:
+        _documents[path] = document
+    return document
+
+
+def invalidate_config_cache(path: Path | None = None) -> None:
+    with _documents_lock:
+        if path is None:
+            _documents.clear()
+        else:
+            _documents.pop(path, None)
+
+
+def _as_list(data: Any) -> list[dict[str, Any]]:
     if not data:
         return []
     if isinstance(data, dict):
@@ -37,40 +116,89 @@ def load_enterprise_managers() -> list[dict[str, Any]]:
     return data
 
 
+def _as_dict(data: Any) -> dict[str, Any]:
+    if not data or not isinstance(data, dict):
+        return {}
+    return data
+
+
+def load_enterprise_managers() -> list[dict[str, Any]]:
+    return _load_cached(ENTERPRISE_MANAGERS_FILE, _as_list).data
+
+
 def get_enterprise_manager(name: str) -> dict[str, Any] | None:
-    for item in load_enterprise_managers():
-        if item.get("name") == name:
-            return item
-    return None
+    return _load_cached(ENTERPRISE_MANAGERS_FILE, _as_list).by_name.get(name)
+
+
+def _sharded() -> bool:
+    return TARGETS_STORAGE_MODE == "sharded"
+
+
+def _site_path(endpoint_name: str) -> Path:
+    # The sanitized name keeps files readable; the hash of the raw name keeps names
+    # that sanitize alike ("new site", "new_site") in separate files.
+    digest = hashlib.sha1(endpoint_name.encode("utf-8")).hexdigest()[:8]
+    return TARGETS_SITES_DIR / f"{_SITE_FILE_RE.sub('_', endpoint_name)}-{digest}.yaml"
+
+
+def _ensure_site_shards() -> None:
+    # The first use of sharded mode splits the existing targets.yaml, one file per site.
+    if TARGETS_SITES_DIR.exists():
+        return
+    with _shards_lock:
+        if TARGETS_SITES_DIR.exists():
+            return
+        # Each process stages into its own directory; if another worker publishes its
+        # split first, ours (built from the same targets.yaml) is simply discarded.
+        TARGETS_SITES_DIR.parent.mkdir(parents=True, exist_ok=True)
+        staging_dir = Path(tempfile.mkdtemp(dir=TARGETS_SITES_DIR.parent, prefix=f".{TARGETS_SITES_DIR.name}."))
+        try:
+            for site in _as_list(_read_yaml(TARGETS_YAML)):
+                if isinstance(site, dict) and site.get("name"):
+                    _write_yaml(staging_dir / _site_path(site["name"]).name, site)
+            try:
+                os.replace(staging_dir, TARGETS_SITES_DIR)
+            except OSError:
+                if not TARGETS_SITES_DIR.exists():
+                    raise
+        finally:
+            shutil.rmtree(staging_dir, ignore_errors=True)
+
+
+def _check_site_file(path: Path, endpoint_name: str) -> None:
+    stored = _load_cached(path, _as_dict).data
+    if stored and stored.get("name") != endpoint_name:
+        raise SiteFileConflictError(path, stored.get("name"))
 
 
 def load_targets_config() -> list[dict[str, Any]]:
-    data = _read_yaml(TARGETS_YAML)
-    if not data:
-        return []
-    if isinstance(data, dict):
-        return [data]
-    if not isinstance(data, list):
-        return []
-    return data
+    if not _sharded():
+        return _load_cached(TARGETS_YAML, _as_list).data
+    _ensure_site_shards()
+    sites = []
+    for path in sorted(TARGETS_SITES_DIR.glob("*.yaml")):
+        site = _load_cached(path, _as_dict).data
+        if site:
+            sites.append(site)
+    return sites
 
 
 def get_site_config(endpoint_name: str) -> dict[str, Any] | None:
-    for site in load_targets_config():
-        if site.get("name") == endpoint_name:
-            return site
-    return None
+    if not _sharded():
+        return _load_cached(TARGETS_YAML, _as_list).by_name.get(endpoint_name)
+    _ensure_site_shards()
+    site = _load_cached(_site_path(endpoint_name), _as_dict).data
+    return site if site and site.get("name") == endpoint_name else None
 
 
-def upsert_site_config(endpoint_name: str, targets: list[dict[str, Any]]) -> dict[str, Any]:
-    sites = load_targets_config()
-    manager = get_enterprise_manager(endpoint_name) or {}
-    site_entry = None
-    for site in sites:
-        if site.get("name") == endpoint_name:
-            site_entry = site
-            break
+def export_targets_yaml() -> Path:
+    # In sharded mode targets.yaml is only assembled when asked for (OEM_ingest reads it).
+    if _sharded():
+        _write_yaml(TARGETS_YAML, load_targets_config())
+    return TARGETS_YAML
+
 
+def _normalize_targets(targets: list[dict[str, Any]]) -> list[dict[str, Any]]:
     normalized_targets: list[dict[str, Any]] = []
     for target in targets:
         item = {
@@ -84,60 +212,158 @@ def upsert_site_config(endpoint_name: str, targets: list[dict[str, Any]]) -> dic
         item["tags"] = dict(target.get("tags") or {})
         ensure_required_tags(item)
         normalized_targets.append(item)
+    return normalized_targets
 
-    if site_entry is None:
-        site_entry = {
-            "site": manager.get("site"),
-            "endpoint": manager.get("endpoint"),
-            "name": endpoint_name,
-            "targets": normalized_targets,
-        }
-        sites.append(site_entry)
-    else:
-        site_entry["site"] = manager.get("site", site_entry.get("site"))
-        site_entry["endpoint"] = manager.get("endpoint", site_entry.get("endpoint"))
-        site_entry["name"] = endpoint_name
-        site_entry["targets"] = normalized_targets
 
+class SiteFileConflictError(Exception):
+    def __init__(self, path: Path, stored_name: str | None) -> None:
+        super().__init__(f"Arquivo {path.name} pertence ao site {stored_name}")
+        self.path = path
+
+
+class ConfigConflictError(Exception):
+    def __init__(self, revision: int) -> None:
+        super().__init__(f"Configuracao alterada por outro usuario (revisao atual {revision})")
+        self.revision = revision
+
+
+def _write_site(site_entry: dict[str, Any]) -> None:
+    if _sharded():
+        # Only the changed site's file is rewritten.
+        path = _site_path(site_entry["name"])
+        _check_site_file(path, site_entry["name"])
+        _write_yaml(path, site_entry)
+        return
+    # Copy the sites so the cached document is never modified in place.
+    sites = [dict(site) for site in load_targets_config()]
+    for position, site in enumerate(sites):
+        if site.get("name") == site_entry["name"]:
+            sites[position] = site_entry
+            break
+    else:
+        sites.append(site_entry)
     _write_yaml(TARGETS_YAML, sites)
+
+
+def _site_entry(endpoint_name: str, targets: list[dict[str, Any]]) -> dict[str, Any]:
+    manager = get_enterprise_manager(endpoint_name) or {}
+    current = get_site_config(endpoint_name)
+    site_entry = dict(current) if current else {"site": None, "endpoint": None}
+    site_entry["site"] = manager.get("site", site_entry.get("site"))
+    site_entry["endpoint"] = manager.get("endpoint", site_entry.get("endpoint"))
+    site_entry["name"] = endpoint_name
+    site_entry["targets"] = targets
     return site_entry
 
 
+def upsert_site_config(endpoint_name: str, targets: list[dict[str, Any]]) -> dict[str, Any]:
+    normalized_targets = _normalize_targets(targets)
+    with cache.config_revision_transaction([endpoint_name]) as revisions:
+        site_entry = _site_entry(endpoint_name, normalized_targets)
+        _write_site(site_entry)
+    return {**site_entry, "revision": revisions[endpoint_name] + 1}
+
+
+def patch_site_config(
+    endpoint_name: str,
+    operations: list[dict[str, Any]],
+    expected_revision: int | None = None,
+) -> dict[str, Any]:
+    with cache.config_revision_transaction([endpoint_name]) as revisions:
+        if expected_revision is not None and expected_revision != revisions[endpoint_name]:
+            raise ConfigConflictError(revisions[endpoint_name])
+        current = get_site_config(endpoint_name) or {}
+        targets = list(current.get("targets") or [])
+        positions = {target.get("id"): position for position, target in enumerate(targets)}
+        removed: set[int] = set()
+
+        def position_of(target_id: str | None) -> int:
+            position = positions.get(target_id)
+            if position is None or position in removed:
+                raise ValueError(f"Target nao encontrado: {target_id}")
+            return position
+
+        # Only the targets touched by an operation are copied and normalized again.
+        for operation in operations:
+            op = operation.get("op")
+            if op in {"add_target", "update_target"}:
+                target = operation.get("target")
+                if not target:
+                    raise ValueError(f"Operacao {op} sem target")
+                target_id = operation.get("targetId") or target.get("id")
+                item = _normalize_targets([{**target, "id": target_id}])[0]
+                if op == "update_target":
+                    targets[position_of(target_id)] = item
+                elif target_id in positions and positions[target_id] not in removed:
+                    targets[positions[target_id]] = item
+                else:
+                    positions[target_id] = len(targets)
+                    targets.append(item)
+            elif op == "remove_target":
+                removed.add(position_of(operation.get("targetId")))
+            elif op in {"set_tag", "remove_tag"}:
+                key = operation.get("key")
+                if not key:
+                    raise ValueError("Tag sem chave")
+                position = position_of(operation.get("targetId"))
+                item = dict(targets[position])
+                item["tags"] = dict(item.get("tags") or {})
+                if op == "set_tag":
+                    if operation.get("value") is None:
+                        raise ValueError(f"Tag sem valor: {key}")
+                    item["tags"][key] = operation["value"]
+                else:
+                    item["tags"].pop(key, None)
+                ensure_required_tags(item)
+                targets[position] = item
+            else:
+                raise ValueError(f"Operacao invalida: {op}")
+
+        site_entry = _site_entry(
+            endpoint_name,
+            [target for position, target in enumerate(targets) if position not in removed],
+        )
+        _write_site(site_entry)
+    return {**site_entry, "revision": revisions[endpoint_name] + 1}
+
+
 def save_sites_config(sites: list[dict[str, Any]]) -> list[dict[str, Any]]:
     normalized_sites: list[dict[str, Any]] = []
     for site in sites:
-        normalized_targets: list[dict[str, Any]] = []
-        for target in site.get("targets") or []:
-            item = {
-                "id": target.get("id"),
-                "name": target.get("name"),
-                "typeName": target.get("typeName"),
-            }
-            for extra_key in ("dg_role", "listener_name", "machine_name"):
-                if target.get(extra_key) is not None:
-                    item[extra_key] = target.get(extra_key)
-            item["tags"] = dict(target.get("tags") or {})
-            ensure_required_tags(item)
-            normalized_targets.append(item)
-
         normalized_sites.append(
             {
                 "site": site.get("site"),
                 "endpoint": site.get("endpoint"),
                 "name": site.get("name"),
-                "targets": normalized_targets,
+                "targets": _normalize_targets(site.get("targets") or []),
             }
         )
 
-    _write_yaml(TARGETS_YAML, normalized_sites)
-    return normalized_sites
+    names = {site.get("name") for site in load_targets_config()} | {site["name"] for site in normalized_sites}
+    with cache.config_revision_transaction(sorted(name for name in names if name)) as revisions:
+        if _sharded():
+            _ensure_site_shards()
+            keep: set[Path] = set()
+            for site in normalized_sites:
+                if not site["name"]:
+                    continue
+                path = _site_path(site["name"])
+                _check_site_file(path, site["name"])
+                keep.add(path)
+                if _load_cached(path, _as_dict).data != site:
+                    _write_yaml(path, site)
+            for path in TARGETS_SITES_DIR.glob("*.yaml"):
+                if path not in keep:
+                    path.unlink()
+                    invalidate_config_cache(path)
+        else:
+            _write_yaml(TARGETS_YAML, normalized_sites)
+    # Every site's revision was bumped; callers need the new ones for their next PATCH.
+    return [{**site, "revision": revisions.get(site["name"], 0) + 1} for site in normalized_sites]
 
 
 def load_metrics_config() -> dict[str, list[dict[str, Any]]]:
-    data = _read_yaml(METRICS_YAML)
-    if not data or not isinstance(data, dict):
-        return {}
-    return data
+    return _load_cached(METRICS_YAML, _as_dict).data
 
 
 def save_metrics_config(metrics: dict[str, list[dict[str, Any]]]) -> dict[str, list[dict[str, Any]]]:
@@ -0,0 +1,60 @@
+from __future__ import annotations
+
+import threading
+from typing import Any
+
+from . import cache
+
+
+def name_prefix(name: str) -> str:
+    return name.split("_")[0].lower()
+
+
+class TargetIndex:
+    def __init__(self, endpoint_name: str, version: int, targets: list[dict[str, Any]]) -> None:
+        self.endpoint_name = endpoint_name
+        self.version = version
+        self.targets = targets
+        self._by_type: dict[str, list[dict[str, Any]]] = {}
+        self._by_name_type: dict[tuple[str, str], list[dict[str, Any]]] = {}
+        self._by_type_prefix: dict[tuple[str, str], list[dict[str, Any]]] = {}
+        for target in targets:
+            type_name = target.get("typeName") or ""
+            name = (target.get("name") or "").lower()
+            self._by_type.setdefault(type_name, []).append(target)
+            self._by_name_type.setdefault((name, type_name), []).append(target)
+            self._by_type_prefix.setdefault((type_name, name_prefix(name)), []).append(target)
+
+    def of_type(self, type_name: str) -> list[dict[str, Any]]:
+        return self._by_type.get(type_name, [])
+
+    def with_prefix(self, type_name: str, prefix: str) -> list[dict[str, Any]]:
+        return self._by_type_prefix.get((type_name, name_prefix(prefix)), [])
+
+    def find(self, name: str, type_name: str) -> dict[str, Any] | None:
+        matches = self._by_name_type.get((name.lower(), type_name))
+        return matches[0] if matches else None
+
+    def contains(self, name: str, type_name: str) -> bool:
+        matches = self._by_name_type.get((name.lower(), type_name)) or []
+        return any(t.get("name") == name for t in matches)
+
+
+_lock = threading.Lock()
+_indexes: dict[str, TargetIndex] = {}
+
+
+def get_target_index(endpoint_name: str) -> TargetIndex:
+    # Cheap version check per request; the index is rebuilt only after a refresh
+    # bumped meta.version (also visible across worker processes).
+    version = cache.get_targets_version(endpoint_name)
+    index = _indexes.get(endpoint_name)
+    if index is not None and index.version == version:
+        return index
+    version, targets = cache.get_targets_snapshot(endpoint_name)
+    index = TargetIndex(endpoint_name, version, targets)
+    with _lock:
+        current = _indexes.get(endpoint_name)
+        if current is None or current.version <= index.version:
+            _indexes[endpoint_name] = index
+    return index
@@ -0,0 +1,130 @@
+from __future__ import annotations
+
+import random
+import time
+from dataclasses import dataclass
+from typing import Any
+
+import httpx
+
+from .config import (
+    OEM_COMPRESSION,
+    OEM_CONNECT_TIMEOUT_SECONDS,
+    OEM_KEEPALIVE_SECONDS,
+    OEM_POOL_SIZE,
+    OEM_READ_TIMEOUT_SECONDS,
+    OEM_RETRIES,
+    OEM_RETRY_BACKOFF_MAX_SECONDS,
+    OEM_RETRY_BACKOFF_SECONDS,
+)
+
+RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+
+
+def _number(manager: dict[str, Any], key: str, default: float, cast: type = float) -> Any:
+    value = manager.get(key)
+    if value is None or value == "":
+        return cast(default)
+    try:
+        return cast(value)
+    except (TypeError, ValueError):
+        return cast(default)
+
+
+def _flag(value: Any, default: bool) -> bool:
+    if value is None or value == "":
+        return default
+    if isinstance(value, str):
+        return value.strip().lower() not in {"0", "false", "no", "off"}
+    return bool(value)
+
+
+@dataclass(frozen=True)
+class TransportSettings:
+    pool_size: int = OEM_POOL_SIZE
+    connect_timeout: float = OEM_CONNECT_TIMEOUT_SECONDS
+    read_timeout: float = OEM_READ_TIMEOUT_SECONDS
+    keepalive: float = OEM_KEEPALIVE_SECONDS
+    retries: int = OEM_RETRIES
+    retry_backoff: float = OEM_RETRY_BACKOFF_SECONDS
+    compression: bool = OEM_COMPRESSION
+
+    @classmethod
+    def from_manager(cls, manager: dict[str, Any]) -> TransportSettings:
+        return cls(
+            pool_size=max(1, _number(manager, "pool_size", OEM_POOL_SIZE, int)),
+            connect_timeout=max(0.1, _number(manager, "connect_timeout", OEM_CONNECT_TIMEOUT_SECONDS)),
+            read_timeout=max(0.1, _number(manager, "read_timeout", OEM_READ_TIMEOUT_SECONDS)),
+            keepalive=max(0.0, _number(manager, "keepalive", OEM_KEEPALIVE_SECONDS)),
+            retries=max(0, _number(manager, "retries", OEM_RETRIES, int)),
+            retry_backoff=max(0.0, _number(manager, "retry_backoff", OEM_RETRY_BACKOFF_SECONDS)),
+            compression=_flag(manager.get("compression"), OEM_COMPRESSION),
+        )
+
+    def headers(self) -> dict[str, str]:
+        headers = {
+            "Accept": "application/json",
+            "Accept-Encoding": "gzip, deflate" if self.compression else "identity",
+        }
+        if not self.keepalive:
+            headers["Connection"] = "close"
+        return headers
+
+    def backoff_delay(self, attempt: int, retry_after: str | None = None) -> float:
+        # Retry-After wins when the server sends one; otherwise exponential backoff
+        # with full jitter so parallel callers do not retry in lockstep.
+        if retry_after:
+            try:
+                return min(OEM_RETRY_BACKOFF_MAX_SECONDS, max(0.0, float(retry_after)))
+            except ValueError:
+                pass
+        ceiling = min(OEM_RETRY_BACKOFF_MAX_SECONDS, self.retry_backoff * (2 ** attempt))
+        return random.uniform(0, ceiling)
+
+    def httpx_limits(self) -> httpx.Limits:
+        return httpx.Limits(
+            max_connections=self.pool_size,
+            max_keepalive_connections=self.pool_size if self.keepalive else 0,
+            keepalive_expiry=self.keepalive or None,
+        )
+
+    def httpx_timeout(self) -> httpx.Timeout:
+        return httpx.Timeout(self.read_timeout, connect=self.connect_timeout)
+
+
+@dataclass
+class ClientHealth:
+    requests: int = 0
+    errors: int = 0
+    last_status: int | None = None
+    last_latency_ms: float | None = None
+    last_error: str | None = None
+    last_success_at: float | None = None
+    last_error_at: float | None = None
+
+    def record(self, started: float, status: int | None = None, error: BaseException | None = None) -> None:
+        self.requests += 1
+        self.last_latency_ms = round((time.monotonic() - started) * 1000, 1)
+        self.last_status = status
+        # 4xx answers are the caller's problem; only transport errors, 429 and 5xx count.
+        if error is not None:
+            self.errors += 1
+            self.last_error = str(error) or type(error).__name__
+            self.last_error_at = time.time()
+        elif status is None or status >= 500 or status == 429:
+            self.errors += 1
+            self.last_error = f"HTTP {status}"
+            self.last_error_at = time.time()
+        else:
+            self.last_success_at = time.time()
+
+    def snapshot(self) -> dict[str, Any]:
+        return {
+            "requests": self.requests,
+            "errors": self.errors,
+            "lastStatus": self.last_status,
+            "lastLatencyMs": self.last_latency_ms,
+            "lastError": self.last_error,
+            "lastSuccessAt": self.last_success_at,
+            "lastErrorAt": self.last_error_at,
+        }
@@ -75,5 +75,24 @@ def find_property_value(items: list[dict[str, Any]], key: str) -> str | None:
     return None
 
 
+def classify_latest_data(data: dict[str, Any]) -> str:
+    count = data.get("count")
+    if isinstance(count, int) and count > 0:
+        return "disponivel"
+    items = data.get("items") or []
+    if not items:
+        return "sem_dados"
+    for item in items:
+        metrics = item.get("metrics") or item.get("metricValues") or []
+        if metrics:
+            for metric in metrics:
+                if metric.get("value") is not None:
+                    return "disponivel"
+        datapoints = item.get("datapoints")
+        if datapoints:
+            return "disponivel"
+    return "sem_dados"
+
+
 def compile_regex_list(patterns: list[str]) -> list[re.Pattern]:
     return [re.compile(pat) for pat in patterns]
@@ -1,7 +1,9 @@
 import base64
+import functools
 import hashlib
 
 
+@functools.lru_cache(maxsize=None)
 def get_time(path):
     kato='sha256'
     ran_do = hashlib.new(kato)
@@ -0,0 +1,35 @@
+from __future__ import annotations
+
+import pytest
+
+from app import cache, storage
+
+
+@pytest.fixture
+def cache_db(tmp_path, monkeypatch):
+    # Every test gets its own SQLite file; connections of the previous one are dropped.
+    cache.close_connections()
+    monkeypatch.setattr(cache, "CACHE_DB", tmp_path / "data" / "oem_cache.db")
+    cache.init_db()
+    yield cache
+    cache.close_connections()
+
+
+@pytest.fixture
+def config_dir(tmp_path, monkeypatch, cache_db):
+    conf = tmp_path / "conf"
+    conf.mkdir()
+    monkeypatch.setattr(storage, "TARGETS_YAML", conf / "targets.yaml")
+    monkeypatch.setattr(storage, "TARGETS_SITES_DIR", conf / "targets.d")
+    monkeypatch.setattr(storage, "ENTERPRISE_MANAGERS_FILE", conf / "enterprise_manager_urls")
+    monkeypatch.setattr(storage, "METRICS_YAML", conf / "metrics.yaml")
+    monkeypatch.setattr(storage, "TARGETS_STORAGE_MODE", "single")
+    storage.invalidate_config_cache()
+    yield conf
+    storage.invalidate_config_cache()
+
+
+@pytest.fixture
+def sharded(config_dir, monkeypatch):
+    monkeypatch.setattr(storage, "TARGETS_STORAGE_MODE", "sharded")
+    return config_dir / "targets.d"
@@ -0,0 +1,206 @@
+from __future__ import annotations
+
+import threading
+
+import pytest
+
+from app import cache
+
+
+def _target(target_id: str, name: str, type_name: str = "host", display_name: str | None = None) -> dict:
+    return {"id": target_id, "name": name, "typeName": type_name, "displayName": display_name or name}
+
+
+def _refresh(endpoint_name: str, targets: list[dict]) -> dict[str, int]:
+    staging = cache.TargetStaging(endpoint_name)
+    try:
+        staging.add(targets)
+        return staging.apply()
+    finally:
+        staging.close()
+
+
+def test_staging_apply_writes_only_the_delta(cache_db):
+    first = _refresh("em1", [_target("1", "alpha"), _target("2", "beta"), _target("3", "gamma")])
+    assert first == {"count": 3, "inserted": 3, "updated": 0, "removed": 0}
+    version = cache.get_targets_version("em1")
+
+    second = _refresh("em1", [_target("1", "alpha"), _target("2", "beta2"), _target("4", "delta")])
+    assert second == {"count": 3, "inserted": 1, "updated": 1, "removed": 1}
+    assert cache.get_targets_version("em1") == version + 1
+    assert sorted(t["name"] for t in cache.get_all_targets("em1")) == ["alpha", "beta2", "delta"]
+    stats = cache.get_refresh_stats("em1")
+    assert (stats["count"], stats["inserted"], stats["updated"], stats["removed"]) == (3, 1, 1, 1)
+
+
+def test_staging_apply_without_changes_keeps_the_version(cache_db):
+    targets = [_target("1", "alpha"), _target("2", "beta")]
+    _refresh("em1", targets)
+    version = cache.get_targets_version("em1")
+
+    assert _refresh("em1", targets) == {"count": 2, "inserted": 0, "updated": 0, "removed": 0}
+    assert cache.get_targets_version("em1") == version
+
+
+def test_staging_apply_leaves_other_endpoints_alone(cache_db):
+    _refresh("em1", [_target("1", "alpha")])
+    _refresh("em2", [_target("1", "other")])
+
+    _refresh("em1", [])
+
+    assert cache.count_targets("em1") == 0
+    assert [t["name"] for t in cache.get_all_targets("em2")] == ["other"]
+
+
+def test_staging_apply_drops_properties_of_removed_targets(cache_db):
+    _refresh("em1", [_target("1", "alpha"), _target("2", "beta")])
+    cache.put_target_properties("em1", "1", {"items": []})
+    cache.put_target_properties("em1", "2", {"items": []})
+
+    _refresh("em1", [_target("2", "beta")])
+
+    assert cache.get_target_properties("em1", "1", 3600) is None
+    assert cache.get_target_properties("em1", "2", 3600) == {"items": []}
+
+
+def test_target_properties_expire_after_max_age(cache_db, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(cache.time, "time", lambda: now[0])
+    cache.put_target_properties("em1", "1", {"items": [1]})
+
+    now[0] += 30
+    assert cache.get_target_properties("em1", "1", 60) == {"items": [1]}
+    assert cache.get_target_properties("em1", "1", 10) is None
+
+
+def test_connections_are_reused_per_thread_until_closed(cache_db):
+    conn = cache._connect()
+    assert cache._connect() is conn
+    assert conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+
+    other = []
+    thread = threading.Thread(target=lambda: other.append(cache._connect()))
+    thread.start()
+    thread.join()
+    assert other[0] is not conn
+
+    cache.close_connections()
+    assert cache._connect() is not conn
+
+
+def test_search_puts_name_prefix_matches_first(cache_db):
+    _refresh("em1", [_target("1", "prod-db01"), _target("2", "db01-long-name"), _target("3", "db01")])
+
+    found = cache.search_targets("em1", "db01", None)
+
+    assert [t["id"] for t in found] == ["3", "2", "1"]
+
+
+@pytest.mark.parametrize("query", ["db", "dbx", "prod"])
+def test_search_matches_display_name_for_short_and_long_queries(cache_db, query):
+    _refresh("em1", [_target("1", "host01", display_name="prod-dbx"), _target("2", "host02")])
+
+    found = cache.search_targets("em1", query, None)
+
+    assert [t["id"] for t in found] == ["1"]
+
+
+def test_search_index_follows_renames(cache_db):
+    _refresh("em1", [_target("1", "alpha01")])
+    _refresh("em1", [_target("1", "omega01")])
+
+    assert cache.search_targets("em1", "alpha", None) == []
+    assert [t["id"] for t in cache.search_targets("em1", "omega", None)] == ["1"]
+
+
+def test_search_filters_by_type(cache_db):
+    _refresh("em1", [_target("1", "db01", "oracle_database"), _target("2", "db01.x", "host")])
+
+    found = cache.search_targets("em1", "db", ["host"])
+
+    assert [t["id"] for t in found] == ["2"]
+
+
+def test_metric_catalog_is_shared_by_type_with_overrides(cache_db):
+    load = {"items": [{"name": "Load"}]}
+    load_and_disk = {"items": [{"name": "Load"}, {"name": "Disk"}]}
+    assert cache.store_metric_catalog("em1", "host", "1", load, 3600) == "type"
+    assert cache.store_metric_catalog("em1", "host", "2", load_and_disk, 3600) == "override"
+    assert cache.store_metric_catalog("em1", "host", "3", load, 3600) == "type"
+
+    assert cache.get_metric_catalog("em1", "host", "3", 3600) == load
+    assert cache.get_metric_catalog("em1", "host", "2", 3600) == load_and_disk
+    assert cache.get_metric_catalog("em1", "oracle_database", "1", 3600) is None
+
+
+def test_config_revision_transaction_bumps_only_on_success(cache_db):
+    with cache.config_revision_transaction(["site"]) as revisions:
+        assert revisions == {"site": 0}
+    assert cache.get_config_revision("site") == 1
+
+    with pytest.raises(RuntimeError):
+        with cache.config_revision_transaction(["site"]):
+            raise RuntimeError("write failed")
+    assert cache.get_config_revision("site") == 1
+
+
+def test_shared_tokens_deny_when_empty_and_count(cache_db):
+    assert cache.consume_shared_tokens("key", 2, capacity=2, refill_rate=0.001) == (True, 0.0)
+    allowed, retry_after = cache.consume_shared_tokens("key", 1, capacity=2, refill_rate=0.001)
+
+    assert not allowed
+    assert retry_after > 0
+    assert cache.top_shared_tokens(5) == [{"key": "key", "allowed": 1, "denied": 1}]
+
+
+def test_lease_is_exclusive_until_released(cache_db):
+    assert cache.acquire_lease("refresh:em1", "worker-a", 60)
+    assert not cache.acquire_lease("refresh:em1", "worker-b", 60)
+    assert cache.renew_lease("refresh:em1", "worker-a", 60)
+    assert not cache.renew_lease("refresh:em1", "worker-b", 60)
+
+    cache.release_lease("refresh:em1", "worker-a")
+
+    assert cache.acquire_lease("refresh:em1", "worker-b", 60)
+
+
+def test_adjust_shared_tokens_clamps_to_capacity(cache_db):
+    cache.consume_shared_tokens("key", 1, capacity=2, refill_rate=0.001)
+
+    cache.adjust_shared_tokens("key", -10, capacity=2)
+    assert not cache.consume_shared_tokens("key", 1, capacity=2, refill_rate=0.001)[0]
+
+    cache.adjust_shared_tokens("key", 10, capacity=2)
+    assert cache.consume_shared_tokens("key", 2, capacity=2, refill_rate=0.001)[0]
+
+
+def test_per_target_types_skip_the_type_catalog(cache_db):
+    cache.store_metric_catalog("em1", "host", None, {"items": ["cpu"]}, 3600)
+
+    assert cache.store_metric_catalog("em1", "host", "2", {"items": ["cpu"]}, 3600, per_target=True) == "target"
+    assert cache.get_metric_catalog("em1", "host", "1", 3600, per_target=True) is None
+    assert cache.get_metric_catalog("em1", "host", "2", 3600, per_target=True) == {"items": ["cpu"]}
+
+
+def _catalog(target_id: str, metrics: list[str]) -> dict:
+    return {
+        "items": [
+            {
+                "name": "Load",
+                "metrics": [{"name": name, "dataType": "NUMBER"} for name in metrics],
+                "links": {"self": {"href": f"/em/api/targets/{target_id}/metricGroups/Load"}},
+            }
+        ],
+        "links": {"self": {"href": f"/em/api/targets/{target_id}/metricGroups"}},
+    }
+
+
+def test_metric_catalogs_differing_only_in_links_share_the_type_row(cache_db):
+    assert cache.store_metric_catalog("em1", "host", "1", _catalog("1", ["cpu", "mem"]), 3600) == "type"
+    assert cache.store_metric_catalog("em1", "host", "2", _catalog("2", ["mem", "cpu"]), 3600) == "type"
+    assert cache.store_metric_catalog("em1", "host", "3", _catalog("3", ["cpu"]), 3600) == "override"
+
+    shared = cache.get_metric_catalog("em1", "host", "9", 3600)
+    assert "links" not in shared
+    assert "links" not in shared["items"][0]
+    assert cache.get_metric_catalog("em1", "host", "3", 3600)["links"]["self"]["href"].endswith("/3/metricGroups")
@@ -0,0 +1,64 @@
+from __future__ import annotations
+
+from contextlib import asynccontextmanager
+
+import pytest
+import yaml
+from fastapi.testclient import TestClient
+
+from app import main, rate_limit
+from app.rate_limit import RateLimiter
+
+
+@pytest.fixture
+def client(config_dir, monkeypatch):
+    (config_dir / "enterprise_manager_urls").write_text(
+        yaml.safe_dump([{"name": "em1", "endpoint": "https://em1", "user": "u", "password": ""}]),
+        encoding="utf-8",
+    )
+    monkeypatch.setattr(rate_limit, "route_rate_limiter", RateLimiter(main.ROUTE_WEIGHTS["/api/targets/prepare"], 3600))
+
+    @asynccontextmanager
+    async def fake_client(manager):
+        yield object()
+
+    monkeypatch.setattr(main, "use_async_client", fake_client)
+    return TestClient(main.app)
+
+
+def test_weighted_routes_answer_429_with_retry_after(client):
+    payload = {"endpointName": "em1", "targets": []}
+
+    assert client.post("/api/targets/prepare", json=payload).status_code == 200
+    denied = client.post("/api/targets/prepare", json=payload)
+
+    assert denied.status_code == 429
+    assert int(denied.headers["Retry-After"]) >= 1
+    assert denied.json()["detail"].startswith("Rate limit atingido")
+
+
+def test_unknown_endpoints_are_not_charged(client):
+    payload = {"endpointName": "nope", "targets": []}
+
+    assert [client.post("/api/targets/prepare", json=payload).status_code for _ in range(3)] == [404] * 3
+    assert rate_limit.route_rate_limiter.snapshot()["buckets"] == 0
+
+
+def test_patch_config_rejects_a_stale_revision_with_409(client):
+    target = {"id": "1", "name": "alpha", "typeName": "host"}
+    saved = client.patch(
+        "/api/config/targets",
+        json={"endpointName": "em1", "operations": [{"op": "add_target", "target": target}]},
+    )
+    assert saved.status_code == 200
+    revision = saved.json()["revision"]
+
+    stale = client.patch(
+        "/api/config/targets",
+        json={"endpointName": "em1", "revision": revision - 1, "operations": [{"op": "remove_target", "targetId": "1"}]},
+    )
+
+    assert stale.status_code == 409
+    site = client.get("/api/config/targets", params={"endpointName": "em1"}).json()
+    assert [t["id"] for t in site["targets"]] == ["1"]
+    assert client.patch("/api/config/targets", json={"endpointName": "nope", "operations": []}).status_code == 404
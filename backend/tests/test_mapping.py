@@ -0,0 +1,70 @@
+from __future__ import annotations
+
+import asyncio
+
+from app.mapping import auto_map_batch, auto_map_system, prepare_targets, rac_system_roots
+from app.target_index import TargetIndex
+
+_TARGETS = [
+    ("1", "dbp_sys", "oracle_dbsys"),
+    ("2", "dbp", "rac_database"),
+    ("3", "dbs", "rac_database"),
+    ("4", "dbp_DBPPDB1", "oracle_pdb"),
+    ("5", "dbp_dbp1", "oracle_database"),
+    ("6", "dbs_dbs1", "oracle_database"),
+    ("7", "host01", "host"),
+    ("8", "LISTENER_host01", "oracle_listener"),
+    ("9", "other", "rac_database"),
+]
+
+
+class _FakeClient:
+    def __init__(self) -> None:
+        self.calls: list[str] = []
+
+    async def get_target_properties(self, target_id: str) -> dict:
+        self.calls.append(target_id)
+        role = "Primary" if target_id == "5" else "Physical Standby"
+        return {"items": [{"id": "DataGuardStatus", "value": role}, {"id": "MachineName", "value": "host01-vip"}]}
+
+
+def _index() -> TargetIndex:
+    targets = [{"id": target_id, "name": name, "typeName": type_name} for target_id, name, type_name in _TARGETS]
+    return TargetIndex("em1", 1, targets)
+
+
+def test_auto_map_system_collects_the_whole_rac_system(cache_db):
+    found = asyncio.run(auto_map_system(_index(), "dbp", "rac_database", _FakeClient()))
+
+    assert [t["id"] for t in found] == ["1", "2", "3", "4", "5", "7", "8", "6"]
+    database = next(t for t in found if t["id"] == "5")
+    assert database["tags"]["oracle_dbsys"] == "dbp_sys"
+    assert database["tags"]["rac_database"] == "dbp"
+
+
+def test_auto_map_batch_matches_auto_map_system(cache_db):
+    index = _index()
+
+    async def main():
+        single = await auto_map_system(index, "dbp", "rac_database", _FakeClient())
+        roots = rac_system_roots(index) + [("missing", "rac_database")]
+        batch = [result async for result in auto_map_batch(index, roots, {"max_parallel": 2}, _FakeClient())]
+        return single, {result["rootName"]: result for result in batch}
+
+    single, batch = asyncio.run(main())
+
+    assert sorted(batch) == ["dbp", "missing", "other"]
+    assert batch["dbp"]["targets"] == single
+    assert [t["id"] for t in batch["other"]["targets"]] == ["9"]
+    assert batch["missing"]["error"] == "Target raiz nao encontrado no cache"
+
+
+def test_prepare_targets_keeps_the_selection_order_and_enriches_databases(cache_db):
+    client = _FakeClient()
+    selected = [{"id": "6", "name": "dbs_dbs1", "typeName": "oracle_database"}, {"id": "7", "name": "host01", "typeName": "host"}]
+
+    prepared = asyncio.run(prepare_targets(_index(), selected, client))
+
+    assert [t["id"] for t in prepared] == ["6", "7"]
+    assert prepared[0]["tags"]["dg_role"] == "Physical Standby"
+    assert client.calls == ["6"]
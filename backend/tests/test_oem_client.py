@@ -0,0 +1,128 @@
+from __future__ import annotations
+
+import asyncio
+
+import httpx
+import pytest
+
+from app import transport
+from app.oem_client import AsyncOEMClient
+from app.transport import TransportSettings
+
+
+def _client(handler, retries: int = 2) -> AsyncOEMClient:
+    client = AsyncOEMClient("https://oem.example", "user", "", transport=TransportSettings(retries=retries, retry_backoff=0))
+    client._client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    return client
+
+
+def _run(client: AsyncOEMClient, call):
+    async def main():
+        try:
+            return await call(client)
+        finally:
+            await client.aclose()
+
+    return asyncio.run(main())
+
+
+def test_retryable_statuses_are_retried():
+    statuses = iter([503, 429, 200])
+    seen = []
+
+    def handler(request):
+        seen.append(request.url.path)
+        status = next(statuses)
+        return httpx.Response(status, json={"items": []}, headers={"Retry-After": "0"})
+
+    assert _run(_client(handler), lambda c: c.get_targets_page()) == {"items": []}
+    assert seen == ["/em/api/targets"] * 3
+
+
+def test_retries_stop_at_the_configured_count():
+    seen = []
+
+    def handler(request):
+        seen.append(1)
+        return httpx.Response(503)
+
+    with pytest.raises(httpx.HTTPStatusError):
+        _run(_client(handler, retries=1), lambda c: c.get_targets_page())
+    assert len(seen) == 2
+
+
+def test_client_errors_are_not_retried():
+    seen = []
+
+    def handler(request):
+        seen.append(1)
+        return httpx.Response(404)
+
+    with pytest.raises(httpx.HTTPStatusError):
+        _run(_client(handler), lambda c: c.get_targets_page())
+    assert len(seen) == 1
+
+
+def test_backoff_honors_retry_after_up_to_the_cap(monkeypatch):
+    monkeypatch.setattr(transport, "OEM_RETRY_BACKOFF_MAX_SECONDS", 10.0)
+    settings = TransportSettings(retry_backoff=1.0)
+
+    assert settings.backoff_delay(0, "3") == 3.0
+    assert settings.backoff_delay(0, "600") == 10.0
+    assert 0 <= settings.backoff_delay(5, "soon") <= 10.0
+
+
+def test_settings_fall_back_on_invalid_manager_values():
+    settings = TransportSettings.from_manager({"pool_size": "abc", "retries": "-3", "compression": "off"})
+
+    assert settings.pool_size == TransportSettings().pool_size
+    assert settings.retries == 0
+    assert not settings.compression
+    assert settings.headers()["Accept-Encoding"] == "identity"
+
+
+def test_health_counts_server_errors_but_not_client_errors():
+    statuses = iter([503, 200, 404])
+
+    def handler(request):
+        return httpx.Response(next(statuses), json={})
+
+    async def call(client):
+        await client.ping()
+        await client.ping()
+        await client.ping()
+        return client.health.snapshot()
+
+    health = _run(_client(handler), call)
+
+    assert (health["requests"], health["errors"], health["lastStatus"]) == (3, 1, 404)
+    assert health["lastError"] == "HTTP 503"
+
+
+@pytest.mark.parametrize(
+    ("payload", "expected"),
+    [
+        ({"count": 3, "items": [{}], "links": {"next": {"href": "https://oem.example/next"}}}, "disponivel"),
+        ({"items": [{"datapoints": [{"value": 1}]}]}, "disponivel"),
+        ({"items": [{"metrics": [{"value": None}]}]}, "sem_dados"),
+        ({"items": []}, "sem_dados"),
+        ([], "sem_dados"),
+    ],
+)
+def test_probe_fetches_a_single_page_of_latest_data(payload, expected):
+    seen = []
+
+    def handler(request):
+        seen.append((request.url.raw_path.decode().split("?")[0], dict(request.url.params)))
+        return httpx.Response(200, json=payload)
+
+    assert _run(_client(handler), lambda c: c.probe_latest_metric_data("T1", "Load/CPU")) == expected
+    assert seen == [("/em/api/targets/T1/metricGroups/Load%2FCPU/latestData", {"limit": "1"})]
+
+
+def test_probe_raises_on_http_errors():
+    def handler(request):
+        return httpx.Response(404, json={})
+
+    with pytest.raises(httpx.HTTPStatusError):
+        _run(_client(handler), lambda c: c.probe_latest_metric_data("T1", "Load"))
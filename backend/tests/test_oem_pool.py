@@ -0,0 +1,67 @@
+from __future__ import annotations
+
+import asyncio
+from collections import OrderedDict
+
+import pytest
+
+from app import oem_pool
+
+
+@pytest.fixture(autouse=True)
+def _empty_pool(monkeypatch):
+    monkeypatch.setattr(oem_pool, "_async_clients", OrderedDict())
+    monkeypatch.setattr(oem_pool, "_retired_async_clients", [])
+    monkeypatch.setattr(oem_pool, "OEM_POOL_MAX_CLIENTS", 1)
+    monkeypatch.setattr(oem_pool, "load_enterprise_managers", lambda: [])
+
+
+def _manager(name: str) -> dict:
+    return {"name": name, "endpoint": f"https://{name}", "user": "u", "password": ""}
+
+
+def _closes(monkeypatch) -> list:
+    closed = []
+
+    async def aclose(self):
+        closed.append(self)
+
+    monkeypatch.setattr(oem_pool.AsyncOEMClient, "aclose", aclose)
+    return closed
+
+
+def test_an_evicted_client_is_closed_only_once_idle(monkeypatch):
+    closed = _closes(monkeypatch)
+
+    async def main():
+        async with oem_pool.use_async_client(_manager("em1")) as first:
+            async with oem_pool.use_async_client(_manager("em2")):
+                pass
+            # em1 was evicted by em2 but is still in use.
+            await oem_pool.maintain_clients()
+            assert closed == []
+        await oem_pool.maintain_clients()
+        return first
+
+    first = asyncio.run(main())
+
+    assert closed == [first]
+    assert oem_pool._retired_async_clients == []
+
+
+def test_clients_in_use_do_not_expire(monkeypatch):
+    closed = _closes(monkeypatch)
+    monkeypatch.setattr(oem_pool, "OEM_CLIENT_TTL_SECONDS", -1)
+
+    async def main():
+        async with oem_pool.use_async_client(_manager("em1")) as client:
+            await oem_pool.maintain_clients()
+            assert closed == []
+            assert oem_pool.client_health(_manager("em1"))["inUse"] == 1
+        await oem_pool.maintain_clients()
+        return client
+
+    client = asyncio.run(main())
+
+    assert closed == [client]
+    assert oem_pool.client_health(_manager("em1")) == {"active": False}
@@ -0,0 +1,114 @@
+from __future__ import annotations
+
+import asyncio
+
+import pytest
+
+from app import outbound
+from app.outbound import AdaptiveLimiter, get_outbound_limiter, reset_outbound_limiters
+
+
+@pytest.fixture(autouse=True)
+def _fresh_limiters():
+    reset_outbound_limiters()
+    yield
+    reset_outbound_limiters()
+
+
+def test_window_grows_on_success_up_to_the_maximum():
+    limiter = AdaptiveLimiter(initial=2, minimum=1, maximum=3, latency_spike_factor=3)
+
+    for _ in range(50):
+        limiter.record(0.1, status=200)
+
+    assert limiter.limit == 3
+
+
+def test_overload_halves_the_window_once_per_round_trip(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(outbound.time, "monotonic", lambda: now[0])
+    limiter = AdaptiveLimiter(initial=16, minimum=1, maximum=32, latency_spike_factor=3)
+    limiter.record(0.5, status=200)
+    window = limiter.limit
+
+    for _ in range(5):
+        limiter.record(0.5, status=503)
+    assert limiter.limit == pytest.approx(window / 2)
+
+    now[0] += 1
+    limiter.record(0.5, status=429)
+    assert limiter.limit == pytest.approx(window / 4)
+
+
+def test_latency_baselines_are_kept_per_kind(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(outbound.time, "monotonic", lambda: now[0])
+    limiter = AdaptiveLimiter(initial=8, minimum=1, maximum=32, latency_spike_factor=3)
+    limiter.record(0.01, status=200, kind="probe")
+    now[0] += 1
+
+    # A slow page is not a spike compared with fast probes.
+    limiter.record(2.0, status=200, kind="page")
+    assert limiter.decreases == 0
+
+    now[0] += 1
+    limiter.record(0.5, status=200, kind="probe")
+    assert limiter.decreases == 1
+    assert set(limiter.snapshot()["baselineLatencyMs"]) == {"page", "probe"}
+
+
+def test_retry_after_pauses_new_requests():
+    limiter = AdaptiveLimiter(initial=4, minimum=1, maximum=8, latency_spike_factor=3)
+    limiter.record(0.1, status=429, retry_after="0.2")
+
+    async def main():
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        await limiter.acquire()
+        limiter.release()
+        return loop.time() - started
+
+    assert asyncio.run(main()) >= 0.15
+
+
+def test_acquire_waits_for_a_free_slot():
+    limiter = AdaptiveLimiter(initial=1, minimum=1, maximum=1, latency_spike_factor=3)
+    order = []
+
+    async def worker(name):
+        await limiter.acquire()
+        order.append(f"{name}+")
+        await asyncio.sleep(0.01)
+        order.append(f"{name}-")
+        limiter.release()
+
+    async def main():
+        await asyncio.gather(worker("a"), worker("b"))
+
+    asyncio.run(main())
+    assert order == ["a+", "a-", "b+", "b-"]
+
+
+def test_maximum_is_capped_at_the_pool_size():
+    limiter = get_outbound_limiter({"endpoint": "https://em1", "pool_size": 6, "max_concurrency": 32})
+
+    assert limiter.maximum == 6
+    assert get_outbound_limiter({"endpoint": "https://em1"}) is limiter
+    assert get_outbound_limiter({"endpoint": "https://em2", "max_concurrency": 4}).maximum == 4
+
+
+def test_a_cancelled_waiter_passes_its_wakeup_on():
+    limiter = AdaptiveLimiter(initial=1, minimum=1, maximum=1, latency_spike_factor=3)
+
+    async def main():
+        await limiter.acquire()
+        first = asyncio.ensure_future(limiter.acquire())
+        second = asyncio.ensure_future(limiter.acquire())
+        await asyncio.sleep(0)
+        # The release resolves the first waiter, which is cancelled before it runs.
+        limiter.release()
+        first.cancel()
+        await asyncio.wait_for(second, timeout=1)
+        return first.cancelled(), limiter.in_flight
+
+    assert asyncio.run(main()) == (True, 1)
@@ -0,0 +1,120 @@
+from __future__ import annotations
+
+import asyncio
+
+import pytest
+
+from app import rate_limit
+from app.rate_limit import RateLimiter, RequestCost, SharedRateLimiter
+
+
+def test_allows_up_to_capacity_then_denies():
+    limiter = RateLimiter(3, 60)
+
+    assert [limiter.allow("key")[0] for _ in range(4)] == [True, True, True, False]
+    assert limiter.allow("key")[1] > 0
+    assert limiter.allow("other")[0]
+
+
+def test_junk_keys_do_not_reset_a_throttled_bucket():
+    limiter = RateLimiter(2, 60, max_buckets=8, shards=1)
+    limiter.allow("victim", 2)
+    assert not limiter.allow("victim")[0]
+
+    for number in range(1000):
+        limiter.allow(f"junk-{number}")
+
+    assert not limiter.allow("victim")[0]
+    snapshot = limiter.snapshot()
+    assert snapshot["buckets"] <= snapshot["maxBuckets"]
+    assert snapshot["overflow"]["denied"] > 0
+
+
+def test_full_buckets_are_evicted_at_the_cap(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(rate_limit.time, "monotonic", lambda: now[0])
+    limiter = RateLimiter(1, 1, max_buckets=2, shards=1)
+    limiter.allow("a")
+    limiter.allow("b")
+
+    now[0] += 5
+    assert limiter.allow("c")[0]
+
+    snapshot = limiter.snapshot()
+    assert snapshot["evicted"] == 2
+    assert [item["key"] for item in snapshot["keys"]] == ["c"]
+
+
+def test_adjust_refunds_and_charges_within_capacity():
+    limiter = RateLimiter(4, 3600)
+    limiter.allow("key", 4)
+
+    limiter.adjust("key", 2)
+    assert limiter.allow("key", 2)[0]
+
+    limiter.adjust("key", -100)
+    allowed, retry_after = limiter.allow("key")
+    assert not allowed
+    # At most one bucket of debt: -4 tokens, plus the one requested, at 4 tokens/hour.
+    assert retry_after <= 5 * 900 + 1
+
+
+def _run_request(limiter, monkeypatch, estimated_calls, oem_calls, continues=False):
+    monkeypatch.setattr(rate_limit, "route_rate_limiter", limiter)
+    monkeypatch.setattr(rate_limit, "RATE_LIMIT_OEM_CALL_COST", 1.0)
+
+    async def request():
+        cost = RequestCost()
+        token = rate_limit._request_cost.set(cost)
+        try:
+            allowed, _ = await cost.charge("key", 1, estimated_calls)
+            assert allowed
+            for _ in range(oem_calls):
+                rate_limit.record_oem_call()
+            if continues:
+                cost.continue_in_background()
+        finally:
+            rate_limit._request_cost.reset(token)
+        await cost.settle()
+
+    asyncio.run(request())
+
+
+@pytest.mark.parametrize(
+    ("estimated_calls", "oem_calls", "continues", "left"),
+    [
+        (5, 1, False, 8.0),  # overestimate: refunded down to 1 + 1
+        (1, 5, False, 4.0),  # underestimate: the extra calls are charged after the fact
+        (5, 1, True, 4.0),  # background work keeps the estimate
+    ],
+)
+def test_request_cost_settles_against_actual_calls(monkeypatch, estimated_calls, oem_calls, continues, left):
+    limiter = RateLimiter(10, 3600)
+
+    _run_request(limiter, monkeypatch, estimated_calls, oem_calls, continues)
+
+    bucket = limiter._shard("key").buckets["key"]
+    assert bucket.tokens == pytest.approx(left, abs=0.05)
+
+
+def test_request_cost_is_capped_at_the_bucket(monkeypatch):
+    limiter = RateLimiter(10, 3600)
+
+    _run_request(limiter, monkeypatch, estimated_calls=1000, oem_calls=0, continues=True)
+
+    assert limiter._shard("key").buckets["key"].tokens == pytest.approx(0.0, abs=0.05)
+
+
+def test_shared_limiter_runs_in_the_threadpool_and_reports_counters(cache_db, monkeypatch):
+    limiter = SharedRateLimiter(2, 60)
+    monkeypatch.setattr(rate_limit, "route_rate_limiter", limiter)
+
+    async def main():
+        return [await rate_limit._call_limiter(limiter.allow, "key", 1.0) for _ in range(3)]
+
+    assert [allowed for allowed, _ in asyncio.run(main())] == [True, True, False]
+    assert limiter.snapshot() == {
+        "backend": "sqlite",
+        "buckets": 1,
+        "keys": [{"key": "key", "allowed": 2, "denied": 1}],
+    }
@@ -0,0 +1,169 @@
+from __future__ import annotations
+
+import asyncio
+from contextlib import asynccontextmanager
+
+import pytest
+
+from app import cache, refresh
+
+
+class _FakeClient:
+    def __init__(self, pages: list[list[dict]], gate: asyncio.Event | None = None, error: Exception | None = None):
+        self.pages = pages
+        self.gate = gate
+        self.error = error
+        self.calls = 0
+
+    async def iter_target_pages(self):
+        self.calls += 1
+        for page in self.pages:
+            if self.gate is not None:
+                await self.gate.wait()
+            yield page
+        if self.error is not None:
+            raise self.error
+
+
+@pytest.fixture(autouse=True)
+def _no_jobs(monkeypatch):
+    monkeypatch.setattr(refresh, "_jobs", {})
+    monkeypatch.setattr(refresh, "_start_lock", None)
+
+
+def _use_client(monkeypatch, client: _FakeClient) -> None:
+    @asynccontextmanager
+    async def use_async_client(manager):
+        yield client
+
+    monkeypatch.setattr(refresh, "use_async_client", use_async_client)
+
+
+def _item(target_id: str, name: str) -> dict:
+    return {"targetId": target_id, "name": name, "type": "host"}
+
+
+def test_refresh_job_reports_progress_and_changes(cache_db, monkeypatch):
+    _use_client(monkeypatch, _FakeClient([[_item("1", "alpha")], [_item("2", "beta")]]))
+
+    async def main():
+        job_id, task, started = await refresh.start_refresh_job("em1", {"name": "em1"})
+        assert started
+        return job_id, await task
+
+    job_id, changes = asyncio.run(main())
+
+    assert changes == {"count": 2, "inserted": 2, "updated": 0, "removed": 0}
+    job = cache.get_refresh_job(job_id)
+    assert (job["status"], job["pages"], job["rows"], job["count"]) == ("done", 2, 2, 2)
+
+
+def test_a_running_refresh_is_joined(cache_db, monkeypatch):
+    client = _FakeClient([[_item("1", "alpha")]], gate=asyncio.Event())
+    _use_client(monkeypatch, client)
+
+    async def main():
+        first = await refresh.start_refresh_job("em1", {"name": "em1"})
+        second = await refresh.start_refresh_job("em1", {"name": "em1"})
+        client.gate.set()
+        await first[1]
+        return first, second
+
+    first, second = asyncio.run(main())
+
+    assert first[:2] == second[:2]
+    assert (first[2], second[2]) == (True, False)
+    assert client.calls == 1
+
+
+def test_failed_refresh_is_recorded_and_keeps_the_cache(cache_db, monkeypatch):
+    _use_client(monkeypatch, _FakeClient([[_item("1", "alpha")]]))
+    asyncio.run(refresh.refresh_endpoint("em1", {"name": "em1"}))
+    _use_client(monkeypatch, _FakeClient([[_item("2", "beta")]], error=RuntimeError("oem down")))
+
+    async def main():
+        job_id, task, _ = await refresh.start_refresh_job("em1", {"name": "em1"})
+        with pytest.raises(RuntimeError):
+            await task
+        return job_id
+
+    job = cache.get_refresh_job(asyncio.run(main()))
+
+    assert (job["status"], job["error"]) == ("error", "oem down")
+    assert [t["name"] for t in cache.get_all_targets("em1")] == ["alpha"]
+
+
+def test_scheduler_skips_endpoints_leased_by_another_worker(cache_db, monkeypatch):
+    client = _FakeClient([[_item("1", "alpha")]])
+    _use_client(monkeypatch, client)
+    monkeypatch.setattr(refresh, "load_enterprise_managers", lambda: [{"name": "em1"}, {"name": "em2"}])
+    cache.acquire_lease("refresh:em1", "other-worker", 60)
+
+    asyncio.run(refresh.refresh_stale_endpoints())
+
+    assert cache.count_targets("em1") == 0
+    assert cache.count_targets("em2") == 1
+    assert client.calls == 1
+    # The scheduler's own lease is released once the endpoint is done.
+    assert cache.acquire_lease("refresh:em2", "other-worker", 60)
+
+
+def test_scheduler_backs_off_after_failed_refreshes(cache_db, monkeypatch):
+    client = _FakeClient([[_item("1", "alpha")]], error=RuntimeError("oem down"))
+    _use_client(monkeypatch, client)
+    monkeypatch.setattr(refresh, "load_enterprise_managers", lambda: [{"name": "em1"}])
+    monkeypatch.setattr(refresh, "TARGET_REFRESH_FAILURE_BACKOFF_SECONDS", 60)
+
+    asyncio.run(refresh.refresh_stale_endpoints())
+    asyncio.run(refresh.refresh_stale_endpoints())
+
+    assert client.calls == 1
+    assert cache.get_refresh_failures("em1")[0] == 1
+    assert refresh._failure_backoff_seconds(3) == 240
+
+    monkeypatch.setattr(refresh, "TARGET_REFRESH_FAILURE_BACKOFF_SECONDS", 0)
+    client.error = None
+    asyncio.run(refresh.refresh_stale_endpoints())
+
+    assert client.calls == 2
+    assert cache.get_refresh_failures("em1") == (0, None)
+
+
+def test_refresh_job_renews_the_scheduler_lease_per_page(cache_db, monkeypatch):
+    _use_client(monkeypatch, _FakeClient([[_item("1", "alpha")], [_item("2", "beta")]]))
+    renewed = []
+    renew_lease = cache.renew_lease
+
+    def spy(name, owner, ttl_seconds):
+        renewed.append((name, owner))
+        return renew_lease(name, owner, ttl_seconds)
+
+    monkeypatch.setattr(cache, "renew_lease", spy)
+
+    async def main():
+        _, task, _ = await refresh.start_refresh_job("em1", {"name": "em1"})
+        await task
+
+    asyncio.run(main())
+
+    assert renewed == [("refresh:em1", refresh._LEASE_OWNER)] * 2
+
+
+def test_a_refresh_running_on_another_worker_is_followed(cache_db, monkeypatch):
+    client = _FakeClient([[_item("1", "alpha")]])
+    _use_client(monkeypatch, client)
+    monkeypatch.setattr(refresh, "_FOLLOW_INTERVAL_SECONDS", 0.01)
+    cache.acquire_lease("refresh:em1", "other-worker", 60)
+    remote_id = cache.create_refresh_job("em1", 10)
+
+    async def main():
+        job_id, task, started = await refresh.start_refresh_job("em1", {"name": "em1"})
+        await asyncio.sleep(0.05)
+        assert not task.done()
+        await asyncio.to_thread(cache.finish_refresh_job, remote_id, {"count": 1})
+        return job_id, started, await task
+
+    job_id, started, job = asyncio.run(main())
+
+    assert (job_id, started, job["status"], job["count"]) == (remote_id, False, "done", 1)
+    assert client.calls == 0
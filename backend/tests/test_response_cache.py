@@ -0,0 +1,134 @@
+from __future__ import annotations
+
+import asyncio
+
+from app import response_cache
+from app.response_cache import ResponseCache
+
+
+def _counting_fetch(value, delay: float = 0.0):
+    calls = []
+
+    async def fetch():
+        calls.append(1)
+        await asyncio.sleep(delay)
+        return value
+
+    return fetch, calls
+
+
+def test_concurrent_misses_share_one_fetch():
+    cache = ResponseCache(8, ttl_seconds=60, stale_seconds=0)
+    fetch, calls = _counting_fetch({"items": [1]}, delay=0.05)
+
+    async def main():
+        return await asyncio.gather(*(cache.get_or_fetch("key", fetch) for _ in range(10)))
+
+    assert asyncio.run(main()) == [{"items": [1]}] * 10
+    assert len(calls) == 1
+
+
+def test_a_cancelled_caller_does_not_cancel_the_shared_fetch():
+    cache = ResponseCache(8, ttl_seconds=60, stale_seconds=0)
+    fetch, calls = _counting_fetch("value", delay=0.05)
+
+    async def main():
+        first = asyncio.ensure_future(cache.get_or_fetch("key", fetch))
+        second = asyncio.ensure_future(cache.get_or_fetch("key", fetch))
+        await asyncio.sleep(0.01)
+        first.cancel()
+        return await second
+
+    assert asyncio.run(main()) == "value"
+    assert len(calls) == 1
+
+
+def test_failures_are_not_cached():
+    cache = ResponseCache(8, ttl_seconds=60, stale_seconds=0)
+    attempts = []
+
+    async def flaky():
+        attempts.append(1)
+        if len(attempts) == 1:
+            raise RuntimeError("oem down")
+        return "ok"
+
+    async def main():
+        try:
+            await cache.get_or_fetch("key", flaky)
+        except RuntimeError:
+            pass
+        return await cache.get_or_fetch("key", flaky)
+
+    assert asyncio.run(main()) == "ok"
+    assert len(attempts) == 2
+
+
+def test_stale_entries_are_served_while_revalidating(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(response_cache.time, "monotonic", lambda: now[0])
+    cache = ResponseCache(8, ttl_seconds=10, stale_seconds=60)
+    values = iter(["old", "new"])
+
+    async def fetch():
+        return next(values)
+
+    async def main():
+        await cache.get_or_fetch("key", fetch)
+        now[0] += 30
+        stale = await cache.get_or_fetch("key", fetch)
+        await asyncio.gather(*cache._inflight.values())
+        return stale, await cache.get_or_fetch("key", fetch)
+
+    assert asyncio.run(main()) == ("old", "new")
+
+
+
+def test_entries_are_bounded_by_count():
+    cache = ResponseCache(3, ttl_seconds=60, stale_seconds=0)
+
+    async def main():
+        for number in range(5):
+            fetch, _ = _counting_fetch(number)
+            await cache.get_or_fetch(number, fetch)
+
+    asyncio.run(main())
+    assert list(cache._entries) == [2, 3, 4]
+
+
+def test_entries_are_bounded_by_size():
+    cache = ResponseCache(100, ttl_seconds=60, stale_seconds=0, max_bytes=1000, max_entry_bytes=400)
+
+    async def main():
+        for number in range(10):
+            fetch, _ = _counting_fetch("x" * 300)
+            await cache.get_or_fetch(number, fetch)
+
+    asyncio.run(main())
+    assert list(cache._entries) == [7, 8, 9]
+    assert cache._bytes <= 1000
+
+
+def test_oversized_responses_are_returned_but_not_cached():
+    cache = ResponseCache(100, ttl_seconds=60, stale_seconds=0, max_bytes=1000, max_entry_bytes=400)
+    fetch, calls = _counting_fetch("y" * 500)
+
+    async def main():
+        return [await cache.get_or_fetch("big", fetch) for _ in range(2)]
+
+    assert asyncio.run(main()) == ["y" * 500] * 2
+    assert len(calls) == 2
+    assert "big" not in cache._entries
+
+
+def test_shared_cache_reuses_another_workers_response(cache_db):
+    writer = ResponseCache(8, ttl_seconds=60, stale_seconds=0, shared=True)
+    reader = ResponseCache(8, ttl_seconds=60, stale_seconds=0, shared=True)
+    fetch, calls = _counting_fetch({"items": [1, 2]})
+
+    async def main():
+        await writer.get_or_fetch(("em1", "t1"), fetch)
+        return await reader.get_or_fetch(("em1", "t1"), fetch)
+
+    assert asyncio.run(main()) == {"items": [1, 2]}
+    assert len(calls) == 1
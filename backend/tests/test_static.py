@@ -0,0 +1,57 @@
+from __future__ import annotations
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app.static import SPAStaticFiles
+
+_BUNDLE = "console.log('oem');\n" * 200
+
+
+@pytest.fixture
+def client(tmp_path):
+    (tmp_path / "assets").mkdir()
+    (tmp_path / "index.html").write_text("<html>spa</html>", encoding="utf-8")
+    (tmp_path / "assets" / "index-C8iKm3hD.js").write_text(_BUNDLE, encoding="utf-8")
+    app = FastAPI()
+    app.mount("/", SPAStaticFiles(directory=tmp_path, html=True), name="frontend")
+    return TestClient(app)
+
+
+def test_hashed_assets_are_gzipped_and_cached_forever(client):
+    response = client.get("/assets/index-C8iKm3hD.js", headers={"Accept-Encoding": "gzip"})
+
+    assert response.status_code == 200
+    assert response.text == _BUNDLE
+    assert response.headers["Content-Encoding"] == "gzip"
+    assert response.headers["Cache-Control"] == "public, max-age=31536000, immutable"
+    assert response.headers["ETag"].endswith('-gzip"')
+
+
+def test_matching_etag_answers_304(client):
+    etag = client.get("/assets/index-C8iKm3hD.js", headers={"Accept-Encoding": "identity"}).headers["ETag"]
+
+    response = client.get(
+        "/assets/index-C8iKm3hD.js",
+        headers={"Accept-Encoding": "identity", "If-None-Match": etag},
+    )
+
+    assert response.status_code == 304
+    assert response.content == b""
+
+
+def test_client_side_routes_get_the_spa_shell(client):
+    response = client.get("/mapeamento/em1")
+
+    assert response.status_code == 200
+    assert response.text == "<html>spa</html>"
+    assert response.headers["Cache-Control"] == "no-cache"
+
+
+@pytest.mark.parametrize("path", ["/assets/missing-C8iKm3hD.js", "/favicon.ico", "/api/unknown", "/api/targets/x"])
+def test_missing_files_and_api_paths_are_404(client, path):
+    response = client.get(path)
+
+    assert response.status_code == 404
+    assert "spa" not in response.text
@@ -0,0 +1,139 @@
+from __future__ import annotations
+
+import pytest
+import yaml
+
+from app import cache, storage
+
+
+def _target(target_id: str, name: str, tags: dict | None = None) -> dict:
+    return {"id": target_id, "name": name, "typeName": "host", "tags": dict(tags or {})}
+
+
+def _write(path, data) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(yaml.safe_dump(data, sort_keys=False), encoding="utf-8")
+
+
+def _ids(endpoint_name: str) -> list[str]:
+    return [t["id"] for t in (storage.get_site_config(endpoint_name) or {}).get("targets") or []]
+
+
+def test_parsed_config_is_reused_until_the_file_changes(config_dir):
+    _write(config_dir / "targets.yaml", [{"name": "em1", "targets": [_target("1", "alpha")]}])
+
+    first = storage.load_targets_config()
+    assert storage.load_targets_config() is first
+
+    _write(config_dir / "targets.yaml", [{"name": "em1", "targets": [_target("1", "alpha"), _target("2", "beta")]}])
+
+    assert storage.load_targets_config() is not first
+    assert _ids("em1") == ["1", "2"]
+
+
+def test_upsert_does_not_change_the_cached_document(config_dir):
+    storage.upsert_site_config("em1", [_target("1", "alpha")])
+    before = storage.get_site_config("em1")
+
+    storage.upsert_site_config("em1", [_target("2", "beta")])
+
+    assert [t["id"] for t in before["targets"]] == ["1"]
+    assert _ids("em1") == ["2"]
+
+
+def test_first_sharded_use_splits_targets_yaml(config_dir, monkeypatch):
+    _write(config_dir / "targets.yaml", [{"name": "em1", "targets": []}, {"name": "em2", "targets": []}])
+    monkeypatch.setattr(storage, "TARGETS_STORAGE_MODE", "sharded")
+
+    assert [site["name"] for site in storage.load_targets_config()] == ["em1", "em2"]
+    assert sorted(path.name for path in (config_dir / "targets.d").glob("*.yaml")) == sorted(
+        storage._site_path(name).name for name in ("em1", "em2")
+    )
+    assert not [path for path in config_dir.iterdir() if path.name.startswith(".targets.d.")]
+
+
+def test_sharded_upsert_writes_one_file_and_exports_on_demand(sharded, config_dir):
+    storage.upsert_site_config("em1", [_target("1", "alpha")])
+    storage.upsert_site_config("em2", [_target("2", "beta")])
+
+    assert _ids("em1") == ["1"]
+    assert len(list(sharded.glob("*.yaml"))) == 2
+    assert not (config_dir / "targets.yaml").exists()
+
+    exported = yaml.safe_load(storage.export_targets_yaml().read_text(encoding="utf-8"))
+    assert [site["name"] for site in exported] == ["em1", "em2"]
+
+
+def test_patch_applies_operations_and_bumps_the_revision(config_dir):
+    storage.upsert_site_config("em1", [_target("1", "alpha"), _target("2", "beta")])
+
+    site = storage.patch_site_config(
+        "em1",
+        [
+            {"op": "remove_target", "targetId": "1"},
+            {"op": "add_target", "target": _target("3", "gamma")},
+            {"op": "set_tag", "targetId": "2", "key": "env", "value": "prod"},
+        ],
+        expected_revision=1,
+    )
+
+    assert site["revision"] == 2
+    assert _ids("em1") == ["2", "3"]
+    assert storage.get_site_config("em1")["targets"][0]["tags"]["env"] == "prod"
+
+
+def test_patch_with_a_stale_revision_is_rejected_without_writing(config_dir):
+    storage.upsert_site_config("em1", [_target("1", "alpha")])
+    storage.patch_site_config("em1", [{"op": "add_target", "target": _target("2", "beta")}])
+
+    with pytest.raises(storage.ConfigConflictError) as error:
+        storage.patch_site_config("em1", [{"op": "remove_target", "targetId": "1"}], expected_revision=1)
+
+    assert error.value.revision == 2
+    assert _ids("em1") == ["1", "2"]
+    assert cache.get_config_revision("em1") == 2
+
+
+def test_patch_with_an_unknown_target_changes_nothing(config_dir):
+    storage.upsert_site_config("em1", [_target("1", "alpha")])
+
+    with pytest.raises(ValueError):
+        storage.patch_site_config(
+            "em1",
+            [{"op": "remove_target", "targetId": "1"}, {"op": "remove_target", "targetId": "1"}],
+        )
+
+    assert _ids("em1") == ["1"]
+    assert cache.get_config_revision("em1") == 1
+
+
+def test_save_all_returns_the_new_revisions(config_dir):
+    storage.upsert_site_config("em1", [_target("1", "alpha")])
+
+    saved = storage.save_sites_config(
+        [
+            {"name": "em1", "targets": [_target("1", "alpha")]},
+            {"name": "em2", "targets": [_target("9", "omega")]},
+        ]
+    )
+
+    assert {site["name"]: site["revision"] for site in saved} == {"em1": 2, "em2": 1}
+    assert cache.get_config_revisions() == {"em1": 2, "em2": 1}
+
+
+def test_shard_names_that_sanitize_alike_do_not_collide(sharded):
+    storage.upsert_site_config("new site", [_target("1", "alpha")])
+    storage.upsert_site_config("new_site", [_target("2", "beta")])
+
+    assert _ids("new site") == ["1"]
+    assert _ids("new_site") == ["2"]
+    assert len(list(sharded.glob("*.yaml"))) == 2
+    assert all(path.name.startswith("new_site-") for path in sharded.glob("*.yaml"))
+
+
+def test_saving_over_a_shard_of_another_site_is_refused(sharded):
+    storage.upsert_site_config("em1", [_target("1", "alpha")])
+    _write(storage._site_path("em2"), {"name": "em1", "targets": []})
+
+    with pytest.raises(storage.SiteFileConflictError):
+        storage.upsert_site_config("em2", [_target("2", "beta")])
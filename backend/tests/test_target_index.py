@@ -0,0 +1,36 @@
+from __future__ import annotations
+
+import pytest
+
+from app import cache, target_index
+
+
+@pytest.fixture(autouse=True)
+def _no_indexes(monkeypatch):
+    monkeypatch.setattr(target_index, "_indexes", {})
+
+
+def _refresh(endpoint_name: str, targets: list[dict]) -> None:
+    staging = cache.TargetStaging(endpoint_name)
+    try:
+        staging.add(targets)
+        staging.apply()
+    finally:
+        staging.close()
+
+
+def test_index_is_reused_until_the_version_changes(cache_db):
+    _refresh("em1", [{"id": "1", "name": "DB01", "typeName": "oracle_database"}])
+
+    index = target_index.get_target_index("em1")
+    assert target_index.get_target_index("em1") is index
+    assert index.find("db01", "oracle_database")["id"] == "1"
+    assert index.contains("DB01", "oracle_database")
+    assert not index.contains("db01", "oracle_database")
+
+    _refresh("em1", [{"id": "2", "name": "host01", "typeName": "host"}])
+
+    rebuilt = target_index.get_target_index("em1")
+    assert rebuilt is not index
+    assert [t["id"] for t in rebuilt.of_type("host")] == ["2"]
+    assert rebuilt.find("db01", "oracle_database") is None
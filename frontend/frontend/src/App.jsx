@@ -516,6 +516,7 @@ export default function App() {
                name: siteName,
                site: site?.site ?? null,
                endpoint: site?.endpoint ?? null,
+               revision: site?.revision ?? 0,
             }
                ; (site?.targets || []).forEach((target) => {
                   targets.push({
@@ -546,21 +547,67 @@ export default function App() {
                targets: [],
             })
          }
-         const cleanTarget = {
-            id: target.id,
-            name: target.name,
-            typeName: target.typeName,
-            tags: { ...(target.tags || {}) },
-         }
-         if (target.dg_role) cleanTarget.dg_role = target.dg_role
-         if (target.listener_name) cleanTarget.listener_name = target.listener_name
-         if (target.machine_name) cleanTarget.machine_name = target.machine_name
-         siteMap.get(siteName).targets.push(cleanTarget)
+         siteMap.get(siteName).targets.push(toConfigTarget(target))
       })
 
       return Array.from(siteMap.values())
    }
 
+   const toConfigTarget = (target) => {
+      const cleanTarget = {
+         id: target.id,
+         name: target.name,
+         typeName: target.typeName,
+         tags: { ...(target.tags || {}) },
+      }
+      if (target.dg_role) cleanTarget.dg_role = target.dg_role
+      if (target.listener_name) cleanTarget.listener_name = target.listener_name
+      if (target.machine_name) cleanTarget.machine_name = target.machine_name
+      return cleanTarget
+   }
+
+   // Diff against the last loaded/saved state, grouped by site, as PATCH operations.
+   const buildConfigPatches = () => {
+      const patches = new Map()
+      const opsFor = (siteName) => {
+         if (!patches.has(siteName)) patches.set(siteName, [])
+         return patches.get(siteName)
+      }
+      const currentKeys = new Set(configTargets.map((target) => getTargetKey(target)))
+      const baselineMap = new Map(baselineTargets.map((target) => [getTargetKey(target), target]))
+
+      baselineTargets.forEach((target) => {
+         if (!currentKeys.has(getTargetKey(target))) {
+            opsFor(target._siteName || 'unknown').push({ op: 'remove_target', targetId: target.id })
+         }
+      })
+      configTargets.forEach((target) => {
+         const siteName = target._siteName || 'unknown'
+         const baseline = baselineMap.get(getTargetKey(target))
+         const { tags, ...fields } = toConfigTarget(target)
+         if (!baseline) {
+            opsFor(siteName).push({ op: 'add_target', target: { ...fields, tags } })
+            return
+         }
+         const { tags: baselineTags, ...baselineFields } = toConfigTarget(baseline)
+         if (JSON.stringify(fields) !== JSON.stringify(baselineFields)) {
+            opsFor(siteName).push({ op: 'update_target', targetId: target.id, target: { ...fields, tags } })
+            return
+         }
+         Object.entries(tags).forEach(([key, value]) => {
+            if (baselineTags[key] !== value) {
+               opsFor(siteName).push({ op: 'set_tag', targetId: target.id, key, value })
+            }
+         })
+         Object.keys(baselineTags).forEach((key) => {
+            if (!(key in tags)) {
+               opsFor(siteName).push({ op: 'remove_tag', targetId: target.id, key })
+            }
+         })
+      })
+      return patches
+   }
+
    const fetchJson = async (path, options = {}) => {
       let response
       try {
@@ -1098,9 +1145,17 @@ export default function App() {
       if (!endpointName) return
       setLoading((prev) => ({ ...prev, refresh: true }))
       try {
-         await fetchJson(`/api/targets/refresh?endpointName=${encodeURIComponent(endpointName)}`, {
+         let job = await fetchJson(`/api/targets/refresh?endpointName=${encodeURIComponent(endpointName)}`, {
             method: 'POST',
          })
+         // Long refreshes keep running on the server; poll the job until it finishes.
+         while (job && job.status === 'running') {
+            await new Promise((resolve) => setTimeout(resolve, 2000))
+            job = await fetchJson(`/api/targets/refresh/jobs/${job.id}`)
+         }
+         if (job && job.status === 'error') {
+            throw new Error(job.error || 'Erro ao atualizar targets')
+         }
          await loadCacheInfo(endpointName)
       } catch (error) {
          console.error(error)
@@ -1237,20 +1292,61 @@ export default function App() {
       }
    }
 
+   const cloneTargets = (targets) => targets.map((item) => ({ ...item, tags: { ...(item.tags || {}) } }))
+
    const saveConfig = async () => {
       setLoading((prev) => ({ ...prev, save: true }))
       try {
-         const sites = buildSitesFromConfigTargets(configTargets)
-         await fetchJson('/api/config/targets/all', {
-            method: 'POST',
-            headers: { 'Content-Type': 'application/json' },
-            body: JSON.stringify({ sites }),
-         })
+         const patches = buildConfigPatches()
+         const knownSites = new Set(managers.map((item) => item.name))
+         if (Array.from(patches.keys()).every((siteName) => knownSites.has(siteName))) {
+            // Send only the edits, one PATCH per changed site, guarded by its revision.
+            for (const [siteName, operations] of patches) {
+               const site = await fetchJson('/api/config/targets', {
+                  method: 'PATCH',
+                  headers: { 'Content-Type': 'application/json' },
+                  body: JSON.stringify({
+                     endpointName: siteName,
+                     revision: configSitesMeta[siteName]?.revision,
+                     operations,
+                  }),
+               })
+               setConfigSitesMeta((prev) => ({
+                  ...prev,
+                  [siteName]: { ...(prev[siteName] || { name: siteName }), revision: site.revision },
+               }))
+               // This site is saved: a failure on a later site must not replay its operations.
+               const savedTargets = cloneTargets(configTargets.filter((item) => (item._siteName || 'unknown') === siteName))
+               setBaselineTargets((prev) => [
+                  ...prev.filter((item) => (item._siteName || 'unknown') !== siteName),
+                  ...savedTargets,
+               ])
+            }
+         } else {
+            const sites = buildSitesFromConfigTargets(configTargets)
+            const saved = await fetchJson('/api/config/targets/all', {
+               method: 'POST',
+               headers: { 'Content-Type': 'application/json' },
+               body: JSON.stringify({ sites }),
+            })
+            // The full save bumps every site's revision.
+            setConfigSitesMeta((prev) => {
+               const next = { ...prev }
+               ;(saved || []).forEach((site) => {
+                  next[site.name] = { ...(prev[site.name] || { name: site.name }), revision: site.revision }
+               })
+               return next
+            })
+         }
          setConfigDirty(false)
-         setBaselineTargets(configTargets.map((item) => ({ ...item, tags: { ...(item.tags || {}) } })))
+         setBaselineTargets(cloneTargets(configTargets))
       } catch (error) {
          console.error(error)
          if (isRateLimitError(error)) return
+         if (error.message && error.message.includes('Configuracao alterada')) {
+            alert('Configuracao alterada por outro usuario. Recarregue antes de salvar.')
+            return
+         }
          alert('Erro ao salvar configuracao')
       } finally {
          setLoading((prev) => ({ ...prev, save: false }))